@@ -1,25 +1,49 @@
 from flask import Flask, render_template, request, redirect, url_for, send_file, flash, session, Response, abort
 import uuid
-import sqlite3
 import datetime
-import csv
 import io
 import os
-from werkzeug.utils import secure_filename
 from functools import wraps
 from datetime import datetime
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
 import io
+import db
+from db import get_db
+from image_store import get_image_store
+import thumbnails
+import search as search_index
+import migrations
+import pagination
+import exports
+import stats
+import page_cache
+import cart as cart_store
+import bulk
+import image_refs
+import uploads
+import metrics
+import slow_queries
+import profiler
+import backups
+import restore  # registers the drive_restore job handler
+import jobs
+import click
+from serials import generate_serial_number
 
 app = Flask(__name__)
-app.secret_key = "your_secret_key"
+# Every worker process must use the same key or sessions break between requests
+app.secret_key = os.environ.get("SECRET_KEY", "your_secret_key")
 UPLOAD_FOLDER = os.path.join("static", "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'  # For testing only, allows HTTP (not HTTPS)
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+# Bigger requests are refused while Werkzeug is still reading them (413)
+app.config["MAX_CONTENT_LENGTH"] = int(uploads.MAX_UPLOAD_MB * 1024 * 1024)
+db.init_app(app)
+metrics.init_app(app)
+slow_queries.init_app(app)
+profiler.init_app(app)
 
 def safe_float(value, default=0.0):
     """Safely convert value to float"""
@@ -31,6 +55,14 @@ def safe_float(value, default=0.0):
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.errorhandler(413)
+def upload_too_large(e):
+    message = f"Upload is larger than {uploads.MAX_UPLOAD_MB:g} MB"
+    if request.endpoint == "upload_single_image":
+        return Response(message, status=413)
+    flash(message, "error")
+    return redirect(request.referrer or url_for("admin_panel"))
+
 # --- Authentication helpers ---
 def admin_required(f):
     @wraps(f)
@@ -50,291 +82,43 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# --- Database helper ---
-def get_db():
-    # Get database path from environment variable or use default
-    db_path = os.environ.get('DB_PATH', 'data/laptops.db')
-    # Only create directory if path contains a directory
-    if os.path.dirname(db_path):
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def generate_serial_number(laptop_name):
-    """Generate a serial number based on laptop brand, date, and increment"""
-    from datetime import datetime
-    
-    # Extract brand from laptop name
-    laptop_name_lower = laptop_name.lower()
-    
-    # Brand mapping
-    if 'asus' in laptop_name_lower or 'asuspro' in laptop_name_lower:
-        prefix = 'AS'
-    elif 'dell' in laptop_name_lower:
-        prefix = 'DE'
-    elif 'lenovo' in laptop_name_lower:
-        prefix = 'LE'
-    elif 'thinkpad' in laptop_name_lower:
-        prefix = 'TH'
-    elif 'hp' in laptop_name_lower or 'hewlett' in laptop_name_lower:
-        prefix = 'HP'
-    elif 'acer' in laptop_name_lower:
-        prefix = 'AC'
-    elif 'msi' in laptop_name_lower:
-        prefix = 'MS'
-    elif 'macbook' in laptop_name_lower or 'apple' in laptop_name_lower:
-        prefix = 'AP'
-    elif 'microsoft' in laptop_name_lower or 'surface' in laptop_name_lower:
-        prefix = 'SF'
-    elif 'samsung' in laptop_name_lower:
-        prefix = 'SM'
-    else:
-        prefix = 'GN'  # Generic
-    
-    # Get current date in MMYY format
-    now = datetime.now()
-    date_part = now.strftime("%m%y")  # 0925 for September 2025
-    
-    # Create the date-based prefix
-    date_prefix = f"{prefix}{date_part}"  # DE0925
-    
-    # Get current count for this brand and month/year combination
-    with get_db() as conn:
-        try:
-            count = conn.execute("SELECT COUNT(*) FROM laptops WHERE serial_number LIKE ?", (f"{date_prefix}%",)).fetchone()[0]
-        except:
-            count = 0
-        
-        next_number = count + 1
-        
-        # Format: PREFIX + MMYY + 2-digit number (01-99)
-        serial = f"{date_prefix}{next_number:02d}"
-        
-        # Ensure uniqueness
-        try:
-            while conn.execute("SELECT COUNT(*) FROM laptops WHERE serial_number = ?", (serial,)).fetchone()[0] > 0:
-                next_number += 1
-                if next_number > 99:
-                    # If we exceed 99 laptops in one month, add extra digits
-                    serial = f"{date_prefix}{next_number:03d}"
-                else:
-                    serial = f"{date_prefix}{next_number:02d}"
-        except:
-            pass
-    
-    return serial
+# --- Database schema ---
+# Migrations run once per deploy, before any worker starts: gunicorn's master
+# runs `flask migrate-db` (see gunicorn.conf.py) and the dev server migrates
+# before serving. Workers only read the version, so they never run DDL at the
+# same time; AUTO_MIGRATE=1 lets a single-process run migrate on import.
+AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', '0') == '1'
 
-# --- Create table if not exists ---
-with get_db() as conn:
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS laptops (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        laptop_name TEXT,
-        cpu TEXT,
-        ram TEXT,
-        storage TEXT,
-        os TEXT,
-        notes TEXT,
-        price_bought REAL,
-        price_to_sell REAL,
-        fees REAL,
-        image TEXT,
-        image_data BLOB,
-        image_mimetype TEXT,
-        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        last_edited TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        date_sold TEXT,
-        sold INTEGER DEFAULT 0,
-        serial_number TEXT UNIQUE
-    )
-    """)
-    
-    # Add new columns to existing databases (safe operations)
-    columns_to_add = [
-        ("image_data", "BLOB"),
-        ("image_mimetype", "TEXT"),
-        ("serial_number", "TEXT UNIQUE"),
-        ("warranty_start_date", "TEXT"),
-        ("warranty_duration_days", "INTEGER DEFAULT 0"),
-        ("warranty_notes", "TEXT")
-    ]
-    
-    laptop_ram_columns_to_add = [
-        ("ram_type", "TEXT"),
-        ("ram_speed", "TEXT"),
-        ("storage_type", "TEXT"),
-    ]
-    
-    spareparts_columns_to_add = [
-        ("price", "REAL DEFAULT 0")
-    ]
-    
-    for column_name, column_type in columns_to_add:
-        try:
-            conn.execute(f"ALTER TABLE laptops ADD COLUMN {column_name} {column_type}")
-        except sqlite3.OperationalError:
-            pass
-    
-    for column_name, column_type in spareparts_columns_to_add:
-        try:
-            conn.execute(f"ALTER TABLE laptops ADD COLUMN {column_name} {column_type}")
-        except sqlite3.OperationalError:
-            pass  # Column already exists
-        
-    for column_name, column_type in laptop_ram_columns_to_add:
-        try:
-            conn.execute(f"ALTER TABLE laptops ADD COLUMN {column_name} {column_type}")
-        except sqlite3.OperationalError:
-            pass  # Column already exists
-    
-    # Create other tables
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS spareparts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        part_type TEXT,
-        storage_type TEXT,
-        ram_type TEXT,
-        ram_speed TEXT,
-        capacity TEXT,
-        notes TEXT,
-        quantity INTEGER DEFAULT 1,
-        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        last_edited TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
-    
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS laptop_spareparts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        laptop_id INTEGER,
-        sparepart_id INTEGER,
-        installed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        price_at_time REAL DEFAULT 0,
-        FOREIGN KEY (laptop_id) REFERENCES laptops(id),
-        FOREIGN KEY (sparepart_id) REFERENCES spareparts(id)
-    )
-    """)
-    
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS laptop_images (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        laptop_id INTEGER,
-        image_data BLOB,
-        image_mimetype TEXT,
-        image_name TEXT,
-        is_primary INTEGER DEFAULT 0,
-        uploaded_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (laptop_id) REFERENCES laptops(id)
-    )
-    """)
-    
-    # Create users table for admin/guest authentication
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        role TEXT NOT NULL DEFAULT 'guest',
-        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
-    
-    # Create orders table
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS orders (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        guest_name TEXT,
-        guest_email TEXT,
-        guest_phone TEXT,
-        status TEXT DEFAULT 'unconfirmed',
-        total_amount REAL DEFAULT 0,
-        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        confirmed_date TIMESTAMP,
-        completed_date TIMESTAMP,
-        notes TEXT
-    )
-    """)
-    
-    # Create order_items table
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS order_items (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id INTEGER,
-        laptop_id INTEGER,
-        quantity INTEGER DEFAULT 1,
-        price REAL,
-        FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
-        FOREIGN KEY (laptop_id) REFERENCES laptops(id)
-    )
-    """)
-    
-    # Create cart_spareparts table for guest spare parts selection
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS cart_spareparts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT NOT NULL,
-            laptop_id INTEGER NOT NULL,
-            sparepart_id INTEGER NOT NULL,
-            quantity INTEGER DEFAULT 1,
-            added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (laptop_id) REFERENCES laptops (id),
-            FOREIGN KEY (sparepart_id) REFERENCES spareparts (id)
-        )
-    """)
-    
-    # Create cart table for guest laptop cart
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS cart (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT NOT NULL,
-            laptop_id INTEGER NOT NULL,
-            quantity INTEGER DEFAULT 1,
-            added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (laptop_id) REFERENCES laptops (id)
-        )
-    """)
-    # Add price_at_time column if it doesn't exist
+def init_db():
+    conn = db.pool.connect()
     try:
-        conn.execute("ALTER TABLE laptop_spareparts ADD COLUMN price_at_time REAL DEFAULT 0")
-    except sqlite3.OperationalError:
-        pass
-    
-    conn.commit()
-    # Insert default admin user if not exists
-    admin_exists = conn.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'").fetchone()[0]
-    if admin_exists == 0:
-        conn.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", 
-                    ('admin', 'admin123', 'admin'))
-        print("Default admin user created: admin / admin123")
-    
-    conn.commit()
-
-# Migrate existing laptops (only once)
-def migrate_existing_laptops():
-    """Add serial numbers to existing laptops"""
-    try:
-        with get_db() as conn:
-            # Check if we need to migrate
-            needs_migration = conn.execute("SELECT COUNT(*) FROM laptops WHERE serial_number IS NULL OR serial_number = ''").fetchone()[0]
-            
-            if needs_migration > 0:
-                print(f"Migrating {needs_migration} laptops to use serial numbers...")
-                
-                laptops = conn.execute("SELECT id, laptop_name FROM laptops WHERE serial_number IS NULL OR serial_number = '' ORDER BY id").fetchall()
-                for laptop in laptops:
-                    serial = generate_serial_number(laptop['laptop_name'])
-                    conn.execute("UPDATE laptops SET serial_number = ? WHERE id = ?", (serial, laptop['id']))
-                    print(f"Laptop ID {laptop['id']} -> Serial {serial}")
-                
-                conn.commit()
-                print("Migration completed!")
-    except Exception as e:
-        print(f"Migration error: {e}")
-
-# Run migration
-migrate_existing_laptops()
+        version = migrations.current_version(conn)
+        if version < migrations.LATEST_VERSION:
+            if AUTO_MIGRATE:
+                migrations.migrate(conn)
+            else:
+                print(f"Database schema is at version {version}, expected {migrations.LATEST_VERSION}. Run 'flask migrate-db'.")
+        search_index.detect_search_index(conn)
+    finally:
+        conn.close()
+
+init_db()
+
+def configure_app(config=None):
+    """Apply config overrides to the module's app and return it (used by wsgi.py and the dev server)"""
+    if config:
+        app.config.update(config)
+    return app
+
+# --- Template helpers ---
+@app.template_global()
+def page_url(**changes):
+    """Current page URL with the pagination cursor replaced"""
+    args = request.args.to_dict()
+    args.pop('after', None)
+    args.pop('before', None)
+    args.update({key: value for key, value in changes.items() if value is not None})
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
 
 # --- Authentication routes ---
 @app.route("/login", methods=["GET", "POST"])
@@ -394,50 +178,70 @@ def admin_panel():
         order = 'asc'
 
     conn = get_db()
-    query = f"SELECT * FROM laptops WHERE sold = 0"
     params = []
+    rank = None
+    from_where = "FROM laptops l"
+    if search:
+        join, where, params, rank = search_index.search_filter(search)
+        from_where += f"{join} WHERE l.sold = 0{where}"
+    else:
+        from_where += " WHERE l.sold = 0"
+    # Best matches first unless the user picked a sort column
+    if rank and 'sort' not in request.args:
+        sort_expr, sort_order = rank, 'asc'
+    else:
+        sort_expr, sort_order = f"l.{sort_by}", order
+    laptops, next_cursor, prev_cursor = pagination.keyset_page(
+        conn, "l.*", from_where, params, sort_expr, "l.id", sort_order,
+        after=request.args.get('after'), before=request.args.get('before'),
+        page_size=pagination.page_size_arg(request.args.get('per_page')),
+        nullable=sort_expr not in (rank, "l.id", "l.created_date"))
+
+    # Stats (counters kept current by triggers on laptops)
+    counters = stats.get_stats(conn)
+    sold_count = counters['sold_count']
+    available_count = counters['available_count']
+    total_profit = counters['total_profit']
     if search:
-        query += " AND (laptop_name LIKE ? OR cpu LIKE ? OR ram LIKE ? OR storage LIKE ? OR os LIKE ?)"
-        params = [f"%{search}%"] * 5
-    query += f" ORDER BY {sort_by} {order}"
-    laptops = conn.execute(query, params).fetchall()
-
-    # Stats
-    total_laptops = conn.execute("SELECT COUNT(*) FROM laptops").fetchone()[0]
-    sold_count = conn.execute("SELECT COUNT(*) FROM laptops WHERE sold=1").fetchone()[0]
-    available_count = conn.execute("SELECT COUNT(*) FROM laptops WHERE sold=0").fetchone()[0]
-    total_profit = conn.execute("SELECT SUM(price_to_sell - (price_bought + fees)) FROM laptops WHERE sold=1").fetchone()[0] or 0
-
-    # --- New code to count spare parts and check for images ---
+        total = pagination.cached_aggregate(conn, f"SELECT COUNT(*) AS total {from_where}", params)['total']
+    else:
+        total = available_count
+
+    # Spare part counts and the has-image flag for this page, in one query
     laptop_spare_counts = {}
     laptop_has_images = {}
-    for laptop in laptops:
-        ram_count = conn.execute("""
-            SELECT COUNT(*) FROM laptop_spareparts lsp
-            JOIN spareparts sp ON lsp.sparepart_id = sp.id
-            WHERE lsp.laptop_id=? AND sp.part_type='RAM'
-        """, (laptop['id'],)).fetchone()[0]
-        storage_count = conn.execute("""
-            SELECT COUNT(*) FROM laptop_spareparts lsp
-            JOIN spareparts sp ON lsp.sparepart_id = sp.id
-            WHERE lsp.laptop_id=? AND sp.part_type='Storage'
-        """, (laptop['id'],)).fetchone()[0]
-        laptop_spare_counts[laptop['id']] = {'ram': ram_count, 'storage': storage_count}
-        
-        # Check if laptop has images in the new table
-        has_image = conn.execute("SELECT COUNT(*) FROM laptop_images WHERE laptop_id=?", (laptop['id'],)).fetchone()[0] > 0
-        laptop_has_images[laptop['id']] = has_image or laptop['image_data'] or laptop['image']
+    if laptops:
+        page_ids = [laptop['id'] for laptop in laptops]
+        placeholders = ','.join('?' * len(page_ids))
+        extras = conn.execute(f"""
+            SELECT l.id,
+                   (SELECT COUNT(*) FROM laptop_spareparts lsp JOIN spareparts sp ON lsp.sparepart_id = sp.id
+                    WHERE lsp.laptop_id = l.id AND sp.part_type = 'RAM') AS ram_count,
+                   (SELECT COUNT(*) FROM laptop_spareparts lsp JOIN spareparts sp ON lsp.sparepart_id = sp.id
+                    WHERE lsp.laptop_id = l.id AND sp.part_type = 'Storage') AS storage_count,
+                   (EXISTS (SELECT 1 FROM laptop_images li WHERE li.laptop_id = l.id)
+                    OR l.image_data IS NOT NULL OR COALESCE(l.image, '') != '') AS has_image
+            FROM laptops l WHERE l.id IN ({placeholders})
+        """, page_ids).fetchall()
+        for row in extras:
+            laptop_spare_counts[row['id']] = {'ram': row['ram_count'], 'storage': row['storage_count']}
+            laptop_has_images[row['id']] = bool(row['has_image'])
 
     # Pass laptop_spare_counts and image info to your template
     return render_template("index.html", laptops=laptops, laptop_spare_counts=laptop_spare_counts, 
                        laptop_has_images=laptop_has_images, sold_count=sold_count,
                        available_count=available_count, total_profit=total_profit,
-                       sort_by=sort_by, order=order)
+                       sort_by=sort_by, order=order, total=total,
+                       next_cursor=next_cursor, prev_cursor=prev_cursor)
 # --- Add new laptop page ---
 @app.route("/add", methods=["GET", "POST"])
 @admin_required
 def add():
     if request.method == "POST":
+        # Verify and store the photos first, so the write transaction below stays short
+        files = [file for file in request.files.getlist("images") if file and allowed_file(file.filename)]
+        images, upload_errors = uploads.process_uploads(files)
+        
         conn = get_db()
         
         # Generate serial number based on laptop name
@@ -474,23 +278,19 @@ def add():
         
         laptop_id = cursor.lastrowid
         
-        # Handle image uploads (same as before)
-        if "images" in request.files:
-            files = request.files.getlist("images")
-            for i, file in enumerate(files):
-                if file and allowed_file(file.filename):
-                    image_data = file.read()
-                    image_mimetype = file.mimetype
-                    image_name = secure_filename(file.filename)
-                    is_primary = 1 if i == 0 else 0
-                    
-                    conn.execute("""
-                        INSERT INTO laptop_images (laptop_id, image_data, image_mimetype, image_name, is_primary)
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (laptop_id, image_data, image_mimetype, image_name, is_primary))
+        # First photo becomes the primary one
+        conn.executemany("""
+            INSERT INTO laptop_images (laptop_id, image_hash, image_mimetype, image_name, is_primary)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(laptop_id, image['image_hash'], image['image_mimetype'], image['image_name'], 1 if i == 0 else 0)
+              for i, image in enumerate(images)])
         
         conn.commit()
+        for image in images:
+            thumbnails.submit(image['image_hash'])
         flash("Laptop added successfully!", "success")
+        for error in upload_errors:
+            flash(f"Photo skipped - {error}", "warning")
         return redirect(url_for("admin_panel"))
     return render_template("add.html")
 
@@ -511,21 +311,37 @@ def completed_sales():
         order = 'asc'
 
     conn = get_db()
-    query = "SELECT * FROM laptops WHERE sold = 1"
+    from_where = "FROM laptops l"
     params = []
     if search:
-        query += " AND (laptop_name LIKE ? OR cpu LIKE ? OR ram LIKE ? OR storage LIKE ? OR os LIKE ?)"
-        params = [f"%{search}%"] * 5
-    query += f" ORDER BY {sort_by} {order}"
-    laptops = conn.execute(query, params).fetchall()
-
-    # Calculate total profit
-    total_profit = sum(laptop['price_to_sell'] - (laptop['price_bought'] + laptop['fees']) for laptop in laptops)
-    # Calculate total sale money
-    total_sales = sum(laptop['price_to_sell'] for laptop in laptops)
+        join, where, params, rank = search_index.search_filter(search)
+        from_where += f"{join} WHERE l.sold = 1{where}"
+    else:
+        from_where += " WHERE l.sold = 1"
+    laptops, next_cursor, prev_cursor = pagination.keyset_page(
+        conn, "l.*", from_where, params, f"l.{sort_by}", "l.id", order,
+        after=request.args.get('after'), before=request.args.get('before'),
+        page_size=pagination.page_size_arg(request.args.get('per_page')),
+        nullable=sort_by != 'created_date')
+
+    # Totals cover every matching sale, not just this page
+    if search:
+        totals = pagination.cached_aggregate(conn, f"""
+            SELECT COUNT(*) AS total,
+                   COALESCE(SUM(l.price_to_sell - (l.price_bought + l.fees)), 0) AS total_profit,
+                   COALESCE(SUM(l.price_to_sell), 0) AS total_sales
+            {from_where}
+        """, params)
+    else:
+        counters = stats.get_stats(conn)
+        totals = {'total': counters['sold_count'], 'total_profit': counters['total_profit'],
+                  'total_sales': counters['total_sales']}
+    total_profit = totals['total_profit']
+    total_sales = totals['total_sales']
 
     return render_template("completed.html", laptops=laptops, total_profit=total_profit,
-                           total_sales=total_sales, sort_by=sort_by, order=order, search=search)
+                           total_sales=total_sales, sort_by=sort_by, order=order, search=search,
+                           total=totals['total'], next_cursor=next_cursor, prev_cursor=prev_cursor)
 
 # --- Edit laptop ---
 @app.route("/edit/<int:laptop_id>", methods=["GET", "POST"])
@@ -594,7 +410,7 @@ def edit(laptop_id):
                 flash(f"Error updating laptop: {str(e)}", "error")
     
     # Get images for display
-    images = conn.execute("SELECT * FROM laptop_images WHERE laptop_id=? ORDER BY is_primary DESC, uploaded_date", (laptop_id,)).fetchall()
+    images = conn.execute("SELECT * FROM laptop_images WHERE laptop_id=? ORDER BY is_primary DESC, uploaded_date, id", (laptop_id,)).fetchall()
     return render_template("edit.html", laptop=laptop, images=images)
 
 # --- Delete laptop ---
@@ -610,6 +426,8 @@ def delete(laptop_id):
             # Delete the laptop
             conn.execute("DELETE FROM laptops WHERE id=?", (laptop_id,))
             conn.commit()
+            # Free image files nothing else refers to
+            image_refs.collect_garbage(conn)
     except Exception as e:
         print(f"Error deleting laptop {laptop_id}: {e}")
         flash("Error deleting laptop", "error")
@@ -645,15 +463,27 @@ def mark_available(laptop_id):
 @app.route("/export", methods=["POST"])
 @admin_required
 def export():
-    conn = get_db()
-    laptops = conn.execute("SELECT * FROM laptops").fetchall()
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(laptops[0].keys())  # header
-    for laptop in laptops:
-        writer.writerow([laptop[key] for key in laptop.keys()])
-    output.seek(0)
-    return send_file(io.BytesIO(output.getvalue().encode()), mimetype="text/csv", as_attachment=True, download_name="laptops.csv")
+    table = request.form.get("table", "laptops")
+    start_date = request.form.get("start_date", "").strip()
+    end_date = request.form.get("end_date", "").strip()
+    compress = request.form.get("gzip") == "1"
+    
+    if table not in exports.EXPORT_TABLES:
+        flash(f"Unknown export table '{table}'.", "danger")
+        return redirect(url_for("settings"))
+    for value in (start_date, end_date):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                flash("Dates must be in YYYY-MM-DD format.", "danger")
+                return redirect(url_for("settings"))
+    
+    # Written to a file by a background job; the jobs page links to it when done
+    jobs.enqueue(get_db(), "export", {"table": table, "start_date": start_date or None,
+                                      "end_date": end_date or None, "compress": compress})
+    flash(f"Export of {table} started. Download it here when it is done.", "success")
+    return redirect(url_for("job_status"))
 
 # --- Reset data ---
 @app.route("/reset_data", methods=["POST"])
@@ -662,8 +492,13 @@ def reset_data():
     confirm = request.form.get("reset_confirm", "")
     if confirm.strip().lower() == "reset":
         conn = get_db()
+        # Images and installed parts go in the same transaction, so the image ref counts drop
+        conn.execute("DELETE FROM laptop_images")
+        conn.execute("DELETE FROM laptop_spareparts")
         conn.execute("DELETE FROM laptops")
         conn.commit()
+        # Free image files nothing else refers to
+        image_refs.collect_garbage(conn)
         flash("All data has been reset.", "success")
     else:
         flash("Reset confirmation failed. Type 'reset' to confirm.", "danger")
@@ -687,24 +522,29 @@ def spareparts():
         order = 'asc'
 
     conn = get_db()
-    query = "SELECT * FROM spareparts WHERE 1=1"
+    from_where = "FROM spareparts WHERE 1=1"
     params = []
     if part_type:
-        query += " AND part_type=?"
+        from_where += " AND part_type=?"
         params.append(part_type)
     if storage_type:
-        query += " AND storage_type=?"
+        from_where += " AND storage_type=?"
         params.append(storage_type)
     if ram_type:
-        query += " AND ram_type=?"
+        from_where += " AND ram_type=?"
         params.append(ram_type)
     if ram_speed:
-        query += " AND ram_speed=?"
+        from_where += " AND ram_speed=?"
         params.append(ram_speed)
-    query += f" ORDER BY {sort_by} {order}"
-    parts = conn.execute(query, params).fetchall()
+    parts, next_cursor, prev_cursor = pagination.keyset_page(
+        conn, "*", from_where, params, sort_by, "id", order,
+        after=request.args.get('after'), before=request.args.get('before'),
+        page_size=pagination.page_size_arg(request.args.get('per_page')),
+        nullable=sort_by not in ('id', 'created_date'))
+    total = pagination.cached_aggregate(conn, f"SELECT COUNT(*) AS total {from_where}", params)['total']
 
-    return render_template("spareparts.html", parts=parts, sort_by=sort_by, order=order)
+    return render_template("spareparts.html", parts=parts, sort_by=sort_by, order=order,
+                           total=total, next_cursor=next_cursor, prev_cursor=prev_cursor)
 
 # --- Add new spare part page ---
 @app.route("/add_sparepart", methods=["GET", "POST"])
@@ -803,7 +643,7 @@ def laptop_detail(laptop_id):
     total_upgrades_value = sum(part['price_at_time'] for part in installed_parts)
     original_laptop_price = laptop['price_to_sell'] - total_upgrades_value
     
-    images = conn.execute("SELECT * FROM laptop_images WHERE laptop_id=? ORDER BY is_primary DESC, uploaded_date", (laptop_id,)).fetchall()
+    images = conn.execute("SELECT * FROM laptop_images WHERE laptop_id=? ORDER BY is_primary DESC, uploaded_date, id", (laptop_id,)).fetchall()
     
     return render_template("laptop_detail.html", 
                          laptop=laptop, 
@@ -936,19 +776,77 @@ def remove_sparepart_from_laptop(laptop_id, sparepart_installation_id):
     
     return redirect(url_for("laptop_detail", laptop_id=laptop_id))
 
-# --- Serve images from database ---
+# --- Serve images ---
+# Rows with an image_hash live in the image store; older rows still carry a BLOB.
+# An image id never changes content, so id-addressed URLs are cached forever.
+IMAGE_COLUMNS = "id, image_hash, image_mimetype, uploaded_date"
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def image_etag(image):
+    return image["image_hash"] or f"image-{image['id']}"
+
+def image_response(image, size=None):
+    """Stream an image row (or one of its resized variants) with caching headers"""
+    etag = image_etag(image)
+    key = image["image_hash"]
+    mimetype = image["image_mimetype"]
+    cache_control = IMAGE_CACHE_CONTROL
+    if size and key and thumbnails.enabled():
+        if get_image_store().exists(thumbnails.variant_key(key, size)):
+            key = etag = thumbnails.variant_key(key, size)
+            mimetype = thumbnails.THUMBNAIL_MIMETYPE
+        elif not thumbnails.failed(key):
+            # Variant not generated yet: send the original but let the browser check back
+            thumbnails.submit(key)
+            cache_control = "no-cache"
+        else:
+            # No variant could be made; the failure may be transient, so cache the original
+            # here only until the next retry (its ETag is the original's, never the variant's)
+            cache_control = f"public, max-age={thumbnails.THUMBNAIL_RETRY_SECONDS}"
+    
+    if etag in request.if_none_match:
+        # Answer from the ETag alone, without touching the file or the BLOB
+        rv = Response(status=304)
+        rv.set_etag(etag)
+        rv.headers["Cache-Control"] = cache_control
+        return rv
+    
+    if key:
+        store = get_image_store()
+        path = store.path(key)
+        if path:
+            if not os.path.exists(path):
+                abort(404)
+            rv = send_file(path, mimetype=mimetype, conditional=True, etag=etag)
+        else:
+            rv = send_file(store.open(key), mimetype=mimetype, conditional=True, etag=etag)
+    else:
+        row = get_db().execute("SELECT image_data FROM laptop_images WHERE id=?", (image["id"],)).fetchone()
+        if not row or not row["image_data"]:
+            abort(404)
+        rv = send_file(io.BytesIO(row["image_data"]), mimetype=image["image_mimetype"], conditional=True, etag=etag)
+    
+    try:
+        rv.last_modified = datetime.strptime(image["uploaded_date"], "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        pass
+    rv.headers["Cache-Control"] = cache_control
+    return rv
+
 @app.route("/image/<int:laptop_id>")
 def serve_image(laptop_id):
     conn = get_db()
-    # First try to get primary image from new table
-    image = conn.execute("SELECT image_data, image_mimetype FROM laptop_images WHERE laptop_id=? AND is_primary=1", (laptop_id,)).fetchone()
-    
-    if not image:
-        # Get any image from new table
-        image = conn.execute("SELECT image_data, image_mimetype FROM laptop_images WHERE laptop_id=? ORDER BY uploaded_date LIMIT 1", (laptop_id,)).fetchone()
-    
-    if image and image["image_data"]:
-        return Response(image["image_data"], mimetype=image["image_mimetype"])
+    # Primary image first, otherwise the oldest upload (as in cart.py); redirect to its cacheable URL
+    image = conn.execute("""
+        SELECT id FROM laptop_images WHERE laptop_id=?
+        ORDER BY is_primary DESC, uploaded_date, id LIMIT 1
+    """, (laptop_id,)).fetchone()
+    
+    if image:
+        rv = redirect(url_for("serve_specific_image", laptop_id=laptop_id, image_id=image["id"],
+                              size=thumbnails.pick_size(request.args.get("size"))))
+        rv.headers["Cache-Control"] = "no-cache"
+        return rv
     
     # Fallback to old single image system for backward compatibility
     laptop = conn.execute("SELECT image_data, image_mimetype, image FROM laptops WHERE id=?", (laptop_id,)).fetchone()
@@ -968,32 +866,31 @@ def serve_image(laptop_id):
 @app.route("/image/<int:laptop_id>/<int:image_id>")
 def serve_specific_image(laptop_id, image_id):
     conn = get_db()
-    image = conn.execute("SELECT image_data, image_mimetype FROM laptop_images WHERE id=? AND laptop_id=?", (image_id, laptop_id)).fetchone()
-    
-    if image and image["image_data"]:
-        return Response(image["image_data"], mimetype=image["image_mimetype"])
+    image = conn.execute(f"SELECT {IMAGE_COLUMNS} FROM laptop_images WHERE id=? AND laptop_id=?", (image_id, laptop_id)).fetchone()
     
-    abort(404)
+    if not image:
+        abort(404)
+    return image_response(image, thumbnails.pick_size(request.args.get("size")))
 
 # --- Upload single image ---
 @app.route("/upload_single_image/<int:laptop_id>", methods=["POST"])
 @admin_required
 def upload_single_image(laptop_id):
-    conn = get_db()
-    
-    if "image" in request.files:
-        file = request.files["image"]
-        if file and file.filename and allowed_file(file.filename):
-            image_data = file.read()
-            image_mimetype = file.mimetype
-            image_name = secure_filename(file.filename)
-            
-            conn.execute("""
-                INSERT INTO laptop_images (laptop_id, image_data, image_mimetype, image_name, is_primary)
-                VALUES (?, ?, ?, ?, ?)
-            """, (laptop_id, image_data, image_mimetype, image_name, 0))
-            conn.commit()
-            return Response("Success", status=200)
+    file = request.files.get("image")
+    if file and file.filename and allowed_file(file.filename):
+        images, upload_errors = uploads.process_uploads([file])
+        if upload_errors:
+            return Response(upload_errors[0], status=400)
+        image = images[0]
+        
+        conn = get_db()
+        conn.execute("""
+            INSERT INTO laptop_images (laptop_id, image_hash, image_mimetype, image_name, is_primary)
+            VALUES (?, ?, ?, ?, ?)
+        """, (laptop_id, image['image_hash'], image['image_mimetype'], image['image_name'], 0))
+        conn.commit()
+        thumbnails.submit(image['image_hash'])
+        return Response("Success", status=200)
     
     return Response("Failed", status=400)
 
@@ -1021,6 +918,7 @@ def delete_image(laptop_id, image_id):
                     conn.execute("UPDATE laptop_images SET is_primary=1 WHERE id=?", (next_image["id"],))
             
             conn.commit()
+            image_refs.collect_garbage(conn)
             return Response("Success", status=200)
         else:
             return Response("Image not found", status=404)
@@ -1058,17 +956,10 @@ def bulk_delete():
             return Response("No laptop IDs provided", status=400)
         
         with get_db() as conn:
-            # Delete all images for these laptops first
-            for laptop_id in laptop_ids:
-                conn.execute("DELETE FROM laptop_images WHERE laptop_id = ?", (laptop_id,))
-            
-            # Delete laptop_spareparts relationships
-            placeholders = ','.join(['?' for _ in laptop_ids])
-            conn.execute(f"DELETE FROM laptop_spareparts WHERE laptop_id IN ({placeholders})", laptop_ids)
-            
-            # Delete the laptops
-            conn.execute(f"DELETE FROM laptops WHERE id IN ({placeholders})", laptop_ids)
-            conn.commit()
+            reports = bulk.delete_laptops(conn, laptop_ids)
+            freed_images, freed_bytes = image_refs.collect_garbage(conn)
+        bulk.log_reports("Bulk delete", reports)
+        print(f"Freed {freed_images} image files ({freed_bytes / 1024 / 1024:.1f} MB)")
         
         return Response("Laptops deleted successfully", status=200)
     except Exception as e:
@@ -1086,57 +977,8 @@ def bulk_duplicate():
         if not laptop_ids:
             return Response("No laptop IDs provided", status=400)
         
-        with get_db() as conn:
-            cursor = conn.cursor()
-            for laptop_id in laptop_ids:
-                # Get the original laptop data
-                laptop = cursor.execute("SELECT * FROM laptops WHERE id = ?", (laptop_id,)).fetchone()
-                if laptop:
-                    # Generate new serial number for the copy
-                    copy_name = f"{laptop['laptop_name']} (Copy)"
-                    new_serial = generate_serial_number(copy_name)
-                    
-                    # Insert duplicated laptop with new serial number
-                    cursor.execute("""
-                        INSERT INTO laptops (laptop_name, cpu, ram, storage, os, notes, 
-                                           price_bought, price_to_sell, fees, sold, serial_number)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        copy_name,
-                        laptop['cpu'], 
-                        laptop['ram'], 
-                        laptop['storage'], 
-                        laptop['os'],
-                        laptop['notes'], 
-                        laptop['price_bought'], 
-                        laptop['price_to_sell'],
-                        laptop['fees'], 
-                        0,  # sold=0
-                        new_serial
-                    ))
-                    
-                    new_laptop_id = cursor.lastrowid
-                    
-                    # Copy images and spare parts (same as before)
-                    images = cursor.execute("SELECT * FROM laptop_images WHERE laptop_id = ?", (laptop_id,)).fetchall()
-                    for image in images:
-                        cursor.execute("""
-                            INSERT INTO laptop_images (laptop_id, image_data, image_mimetype, 
-                                                     image_name, is_primary)
-                            VALUES (?, ?, ?, ?, ?)
-                        """, (
-                            new_laptop_id, image['image_data'], image['image_mimetype'],
-                            image['image_name'], image['is_primary']
-                        ))
-                    
-                    spare_parts = cursor.execute("SELECT sparepart_id FROM laptop_spareparts WHERE laptop_id = ?", (laptop_id,)).fetchall()
-                    for spare_part in spare_parts:
-                        cursor.execute("INSERT INTO laptop_spareparts (laptop_id, sparepart_id) VALUES (?, ?)", 
-                                     (new_laptop_id, spare_part['sparepart_id']))
-            
-            conn.commit()
-        
-        return Response("Laptops duplicated successfully", status=200)
+        job_id = jobs.enqueue(get_db(), "bulk_duplicate", {"laptop_ids": laptop_ids})
+        return {"job_id": job_id, "status_url": url_for("job_json", job_id=job_id)}, 202
     except Exception as e:
         print(f"Error in bulk duplicate: {e}")
         import traceback
@@ -1289,78 +1131,108 @@ def edit_warranty(laptop_id):
 @app.route("/shop")
 def guest_shop():
     search = request.args.get('search', '')
+    after = request.args.get('after')
+    before = request.args.get('before')
+    page_size = pagination.page_size_arg(request.args.get('per_page'))
     conn = get_db()
     
-    if search:
-        laptops = conn.execute("""
-            SELECT l.*, 
-                   (SELECT li.id FROM laptop_images li WHERE li.laptop_id = l.id AND li.is_primary = 1 LIMIT 1) as primary_image_id
-            FROM laptops l
-            WHERE l.sold = 0 
-            AND (l.laptop_name LIKE ? OR l.cpu LIKE ? OR l.ram LIKE ? OR l.storage LIKE ? OR l.os LIKE ?)
-            ORDER BY l.created_date DESC
-        """, (f'%{search}%', f'%{search}%', f'%{search}%', f'%{search}%', f'%{search}%')).fetchall()
-    else:
-        laptops = conn.execute("""
-            SELECT l.*, 
-                   (SELECT li.id FROM laptop_images li WHERE li.laptop_id = l.id AND li.is_primary = 1 LIMIT 1) as primary_image_id
-            FROM laptops l
-            WHERE l.sold = 0 
-            ORDER BY l.created_date DESC
-        """).fetchall()
-    
-    return render_template("guest_shop.html", laptops=laptops, search=search)
+    def build():
+        params = []
+        from_where = "FROM laptops l"
+        if search:
+            join, where, params, rank = search_index.search_filter(search)
+            from_where += f"{join} WHERE l.sold = 0{where}"
+        else:
+            rank = None
+            from_where += " WHERE l.sold = 0"
+        # Best matches first when searching, otherwise newest first
+        sort_expr, sort_order = (rank, 'asc') if rank else ("l.created_date", 'desc')
+        laptops, next_cursor, prev_cursor = pagination.keyset_page(
+            conn, """l.*, 
+                   (SELECT li.id FROM laptop_images li WHERE li.laptop_id = l.id
+                    ORDER BY li.is_primary DESC, li.uploaded_date, li.id LIMIT 1) as primary_image_id""",
+            from_where, params, sort_expr, "l.id", sort_order,
+            after=after, before=before, page_size=page_size, nullable=False)
+        total = conn.execute(f"SELECT COUNT(*) {from_where}", params).fetchone()[0]
+        return dict(laptops=page_cache.plain(laptops), total=total,
+                    next_cursor=next_cursor, prev_cursor=prev_cursor)
+    
+    # The listing is the same for every visitor until the inventory changes
+    page = page_cache.cache.get_or_build(("shop", search, after, before, page_size),
+                                         page_cache.inventory_version(conn), build)
+    return render_template("guest_shop.html", search=search, **page)
 
 # new guest spareparts function (v1.22b)
 @app.route("/guest/laptop/<int:laptop_id>")
 def guest_laptop_detail(laptop_id):
     conn = get_db()
-    laptop = conn.execute("SELECT * FROM laptops WHERE id=? AND sold=0", (laptop_id,)).fetchone()
-    if not laptop:
-        abort(404)
-    
-    # Get compatible spare parts
-    storage_parts = conn.execute("""
-        SELECT * FROM spareparts 
-        WHERE part_type='Storage' AND quantity > 0 
-        ORDER BY price ASC
-    """).fetchall()
     
-    ram_parts = conn.execute("""
-        SELECT * FROM spareparts 
-        WHERE part_type='RAM' AND quantity > 0 
-        ORDER BY price ASC
-    """).fetchall()
+    def build():
+        laptop = conn.execute("SELECT * FROM laptops WHERE id=? AND sold=0", (laptop_id,)).fetchone()
+        if not laptop:
+            return None
+        
+        # Get compatible spare parts
+        storage_parts = conn.execute("""
+            SELECT * FROM spareparts 
+            WHERE part_type='Storage' AND quantity > 0 
+            ORDER BY price ASC
+        """).fetchall()
+        
+        ram_parts = conn.execute("""
+            SELECT * FROM spareparts 
+            WHERE part_type='RAM' AND quantity > 0 
+            ORDER BY price ASC
+        """).fetchall()
+        
+        images = conn.execute("""
+            SELECT id, laptop_id, image_hash, image_mimetype, image_name, is_primary, uploaded_date
+            FROM laptop_images WHERE laptop_id=? ORDER BY is_primary DESC, uploaded_date, id
+        """, (laptop_id,)).fetchall()
+        return dict(laptop=page_cache.plain(laptop), storage_parts=page_cache.plain(storage_parts),
+                    ram_parts=page_cache.plain(ram_parts), images=page_cache.plain(images))
+    
+    # Shared part of the page; the visitor's selected parts are looked up below
+    page = page_cache.cache.get_or_build(("guest_laptop", laptop_id),
+                                         page_cache.inventory_version(conn), build)
+    if page is None:
+        abort(404)
+    laptop = page['laptop']
     
     # Get already selected spare parts for this laptop in guest session
-    session_id = session.get('session_id', str(uuid.uuid4()))
-    session['session_id'] = session_id
-    
-    selected_parts = conn.execute("""
-        SELECT cs.*, sp.part_type, sp.capacity, sp.price, sp.storage_type, sp.ram_type, sp.ram_speed
-        FROM cart_spareparts cs
-        JOIN spareparts sp ON cs.sparepart_id = sp.id
-        WHERE cs.session_id = ? AND cs.laptop_id = ?
-    """, (session_id, laptop_id)).fetchall()
-    
-    images = conn.execute("""
-        SELECT * FROM laptop_images WHERE laptop_id=? ORDER BY is_primary DESC, uploaded_date
-    """, (laptop_id,)).fetchall()
+    session_id = cart_session_id()
     
-    # Calculate pricing
-    original_price = laptop['price_to_sell']
-    upgrades_value = sum(part['price'] * part['quantity'] for part in selected_parts)
-    total_price = original_price + upgrades_value
+    pricing = cart_store.valuation(conn, session_id, [laptop_id])['pricing'].get(laptop_id)
+    if pricing is None:
+        abort(404)
     
     return render_template("guest_laptop_detail.html", 
                          laptop=laptop, 
-                         storage_parts=storage_parts,
-                         ram_parts=ram_parts,
-                         selected_parts=selected_parts,
-                         images=images,
-                         original_price=original_price,
-                         upgrades_value=upgrades_value,
-                         total_price=total_price)
+                         storage_parts=page['storage_parts'],
+                         ram_parts=page['ram_parts'],
+                         selected_parts=pricing['parts'],
+                         images=page['images'],
+                         original_price=pricing['base_price'],
+                         upgrades_value=pricing['upgrades_value'],
+                         total_price=pricing['total_price'])
+
+def cart_session_id():
+    """This visitor's cart key, created on first use"""
+    if not session.get('session_id'):
+        session['session_id'] = str(uuid.uuid4())
+    # Carts from older versions lived in the cookie; move them into the store
+    legacy_cart = session.pop('cart', None)
+    if legacy_cart:
+        conn = get_db()
+        for laptop_id in legacy_cart:
+            cart_store.add_laptop(conn, session['session_id'], laptop_id)
+        conn.commit()
+        refresh_cart_count(conn)
+    return session['session_id']
+
+def refresh_cart_count(conn):
+    """Item count shown on the cart badge"""
+    session['cart_count'] = cart_store.count(conn, session['session_id'])
 
 @app.route("/add_sparepart_to_cart", methods=["POST"])
 def add_sparepart_to_cart():
@@ -1368,9 +1240,7 @@ def add_sparepart_to_cart():
     sparepart_id = request.form.get("sparepart_id")
     quantity = int(request.form.get("quantity", 1))
     
-    if not session.get('session_id'):
-        session['session_id'] = str(uuid.uuid4())
-    
+    session_id = cart_session_id()
     conn = get_db()
     
     # Check if spare part is available
@@ -1383,7 +1253,7 @@ def add_sparepart_to_cart():
     existing = conn.execute("""
         SELECT * FROM cart_spareparts 
         WHERE session_id=? AND laptop_id=? AND sparepart_id=?
-    """, (session['session_id'], laptop_id, sparepart_id)).fetchone()
+    """, (session_id, laptop_id, sparepart_id)).fetchone()
     
     if existing:
         # Update quantity
@@ -1395,14 +1265,15 @@ def add_sparepart_to_cart():
         conn.execute("""
             UPDATE cart_spareparts SET quantity = ?
             WHERE session_id=? AND laptop_id=? AND sparepart_id=?
-        """, (new_quantity, session['session_id'], laptop_id, sparepart_id))
+        """, (new_quantity, session_id, laptop_id, sparepart_id))
     else:
         # Add new
         conn.execute("""
             INSERT INTO cart_spareparts (session_id, laptop_id, sparepart_id, quantity)
             VALUES (?, ?, ?, ?)
-        """, (session['session_id'], laptop_id, sparepart_id, quantity))
+        """, (session_id, laptop_id, sparepart_id, quantity))
     
+    cart_store.touch(conn, session_id)
     conn.commit()
     flash(f"Added {spare_part['part_type']} upgrade to your laptop configuration!", "success")
     return redirect(url_for("guest_laptop_detail", laptop_id=laptop_id))
@@ -1420,6 +1291,7 @@ def remove_sparepart_from_cart(cart_sparepart_id):
     
     if cart_item:
         conn.execute("DELETE FROM cart_spareparts WHERE id=?", (cart_sparepart_id,))
+        cart_store.touch(conn, session['session_id'])
         conn.commit()
         flash("Spare part removed from configuration", "info")
         return redirect(url_for("guest_laptop_detail", laptop_id=cart_item['laptop_id']))
@@ -1429,10 +1301,7 @@ def remove_sparepart_from_cart(cart_sparepart_id):
 @app.route("/add_to_cart/<int:laptop_id>")
 def add_to_cart(laptop_id):
     # No login required - anyone can add to cart (just like a McDonald's kiosk)
-    
-    # Initialize cart if not exists
-    if 'cart' not in session:
-        session['cart'] = []
+    session_id = cart_session_id()
     
     # Check if laptop exists and is available
     with get_db() as conn:
@@ -1440,13 +1309,17 @@ def add_to_cart(laptop_id):
         if not laptop:
             flash('Laptop not available.', 'error')
             return redirect(url_for('guest_shop'))
-    
-    # Check if already in cart
-    if laptop_id not in session['cart']:
-        session['cart'].append(laptop_id)
-        flash(f'{laptop["laptop_name"]} added to cart!', 'success')
-    else:
-        flash('This laptop is already in your cart.', 'warning')
+        
+        # Check if already in cart
+        if cart_store.add_laptop(conn, session_id, laptop_id):
+            flash(f'{laptop["laptop_name"]} added to cart!', 'success')
+        else:
+            flash('This laptop is already in your cart.', 'warning')
+        conn.commit()
+        refresh_cart_count(conn)
+        
+        # Expire abandoned carts now and then (one bounded batch)
+        cart_store.maybe_sweep(conn)
     
     return redirect(url_for('guest_shop'))
 
@@ -1454,110 +1327,40 @@ def add_to_cart(laptop_id):
 def remove_from_cart(laptop_id):
     # No login required
     
-    if 'cart' in session and laptop_id in session['cart']:
-        session['cart'].remove(laptop_id)
-        flash('Item removed from cart.', 'info')
+    session_id = cart_session_id()
+    conn = get_db()
+    cart_store.remove_laptop(conn, session_id, laptop_id)
+    conn.commit()
+    refresh_cart_count(conn)
+    flash('Item removed from cart.', 'info')
     
     return redirect(url_for('view_cart'))
 
 @app.route("/cart")
 def view_cart():
-    if not session.get('session_id'):
-        return render_template("cart.html", cart_items=[], cart_spareparts={}, total=0)
-    
-    conn = get_db()
+    session_id = cart_session_id()
     
-    # Get cart items (laptops)
-    cart_items = conn.execute("""
-        SELECT c.*, l.laptop_name, l.price_to_sell, l.image_data 
-        FROM cart c 
-        JOIN laptops l ON c.laptop_id = l.id 
-        WHERE c.session_id = ?
-    """, (session['session_id'],)).fetchall()
-    
-    # Get spare parts for each laptop in cart with pricing
-    cart_spareparts = {}
-    total_amount = 0
-    
-    for item in cart_items:
-        # Original laptop price
-        base_price = item['price_to_sell']
-        
-        # Get spare parts for this laptop
-        spareparts = conn.execute("""
-            SELECT cs.*, sp.part_type, sp.capacity, sp.price, sp.storage_type, sp.ram_type, sp.ram_speed
-            FROM cart_spareparts cs
-            JOIN spareparts sp ON cs.sparepart_id = sp.id
-            WHERE cs.session_id = ? AND cs.laptop_id = ?
-        """, (session['session_id'], item['laptop_id'])).fetchall()
-        
-        # Calculate upgrades value for this laptop
-        upgrades_value = sum(part['price'] * part['quantity'] for part in spareparts)
-        
-        cart_spareparts[item['laptop_id']] = {
-            'parts': spareparts,
-            'base_price': base_price,
-            'upgrades_value': upgrades_value,
-            'total_price': base_price + upgrades_value
-        }
-        
-        total_amount += base_price + upgrades_value
+    # Laptops, upgrades and totals in one query
+    valuation = cart_store.valuation(get_db(), session_id)
     
     return render_template("cart.html", 
-                         cart_items=cart_items, 
-                         cart_spareparts=cart_spareparts, 
-                         total_amount=total_amount)
+                         cart_items=valuation['items'], 
+                         cart_spareparts=valuation['pricing'], 
+                         total_amount=valuation['total'])
     
 @app.route("/checkout", methods=["GET", "POST"])
 def checkout():
     # No login required - collect guest info at checkout
-    
-    if 'cart' not in session or not session['cart']:
-        flash('Your cart is empty.', 'error')
-        return redirect(url_for('guest_shop'))  # Redirect to guest shop
+    session_id = cart_session_id()
     
     if request.method == "GET":
         # Show checkout form with guest information fields
-        cart_items = []
-        total_amount = 0
-        
-        with get_db() as conn:
-            placeholders = ','.join(['?'] * len(session['cart']))
-            cart_laptops = conn.execute(
-                f"SELECT * FROM laptops WHERE id IN ({placeholders}) AND sold = 0", 
-                session['cart']
-            ).fetchall()
-            
-            # Convert to list of dictionaries and add image data
-            for laptop in cart_laptops:
-                laptop_dict = dict(laptop)
-                
-                # Get primary image from laptop_images table
-                primary_image = conn.execute("""
-                    SELECT image_data FROM laptop_images 
-                    WHERE laptop_id = ? AND is_primary = 1 
-                    ORDER BY uploaded_date DESC LIMIT 1
-                """, (laptop['id'],)).fetchone()
-                
-                # If no primary image, get any image
-                if not primary_image:
-                    primary_image = conn.execute("""
-                        SELECT image_data FROM laptop_images 
-                        WHERE laptop_id = ? 
-                        ORDER BY uploaded_date DESC LIMIT 1
-                    """, (laptop['id'],)).fetchone()
-                
-                # Add image data to laptop dict
-                if primary_image:
-                    import base64
-                    laptop_dict['image_data'] = base64.b64encode(primary_image['image_data']).decode('utf-8')
-                else:
-                    laptop_dict['image_data'] = None
-                    
-                cart_items.append(laptop_dict)
-                total_amount += laptop['price_to_sell']
-        
-        return render_template('checkout.html', cart_items=cart_items, total_amount=total_amount)
+        valuation = cart_store.valuation(get_db(), session_id)
+        if not valuation['items']:
+            flash('Your cart is empty.', 'error')
+            return redirect(url_for('guest_shop'))  # Redirect to guest shop
+        return render_template('checkout.html', cart_items=valuation['items'],
+                               cart_spareparts=valuation['pricing'], total_amount=valuation['total'])
     
     # POST request - process the order
     guest_name = request.form.get('guest_name')
@@ -1570,19 +1373,18 @@ def checkout():
         return redirect(url_for('checkout'))
     
     with get_db() as conn:
-        # Verify all items are still available
-        placeholders = ','.join(['?'] * len(session['cart']))
-        available_laptops = conn.execute(
-            f"SELECT * FROM laptops WHERE id IN ({placeholders}) AND sold = 0", 
-            session['cart']
-        ).fetchall()
+        # Price the cart fresh (not memoized) and verify all items are still available
+        valuation = cart_store.value_laptops(conn, session_id)
         
-        if len(available_laptops) != len(session['cart']):
+        if not valuation['items']:
+            flash('Your cart is empty.', 'error')
+            return redirect(url_for('guest_shop'))
+        if valuation['missing']:
             flash('Some items in your cart are no longer available.', 'error')
             return redirect(url_for('view_cart'))
         
-        # Calculate total
-        total_amount = sum(laptop['price_to_sell'] for laptop in available_laptops)
+        # Calculate total, including configured upgrades
+        total_amount = valuation['total']
         
         # Create order
         cursor = conn.execute("""
@@ -1592,17 +1394,17 @@ def checkout():
         
         order_id = cursor.lastrowid
         
-        # Add order items
-        for laptop in available_laptops:
-            conn.execute("""
-                INSERT INTO order_items (order_id, laptop_id, quantity, price)
-                VALUES (?, ?, 1, ?)
-            """, (order_id, laptop['id'], laptop['price_to_sell']))
+        # Add order items (each priced with its upgrades)
+        conn.executemany("""
+            INSERT INTO order_items (order_id, laptop_id, quantity, price)
+            VALUES (?, ?, 1, ?)
+        """, [(order_id, item['laptop_id'], valuation['pricing'][item['laptop_id']]['total_price'])
+              for item in valuation['items']])
         
+        # Clear cart
+        cart_store.clear(conn, session_id)
         conn.commit()
-    
-    # Clear cart
-    session['cart'] = []
+    session['cart_count'] = 0
     
     flash('Your order has been submitted! Order ID: #' + str(order_id), 'success')
     return redirect(url_for('guest_orders'))
@@ -1775,11 +1577,81 @@ def delete_order(order_id):
     flash('Order deleted and items returned to inventory.', 'success')
     return redirect(url_for('admin_orders'))
 
+@app.route("/admin/db_stats")
+@admin_required
+def db_stats():
+    return db.pool.stats()
+
+@app.route("/admin/cache_stats")
+@admin_required
+def cache_stats():
+    return page_cache.cache.stats()
+
+@app.route("/admin/metrics")
+def metrics_page():
+    # Admins, or a Prometheus scraper sending METRICS_TOKEN as a bearer token
+    if not metrics.token_ok(request.headers.get("Authorization")):
+        if not session.get('logged_in') or session.get('role') != 'admin':
+            abort(403)
+    return Response(metrics.metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/admin/slow_queries")
+@admin_required
+def slow_query_log():
+    return render_template("slow_queries.html", entries=slow_queries.log.top(),
+                           threshold_ms=slow_queries.SLOW_QUERY_MS, worker=os.getpid())
+
+@app.route("/admin/slow_queries/reset", methods=["POST"])
+@admin_required
+def reset_slow_query_log():
+    slow_queries.log.reset()
+    return redirect(url_for("slow_query_log"))
+
+@app.route("/admin/profiler")
+@admin_required
+def request_profiler():
+    conn = get_db()
+    routes = sorted({rule.rule for rule in app.url_map.iter_rules() if rule.endpoint != "static"})
+    return render_template("profiler.html", routes=routes, targets=profiler.targets(conn),
+                           profiles=profiler.recent(conn))
+
+@app.route("/admin/profiler/arm", methods=["POST"])
+@admin_required
+def arm_profiler():
+    route = request.form.get("route", "")
+    if route not in {rule.rule for rule in app.url_map.iter_rules()}:
+        flash("Unknown route.", "error")
+        return redirect(url_for("request_profiler"))
+    sample_percent = safe_float(request.form.get("sample_percent"), 100)
+    count = max(1, int(safe_float(request.form.get("count"), 1)))
+    minutes = max(1, int(safe_float(request.form.get("minutes"), 10)))
+    profiler.arm(get_db(), route, sample_percent / 100, count, minutes)
+    flash(f"Profiling {count} request(s) to {route}.", "success")
+    return redirect(url_for("request_profiler"))
+
+@app.route("/admin/profiler/disarm", methods=["POST"])
+@admin_required
+def disarm_profiler():
+    profiler.disarm(get_db(), request.form.get("route", ""))
+    return redirect(url_for("request_profiler"))
+
+@app.route("/admin/profiler/<int:profile_id>.<kind>")
+@admin_required
+def download_profile(profile_id, kind):
+    if kind not in ("prof", "collapsed"):
+        abort(404)
+    path = profiler.profile_path(profile_id, kind)
+    if not os.path.exists(path):
+        abort(404)
+    return send_file(path, mimetype="application/octet-stream" if kind == "prof" else "text/plain",
+                     as_attachment=True, download_name=os.path.basename(path))
+
 @app.route("/settings")
 @admin_required
 def settings():
     creds_missing = not os.path.exists(GOOGLE_CLIENT_SECRETS)
-    return render_template("settings.html", creds_missing=creds_missing)
+    return render_template("settings.html", creds_missing=creds_missing, backup_runs=backups.recent(get_db()),
+                           backup_name=backups.BACKUP_NAME, keep_revisions=backups.BACKUP_KEEP_REVISIONS)
 
 # --- Google Drive Integration ---
 
@@ -1826,48 +1698,229 @@ def google_drive_callback():
     flash("Google Drive connected!", "success")
     return redirect(url_for("settings"))
 
+def get_drive_client():
+    """Drive client for the connected account, or None; app.config["DRIVE_CLIENT"] swaps in a fake"""
+    if app.config.get("DRIVE_CLIENT"):
+        return app.config["DRIVE_CLIENT"]()
+    creds = get_google_credentials()
+    return backups.GoogleDriveClient(creds) if creds else None
+
 @app.route("/google_drive_upload")
+@admin_required
 def google_drive_upload():
-    creds = get_google_credentials()
-    if not creds:
+    client = get_drive_client()
+    if not client:
         flash("Please connect your Google Drive first.", "danger")
         return redirect(url_for("settings"))
-    db_path = os.environ.get('DB_PATH', 'data/laptops.db')
-    if not os.path.exists(db_path):
-        flash(f"Database file not found at {db_path}.", "danger")
+    try:
+        jobs.enqueue(get_db(), "drive_backup", client=client)
+    except jobs.JobError as e:
+        flash(str(e), "warning")
         return redirect(url_for("settings"))
-    service = build("drive", "v3", credentials=creds)
-    file_metadata = {"name": "laptops.db"}
-    media = MediaFileUpload(db_path, mimetype="application/x-sqlite3")
-    file = service.files().create(body=file_metadata, media_body=media, fields="id").execute()
-    flash("Database uploaded to Google Drive!", "success")
+    flash("Backup started. It runs in the background; progress is shown below.", "success")
     return redirect(url_for("settings"))
 
+@app.route("/google_drive_backups")
+@admin_required
+def google_drive_backups():
+    return {"backups": backups.recent(get_db())}
+
 @app.route("/google_drive_download")
+@admin_required
 def google_drive_download():
-    creds = get_google_credentials()
-    if not creds:
+    client = get_drive_client()
+    if not client:
         flash("Please connect your Google Drive first.", "danger")
         return redirect(url_for("settings"))
-    db_path = os.environ.get('DB_PATH', 'data/laptops.db')
-    service = build("drive", "v3", credentials=creds)
-    # Find the file named 'laptops.db'
-    results = service.files().list(q="name='laptops.db'", fields="files(id, name)").execute()
-    items = results.get("files", [])
-    if not items:
-        flash("No laptops.db found in your Google Drive.", "danger")
+    try:
+        jobs.enqueue(get_db(), "drive_restore", client=client)
+    except jobs.JobError as e:
+        flash(str(e), "warning")
         return redirect(url_for("settings"))
-    file_id = items[0]["id"]
-    request_drive = service.files().get_media(fileId=file_id)
-    # Ensure the data directory exists
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    fh = io.FileIO(db_path, "wb")
-    downloader = MediaIoBaseDownload(fh, request_drive)
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
-    flash("Database downloaded from Google Drive!", "success")
-    return redirect(url_for("settings"))
+    flash("Restore started. The shop keeps running on the current database until the backup "
+          "has been downloaded and checked; if that fails, nothing is changed.", "success")
+    return redirect(url_for("job_status"))
+
+# --- Background jobs ---
+def job_resources(kind):
+    """In-memory arguments a job needs on retry (never stored with the job)"""
+    if kind in ("drive_backup", "drive_restore"):
+        client = get_drive_client()
+        if not client:
+            raise jobs.JobError("Please connect your Google Drive first.")
+        return {"client": client}
+    return {}
+
+@app.route("/admin/jobs")
+@admin_required
+def job_status():
+    return render_template("jobs.html", jobs=jobs.recent(get_db()), stale_minutes=jobs.JOB_STALE_MINUTES)
+
+@app.route("/admin/jobs/<int:job_id>.json")
+@admin_required
+def job_json(job_id):
+    job = jobs.get(get_db(), job_id)
+    if job is None:
+        abort(404)
+    return job
+
+@app.route("/admin/jobs/<int:job_id>/cancel", methods=["POST"])
+@admin_required
+def cancel_job(job_id):
+    jobs.cancel(get_db(), job_id)
+    flash(f"Job #{job_id} will stop at its next checkpoint.", "success")
+    return redirect(url_for("job_status"))
+
+@app.route("/admin/jobs/<int:job_id>/retry", methods=["POST"])
+@admin_required
+def retry_job(job_id):
+    conn = get_db()
+    job = jobs.get(conn, job_id)
+    if job is None:
+        abort(404)
+    try:
+        jobs.retry(conn, job_id, **job_resources(job["kind"]))
+    except jobs.JobError as e:
+        flash(str(e), "danger")
+    else:
+        flash(f"Job #{job_id} queued again.", "success")
+    return redirect(url_for("job_status"))
+
+@app.route("/admin/jobs/<int:job_id>/download")
+@admin_required
+def download_job_file(job_id):
+    job = jobs.get(get_db(), job_id)
+    filename = (job or {}).get("result") and job["result"].get("file")
+    if not filename or not os.path.exists(jobs.output_path(job_id, filename)):
+        abort(404)
+    return send_file(jobs.output_path(job_id, filename), as_attachment=True, download_name=filename)
+
+# --- Schema migrations ---
+@app.cli.command("migrate-db")
+@click.option("--status", is_flag=True, help="Only show the current and latest schema version.")
+def migrate_db_command(status):
+    """Apply pending schema migrations"""
+    conn = get_db()
+    version = migrations.current_version(conn)
+    if status:
+        print(f"Schema version {version} (latest {migrations.LATEST_VERSION})")
+        for number, name, _ in migrations.MIGRATIONS:
+            print(f"  {'applied' if number <= version else 'pending'}  {number:>3}  {name}")
+        return
+    applied = migrations.migrate(conn)
+    print(f"Applied migrations: {applied}" if applied else f"Schema is up to date (version {version})")
+
+# --- Dashboard counter check ---
+@app.cli.command("verify-stats")
+@click.option("--fix", is_flag=True, help="Rewrite the counters from a full recount.")
+def verify_stats_command(fix):
+    """Recount laptops and report drift in the dashboard counters"""
+    conn = get_db()
+    drift = stats.check_stats(conn)
+    if not drift:
+        print("Dashboard counters match the laptops table")
+        return
+    for counter, (stored, actual) in drift.items():
+        print(f"  {counter}: stored {stored}, actual {actual}")
+    if fix:
+        stats.rebuild_stats(conn)
+        conn.commit()
+        print("Counters rebuilt")
+    else:
+        print("Run with --fix to rebuild them")
+
+# --- Abandoned cart cleanup ---
+@app.cli.command("sweep-carts")
+@click.option("--days", type=float, default=cart_store.CART_TTL_DAYS, show_default=True,
+              help="Remove carts untouched for this many days.")
+def sweep_carts_command(days):
+    """Delete abandoned guest carts in batches"""
+    removed = cart_store.sweep(get_db(), ttl_days=days)
+    print(f"Removed {removed} abandoned carts")
+
+# --- Image storage report ---
+@app.cli.command("image-report")
+@click.option("--gc", is_flag=True, help="Delete unreferenced and orphaned image files.")
+def image_report_command(gc):
+    """Show image dedup savings and reclaimable space"""
+    conn = get_db()
+    mb = lambda n: f"{(n or 0) / 1024 / 1024:.1f} MB"
+    report = image_refs.storage_report(conn)
+    print(f"Images stored:      {report['images']} files, {mb(report['stored_bytes'])}")
+    print(f"References:         {report['reference_count']} ({mb(report['referenced_bytes'])} without dedup)")
+    print(f"Saved by dedup:     {mb(report['dedup_saved_bytes'])}")
+    print(f"Unreferenced:       {report['unreferenced']} files, {mb(report['unreferenced_bytes'])}")
+    print(f"Orphaned files:     {report['orphan_files']}, {mb(report['orphan_bytes'])}")
+    if report['legacy_blobs']:
+        print(f"{report['legacy_blobs']} images are still stored in the database; run 'flask migrate-images' first.")
+    if gc:
+        freed_images, freed_bytes = image_refs.collect_garbage(conn)
+        orphan_files, orphan_bytes = image_refs.collect_orphans(conn)
+        print(f"Reclaimed {mb(freed_bytes + orphan_bytes)} "
+              f"({freed_images} unreferenced images, {orphan_files} orphaned files)")
+
+# --- Image store migration ---
+@app.cli.command("migrate-images")
+def migrate_images_command():
+    """Move image BLOBs out of SQLite into the image store, then VACUUM"""
+    store = get_image_store()
+    conn = get_db()
+    db_path = db.pool.db_path
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    size_before = os.path.getsize(db_path)
+    
+    image_ids = [row["id"] for row in conn.execute(
+        "SELECT id FROM laptop_images WHERE image_hash IS NULL AND image_data IS NOT NULL").fetchall()]
+    for n, image_id in enumerate(image_ids, 1):
+        image = conn.execute("SELECT image_data FROM laptop_images WHERE id=?", (image_id,)).fetchone()
+        image_hash, _ = store.put_bytes(image["image_data"])
+        conn.execute("UPDATE laptop_images SET image_hash=?, image_data=NULL WHERE id=?", (image_hash, image_id))
+        if n % 100 == 0:
+            conn.commit()
+    conn.commit()
+    print(f"Moved {len(image_ids)} images from laptop_images")
+    
+    # Legacy single-image column on laptops becomes a regular laptop_images row
+    laptop_ids = [row["id"] for row in conn.execute(
+        "SELECT id FROM laptops WHERE image_data IS NOT NULL").fetchall()]
+    for laptop_id in laptop_ids:
+        laptop = conn.execute("SELECT image_data, image_mimetype FROM laptops WHERE id=?", (laptop_id,)).fetchone()
+        image_hash, _ = store.put_bytes(laptop["image_data"])
+        has_primary = conn.execute("SELECT COUNT(*) FROM laptop_images WHERE laptop_id=? AND is_primary=1", (laptop_id,)).fetchone()[0]
+        conn.execute("""
+            INSERT INTO laptop_images (laptop_id, image_hash, image_mimetype, image_name, is_primary)
+            VALUES (?, ?, ?, ?, ?)
+        """, (laptop_id, image_hash, laptop["image_mimetype"], "legacy", 0 if has_primary else 1))
+        conn.execute("UPDATE laptops SET image_data=NULL WHERE id=?", (laptop_id,))
+        conn.commit()
+    print(f"Moved {len(laptop_ids)} legacy laptop images")
+    
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    size_after = os.path.getsize(db_path)
+    print(f"Database size: {size_before / 1048576:.1f} MB -> {size_after / 1048576:.1f} MB")
+
+@app.cli.command("generate-thumbnails")
+def generate_thumbnails_command():
+    """Backfill resized variants for every image in the image store"""
+    if not thumbnails.enabled():
+        print("Pillow is not installed; thumbnails are disabled.")
+        return
+    conn = get_db()
+    image_hashes = [row["image_hash"] for row in conn.execute(
+        "SELECT DISTINCT image_hash FROM laptop_images WHERE image_hash IS NOT NULL").fetchall()]
+    legacy = conn.execute("SELECT COUNT(*) FROM laptop_images WHERE image_hash IS NULL").fetchone()[0]
+    futures = [thumbnails.submit(image_hash) for image_hash in image_hashes]
+    generated = sum(future.result() for future in futures if future)
+    print(f"Checked {len(image_hashes)} images, wrote {generated} variants")
+    if legacy:
+        print(f"{legacy} images are still stored in the database; run 'flask migrate-images' first.")
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5000)
\ No newline at end of file
+    # Development server only; production runs gunicorn with wsgi.py (see gunicorn.conf.py)
+    migrate_conn = db.pool.connect()
+    try:
+        migrations.migrate(migrate_conn)
+    finally:
+        migrate_conn.close()
+    configure_app().run(debug=os.environ.get("FLASK_DEBUG", "0") == "1", host="0.0.0.0", port=5000)
\ No newline at end of file
@@ -0,0 +1,355 @@
+import gzip
+import os
+import sqlite3
+import tarfile
+import time
+from abc import ABC, abstractmethod
+
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+
+import db
+import jobs
+from db import DB_PATH
+from image_store import get_image_store
+
+# --- Google Drive backups ---
+# A backup copies the live database with the SQLite online backup API into a
+# snapshot, gzips it and sends it to Drive as a resumable upload, all in a
+# background thread. The photos the snapshot refers to go up beside it as a
+# tar of their content-addressed files; resized variants are left out because
+# they are made again on demand. The same Drive files are updated each time, so
+# Drive keeps the history as revisions; BACKUP_KEEP_REVISIONS of them are kept.
+# Each run is a background job (see jobs.py) and is also recorded in drive_backups.
+BACKUP_DIR = os.environ.get('BACKUP_DIR', os.path.join(os.path.dirname(DB_PATH) or '.', 'backups'))
+BACKUP_NAME = os.environ.get('BACKUP_NAME', 'laptops.db.gz')
+BACKUP_CHUNK_MB = int(os.environ.get('BACKUP_CHUNK_MB', '8'))  # resumable upload chunk
+BACKUP_KEEP_REVISIONS = int(os.environ.get('BACKUP_KEEP_REVISIONS', '10'))
+BACKUP_STALE_MINUTES = 5  # a running backup without progress for this long was interrupted
+BACKUP_MIMETYPE = 'application/gzip'
+BACKUP_IMAGES_NAME = os.environ.get('BACKUP_IMAGES_NAME', 'laptop-images.tar')
+BACKUP_IMAGES_MIMETYPE = 'application/x-tar'  # photos are already compressed
+LEGACY_BACKUP_NAME = 'laptops.db'  # uncompressed uploads from before compression
+UPLOAD_RETRIES = 5
+COPY_CHUNK = 1024 * 1024
+PROGRESS_EVERY = 1.0  # seconds between progress writes
+
+
+class BackupError(Exception):
+    pass
+
+
+def init_backups(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS drive_backups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            phase TEXT,
+            bytes_done INTEGER DEFAULT 0,
+            bytes_total INTEGER DEFAULT 0,
+            db_bytes INTEGER,
+            backup_bytes INTEGER,
+            drive_file_id TEXT,
+            revisions_pruned INTEGER DEFAULT 0,
+            error TEXT,
+            started_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_date TIMESTAMP
+        )
+    """)
+
+
+# --- Drive clients ---
+class DriveClient(ABC):
+    """What backups need from Drive; pass a fake to run without Google"""
+
+    @abstractmethod
+    def find(self, name):
+        """Id of the newest file with this name, or None"""
+
+    @abstractmethod
+    def upload(self, path, name, mimetype, file_id=None, progress=None):
+        """Upload a local file, replacing file_id's content if given; returns the file id"""
+
+    @abstractmethod
+    def download(self, file_id, fh, progress=None):
+        """Write the file's content to a binary file object"""
+
+    @abstractmethod
+    def prune_revisions(self, file_id, keep):
+        """Delete all but the newest `keep` revisions; returns how many were deleted"""
+
+
+class GoogleDriveClient(DriveClient):
+    def __init__(self, credentials, chunk_size=BACKUP_CHUNK_MB * 1024 * 1024):
+        self.service = build('drive', 'v3', credentials=credentials, cache_discovery=False)
+        self.chunk_size = chunk_size
+
+    def find(self, name):
+        results = self.service.files().list(q=f"name='{name}' and trashed=false", orderBy='modifiedTime desc',
+                                            fields='files(id, name)').execute()
+        items = results.get('files', [])
+        return items[0]['id'] if items else None
+
+    def upload(self, path, name, mimetype, file_id=None, progress=None):
+        media = MediaFileUpload(path, mimetype=mimetype, chunksize=self.chunk_size, resumable=True)
+        if file_id:
+            upload = self.service.files().update(fileId=file_id, media_body=media, fields='id')
+        else:
+            upload = self.service.files().create(body={'name': name}, media_body=media, fields='id')
+        response = None
+        try:
+            while response is None:
+                # A failed chunk is retried from the last byte Drive acknowledged
+                status, response = upload.next_chunk(num_retries=UPLOAD_RETRIES)
+                if status and progress:
+                    progress(status.resumable_progress)
+        except HttpError as e:
+            if file_id and e.resp.status == 404:  # deleted in Drive since the last backup
+                return self.upload(path, name, mimetype, None, progress)
+            raise
+        return response['id']
+
+    def download(self, file_id, fh, progress=None):
+        downloader = MediaIoBaseDownload(fh, self.service.files().get_media(fileId=file_id),
+                                         chunksize=self.chunk_size)
+        done = False
+        while not done:
+            status, done = downloader.next_chunk(num_retries=UPLOAD_RETRIES)
+            if status and progress:
+                progress(status.resumable_progress)
+
+    def prune_revisions(self, file_id, keep):
+        revisions = self.service.revisions().list(fileId=file_id, pageSize=1000,
+                                                  fields='revisions(id)').execute().get('revisions', [])
+        old = revisions[:-keep] if keep > 0 else []  # listed oldest first
+        for revision in old:
+            self.service.revisions().delete(fileId=file_id, revisionId=revision['id']).execute()
+        return len(old)
+
+
+class FolderDriveClient(DriveClient):
+    """Keeps 'Drive' files in a local folder (one subfolder of revisions per file), for tests and offline use"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _revisions(self, file_id):
+        folder = os.path.join(self.root, file_id)
+        return sorted(os.listdir(folder), key=int) if os.path.isdir(folder) else []
+
+    def find(self, name):
+        return name if self._revisions(name) else None
+
+    def upload(self, path, name, mimetype, file_id=None, progress=None):
+        file_id = file_id or name
+        revisions = self._revisions(file_id)
+        os.makedirs(os.path.join(self.root, file_id), exist_ok=True)
+        target = os.path.join(self.root, file_id, str(int(revisions[-1]) + 1 if revisions else 1))
+        with open(path, 'rb') as src, open(target, 'wb') as dst:
+            copy_chunks(src, dst, progress)
+        return file_id
+
+    def download(self, file_id, fh, progress=None):
+        with open(os.path.join(self.root, file_id, self._revisions(file_id)[-1]), 'rb') as src:
+            copy_chunks(src, fh, progress)
+
+    def prune_revisions(self, file_id, keep):
+        old = self._revisions(file_id)[:-keep] if keep > 0 else []
+        for revision in old:
+            os.remove(os.path.join(self.root, file_id, revision))
+        return len(old)
+
+
+def copy_chunks(src, dst, progress=None):
+    """Copy between file objects COPY_CHUNK at a time, reporting bytes copied so far"""
+    done = 0
+    while True:
+        chunk = src.read(COPY_CHUNK)
+        if not chunk:
+            return done
+        dst.write(chunk)
+        done += len(chunk)
+        if progress:
+            progress(done)
+
+
+# --- Running a backup ---
+class _Progress:
+    """Writes a phase's progress to drive_backups at most once per PROGRESS_EVERY, and to the job"""
+
+    def __init__(self, conn, backup_id, job=None):
+        self.conn = conn
+        self.backup_id = backup_id
+        self.job = job
+        self.last = 0.0
+
+    def phase(self, phase, total):
+        _update(self.conn, self.backup_id, phase=phase, bytes_done=0, bytes_total=total)
+        self.last = time.monotonic()
+        if self.job:
+            self.job.progress(0, total, message=phase, force=True)
+
+    def __call__(self, done):
+        now = time.monotonic()
+        if now - self.last >= PROGRESS_EVERY:
+            _update(self.conn, self.backup_id, bytes_done=done)
+            self.last = now
+        if self.job:
+            self.job.progress(done)  # raises JobCancelled when the admin cancels
+
+
+def _update(conn, backup_id, **fields):
+    assignments = ', '.join(f"{name} = ?" for name in fields)
+    conn.execute(f"UPDATE drive_backups SET {assignments}, updated_date = CURRENT_TIMESTAMP WHERE id = ?",
+                 (*fields.values(), backup_id))
+    conn.commit()
+
+
+def snapshot(db_path, target_path):
+    """Consistent copy of a live database through the SQLite online backup API"""
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(target_path)
+    try:
+        # All pages in one step: a single read transaction, which WAL writers don't wait
+        # for. A copy in several steps restarts whenever another connection writes.
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def compress(path, target_path, progress=None):
+    with open(path, 'rb') as src, gzip.open(target_path, 'wb', compresslevel=6) as dst:
+        copy_chunks(src, dst, progress)
+
+
+def image_hashes(db_path):
+    """Stored photos a database refers to"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute(
+            "SELECT DISTINCT image_hash FROM laptop_images WHERE image_hash IS NOT NULL ORDER BY image_hash")]
+    finally:
+        conn.close()
+
+
+def archive_images(hashes, target_path, progress=None):
+    """Tar the image store's files for these hashes; returns (files archived, files missing)"""
+    store = get_image_store()
+    archived = missing = 0
+    with tarfile.open(target_path, 'w') as tar:
+        for done, image_hash in enumerate(hashes, 1):
+            info = tarfile.TarInfo(image_hash)
+            info.size = store.size(image_hash)
+            info.mtime = int(time.time())
+            try:
+                if info.size is None:
+                    raise FileNotFoundError(image_hash)
+                with store.open(image_hash) as fh:
+                    tar.addfile(info, fh)
+                archived += 1
+            except FileNotFoundError:  # freed since the snapshot was taken
+                missing += 1
+            if progress:
+                progress(done)
+    return archived, missing
+
+
+def last_drive_file_id(conn):
+    row = conn.execute("""
+        SELECT drive_file_id FROM drive_backups WHERE status = 'done' AND drive_file_id IS NOT NULL
+        ORDER BY id DESC LIMIT 1
+    """).fetchone()
+    return row['drive_file_id'] if row else None
+
+
+def run_backup(backup_id, client, db_path=None, keep=BACKUP_KEEP_REVISIONS, job=None):
+    """Snapshot, compress, upload and prune; records each phase in drive_backups"""
+    conn = db.pool.connect()
+    snapshot_path = os.path.join(BACKUP_DIR, f"snapshot-{backup_id}.db")
+    compressed_path = snapshot_path + '.gz'
+    images_path = os.path.join(BACKUP_DIR, f"images-{backup_id}.tar")
+    progress = _Progress(conn, backup_id, job)
+    started = time.perf_counter()
+    try:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        _update(conn, backup_id, status='running', phase='snapshot')
+        if job:
+            job.progress(0, message='snapshot', force=True)
+        snapshot(db_path or db.pool.db_path, snapshot_path)
+        db_bytes = os.path.getsize(snapshot_path)
+        _update(conn, backup_id, db_bytes=db_bytes)
+
+        hashes = image_hashes(snapshot_path)
+        progress.phase('images', len(hashes))
+        images, images_missing = archive_images(hashes, images_path, progress)
+
+        progress.phase('compress', db_bytes)
+        compress(snapshot_path, compressed_path, progress)
+        os.remove(snapshot_path)
+        backup_bytes = os.path.getsize(compressed_path)
+        _update(conn, backup_id, backup_bytes=backup_bytes)
+
+        # Photos first: the newest database revision never refers to photos Drive lacks
+        images_bytes = os.path.getsize(images_path)
+        progress.phase('upload images', images_bytes)
+        images_file_id = client.upload(images_path, BACKUP_IMAGES_NAME, BACKUP_IMAGES_MIMETYPE,
+                                       client.find(BACKUP_IMAGES_NAME), progress)
+        os.remove(images_path)
+
+        progress.phase('upload', backup_bytes)
+        file_id = client.upload(compressed_path, BACKUP_NAME, BACKUP_MIMETYPE,
+                                last_drive_file_id(conn) or client.find(BACKUP_NAME), progress)
+        _update(conn, backup_id, drive_file_id=file_id, bytes_done=backup_bytes)
+
+        progress.phase('prune', 0)
+        pruned = client.prune_revisions(file_id, keep)
+        client.prune_revisions(images_file_id, keep)
+        _update(conn, backup_id, status='done', phase=None, revisions_pruned=pruned,
+                finished_date=time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()))
+        summary = (f"{db_bytes / 1e6:.1f} MB database and {images} photos "
+                   f"({(backup_bytes + images_bytes) / 1e6:.1f} MB) uploaded, {pruned} old revisions pruned")
+        if images_missing:
+            summary += f"; {images_missing} photos were already missing from the image store"
+        print(f"Drive backup {backup_id}: {summary} in {time.perf_counter() - started:.1f}s")
+        return summary
+    except Exception as e:
+        error = 'Cancelled' if isinstance(e, jobs.JobCancelled) else str(e) or repr(e)
+        print(f"Drive backup {backup_id} failed: {error}")
+        _update(conn, backup_id, status='failed', error=error,
+                finished_date=time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()))
+        raise
+    finally:
+        for path in (snapshot_path, compressed_path, images_path):
+            if os.path.exists(path):
+                os.remove(path)
+        conn.close()
+
+
+def begin_backup(conn):
+    """Record a new backup run; returns its id"""
+    conn.execute("BEGIN IMMEDIATE")  # one backup at a time, across workers
+    try:
+        conn.execute("""
+            UPDATE drive_backups SET status = 'interrupted', finished_date = CURRENT_TIMESTAMP
+            WHERE status IN ('queued', 'running') AND updated_date < datetime('now', ?)
+        """, (f"-{BACKUP_STALE_MINUTES} minutes",))
+        if conn.execute("SELECT 1 FROM drive_backups WHERE status IN ('queued', 'running')").fetchone():
+            raise BackupError("A backup is already running.")
+        backup_id = conn.execute("INSERT INTO drive_backups (status) VALUES ('queued')").lastrowid
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return backup_id
+
+
+@jobs.handler('drive_backup', 'Google Drive backup', unique=True)
+def backup_job(job, client):
+    return {'summary': run_backup(begin_backup(job.conn), client, job=job)}
+
+
+def recent(conn, limit=5):
+    return [dict(row) for row in conn.execute("SELECT * FROM drive_backups ORDER BY id DESC LIMIT ?", (limit,))]
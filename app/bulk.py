@@ -0,0 +1,141 @@
+import os
+import time
+
+import jobs
+from image_store import get_image_store
+from serials import generate_serial_numbers
+
+# --- Set-based bulk operations on laptops ---
+# Selected laptops are processed BULK_CHUNK_SIZE at a time with a few
+# INSERT ... SELECT / DELETE ... IN statements per chunk, which keeps each
+# statement's parameter list bounded. The whole selection is one transaction,
+# so a failure or cancel leaves nothing half done. Every function returns one
+# report per chunk: {'batch', 'laptops', 'ms'}.
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', '200'))
+
+
+def _chunks(ids, size):
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def delete_laptops(conn, laptop_ids, chunk_size=BULK_CHUNK_SIZE):
+    """Delete laptops with their images and installed parts, all in one transaction"""
+    reports = []
+    try:
+        for batch, chunk in enumerate(_chunks(laptop_ids, chunk_size), 1):
+            started = time.perf_counter()
+            placeholders = ','.join('?' * len(chunk))
+            conn.execute(f"DELETE FROM laptop_images WHERE laptop_id IN ({placeholders})", chunk)
+            conn.execute(f"DELETE FROM laptop_spareparts WHERE laptop_id IN ({placeholders})", chunk)
+            deleted = conn.execute(f"DELETE FROM laptops WHERE id IN ({placeholders})", chunk).rowcount
+            reports.append({'batch': batch, 'laptops': deleted,
+                            'ms': round((time.perf_counter() - started) * 1000, 1)})
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return reports
+
+
+def duplicate_laptops(conn, laptop_ids, chunk_size=BULK_CHUNK_SIZE, progress=None):
+    """Copy laptops (as unsold, with new serials) plus their images and installed parts.
+
+    Copies are created in the order of laptop_ids, all in one transaction that is
+    rolled back if anything fails, including a progress(ids_done) callback, which is
+    called after each chunk. The callback runs while the write lock is held, so it
+    must not write to the database.
+    """
+    # old id -> serial -> new id, so images and parts can be copied in one statement each
+    conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS bulk_duplicate_map (
+            old_id INTEGER PRIMARY KEY,
+            position INTEGER,
+            serial_number TEXT,
+            new_id INTEGER
+        )
+    """)
+    reports = []
+    done = 0
+    try:
+        for batch, chunk in enumerate(_chunks(laptop_ids, chunk_size), 1):
+            started = time.perf_counter()
+            placeholders = ','.join('?' * len(chunk))
+            names = dict(conn.execute(f"SELECT id, laptop_name FROM laptops WHERE id IN ({placeholders})",
+                                      chunk).fetchall())
+            originals = [laptop_id for laptop_id in chunk if laptop_id in names]
+            conn.execute("DELETE FROM bulk_duplicate_map")
+            if originals:
+                serials = generate_serial_numbers([f"{names[laptop_id]} (Copy)" for laptop_id in originals], conn)
+                conn.executemany("INSERT INTO bulk_duplicate_map (old_id, position, serial_number) VALUES (?, ?, ?)",
+                                 [(laptop_id, position, serial)
+                                  for position, (laptop_id, serial) in enumerate(zip(originals, serials))])
+                conn.execute("""
+                    INSERT INTO laptops (laptop_name, cpu, ram, storage, os, notes,
+                                         price_bought, price_to_sell, fees, sold, serial_number)
+                    SELECT l.laptop_name || ' (Copy)', l.cpu, l.ram, l.storage, l.os, l.notes,
+                           l.price_bought, l.price_to_sell, l.fees, 0, m.serial_number
+                    FROM bulk_duplicate_map m JOIN laptops l ON l.id = m.old_id
+                    ORDER BY m.position
+                """)
+                conn.execute("""
+                    UPDATE bulk_duplicate_map
+                    SET new_id = (SELECT id FROM laptops WHERE serial_number = bulk_duplicate_map.serial_number)
+                """)
+                _move_legacy_images(conn)
+                # Copies only reference the stored file (see image_refs)
+                conn.execute("""
+                    INSERT INTO laptop_images (laptop_id, image_hash, image_mimetype, image_name, is_primary)
+                    SELECT m.new_id, li.image_hash, li.image_mimetype, li.image_name, li.is_primary
+                    FROM bulk_duplicate_map m JOIN laptop_images li ON li.laptop_id = m.old_id
+                    ORDER BY m.position, li.id
+                """)
+                conn.execute("""
+                    INSERT INTO laptop_spareparts (laptop_id, sparepart_id)
+                    SELECT m.new_id, ls.sparepart_id
+                    FROM bulk_duplicate_map m JOIN laptop_spareparts ls ON ls.laptop_id = m.old_id
+                    ORDER BY m.position, ls.id
+                """)
+            reports.append({'batch': batch, 'laptops': len(originals),
+                            'ms': round((time.perf_counter() - started) * 1000, 1)})
+            done += len(chunk)
+            if progress:
+                progress(done)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return reports
+
+
+def _move_legacy_images(conn):
+    """Put BLOB-only images of the laptops being copied into the image store first"""
+    legacy = conn.execute("""
+        SELECT li.id FROM bulk_duplicate_map m JOIN laptop_images li ON li.laptop_id = m.old_id
+        WHERE li.image_hash IS NULL AND li.image_data IS NOT NULL
+    """).fetchall()
+    store = get_image_store()
+    for row in legacy:
+        image = conn.execute("SELECT image_data FROM laptop_images WHERE id = ?", (row['id'],)).fetchone()
+        image_hash, _ = store.put_bytes(image['image_data'])
+        conn.execute("UPDATE laptop_images SET image_hash = ?, image_data = NULL WHERE id = ?", (image_hash, row['id']))
+
+
+@jobs.handler('bulk_duplicate', 'Bulk duplicate')
+def duplicate_job(job, laptop_ids):
+    """All or nothing: a cancel seen between chunks rolls back every copy"""
+    total = len({int(i) for i in laptop_ids})
+    job.progress(0, total, message='copying', force=True)
+    # Progress writes would wait on the copy's own write lock; only look for a cancel until it commits
+    reports = duplicate_laptops(job.conn, laptop_ids, progress=lambda done: job.check_cancelled())
+    log_reports("Bulk duplicate", reports)
+    return {'summary': f"{sum(report['laptops'] for report in reports)} laptops duplicated"}
+
+
+def log_reports(operation, reports):
+    total = sum(report['laptops'] for report in reports)
+    total_ms = sum(report['ms'] for report in reports)
+    print(f"{operation}: {total} laptops in {len(reports)} batches, {total_ms:.1f} ms")
+    for report in reports:
+        print(f"  batch {report['batch']}: {report['laptops']} laptops, {report['ms']} ms")
@@ -0,0 +1,214 @@
+import os
+import threading
+import time
+
+import page_cache
+
+# --- Server-side cart store ---
+# One carts row per guest session (last_touched + version) owns that session's
+# cart (laptops) and cart_spareparts (upgrades) rows. Carts nobody has touched
+# for CART_TTL_DAYS are swept in batches of CART_SWEEP_BATCH sessions.
+CART_TTL_DAYS = float(os.environ.get('CART_TTL_DAYS', '7'))
+CART_SWEEP_BATCH = int(os.environ.get('CART_SWEEP_BATCH', '500'))
+CART_SWEEP_INTERVAL = float(os.environ.get('CART_SWEEP_INTERVAL', '300'))  # seconds
+
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+
+
+def init_cart_store(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS carts (
+            session_id TEXT PRIMARY KEY,
+            last_touched TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_carts_last_touched ON carts (last_touched)")
+    # A laptop is in a cart at most once
+    conn.execute("""
+        DELETE FROM cart WHERE id NOT IN (SELECT MIN(id) FROM cart GROUP BY session_id, laptop_id)
+    """)
+    conn.execute("DROP INDEX IF EXISTS idx_cart_session")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_cart_session_laptop ON cart (session_id, laptop_id)")
+    # Rows left behind by older versions get a cart header so the sweeper can expire them
+    conn.execute("""
+        INSERT OR IGNORE INTO carts (session_id, last_touched)
+        SELECT session_id, MAX(added_date) FROM (
+            SELECT session_id, added_date FROM cart
+            UNION ALL
+            SELECT session_id, added_date FROM cart_spareparts
+        ) GROUP BY session_id
+    """)
+
+
+def touch(conn, session_id):
+    """Mark the cart as changed: refresh its TTL and bump its version"""
+    conn.execute("""
+        INSERT INTO carts (session_id) VALUES (?)
+        ON CONFLICT(session_id) DO UPDATE SET last_touched = CURRENT_TIMESTAMP, version = version + 1
+    """, (session_id,))
+
+
+def cart_version(conn, session_id):
+    row = conn.execute("SELECT version FROM carts WHERE session_id = ?", (session_id,)).fetchone()
+    return row[0] if row else None
+
+
+def add_laptop(conn, session_id, laptop_id):
+    """Put a laptop in the cart; returns False if it was already there"""
+    cursor = conn.execute("INSERT OR IGNORE INTO cart (session_id, laptop_id) VALUES (?, ?)",
+                          (session_id, laptop_id))
+    touch(conn, session_id)
+    return cursor.rowcount > 0
+
+
+def remove_laptop(conn, session_id, laptop_id):
+    """Take a laptop and its configured upgrades out of the cart"""
+    conn.execute("DELETE FROM cart WHERE session_id = ? AND laptop_id = ?", (session_id, laptop_id))
+    conn.execute("DELETE FROM cart_spareparts WHERE session_id = ? AND laptop_id = ?", (session_id, laptop_id))
+    touch(conn, session_id)
+
+
+def count(conn, session_id):
+    return conn.execute("SELECT COUNT(*) FROM cart WHERE session_id = ?", (session_id,)).fetchone()[0]
+
+
+def clear(conn, session_id):
+    _delete_sessions(conn, [session_id])
+
+
+def _delete_sessions(conn, session_ids):
+    placeholders = ','.join('?' * len(session_ids))
+    for table in ('cart_spareparts', 'cart', 'carts'):
+        conn.execute(f"DELETE FROM {table} WHERE session_id IN ({placeholders})", session_ids)
+
+
+def sweep(conn, ttl_days=CART_TTL_DAYS, batch_size=CART_SWEEP_BATCH, max_batches=None):
+    """Delete carts idle for longer than ttl_days, batch_size sessions per transaction.
+
+    Returns the number of carts removed.
+    """
+    removed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        session_ids = [row[0] for row in conn.execute("""
+            SELECT session_id FROM carts WHERE last_touched < datetime('now', ?) LIMIT ?
+        """, (f"-{ttl_days * 86400:.0f} seconds", batch_size))]
+        if not session_ids:
+            break
+        _delete_sessions(conn, session_ids)
+        conn.commit()
+        removed += len(session_ids)
+        batches += 1
+    return removed
+
+
+def maybe_sweep(conn):
+    """Run one sweep batch if CART_SWEEP_INTERVAL has passed since the last one"""
+    global _last_sweep
+    now = time.monotonic()
+    with _sweep_lock:
+        if now - _last_sweep < CART_SWEEP_INTERVAL:
+            return 0
+        _last_sweep = now
+    return sweep(conn, max_batches=1)
+
+
+# --- Cart valuation ---
+# Prices laptops and the session's configured upgrades in one query. Results
+# are memoized per session; the key includes the cart version and the cache
+# is dropped when the inventory version changes, so any cart change or price
+# edit gives a fresh valuation.
+CART_CACHE_BYTES = 4 * 1024 * 1024
+
+_valuations = page_cache.PageCache(CART_CACHE_BYTES)
+
+VALUATION_COLUMNS = """
+    l.id AS laptop_id, l.laptop_name, l.cpu, l.ram, l.storage, l.os, l.price_to_sell,
+    (SELECT li.id FROM laptop_images li WHERE li.laptop_id = l.id
+     ORDER BY li.is_primary DESC, li.uploaded_date, li.id LIMIT 1) AS primary_image_id,
+    cs.id AS cart_sparepart_id, cs.sparepart_id, cs.quantity,
+    sp.part_type, sp.capacity, sp.price, sp.storage_type, sp.ram_type, sp.ram_speed
+"""
+
+# The session's whole cart; sold laptops come back with a NULL laptop_id
+CART_VALUATION_SQL = f"""
+    SELECT c.laptop_id AS wanted_id, {VALUATION_COLUMNS}
+    FROM cart c
+    LEFT JOIN laptops l ON l.id = c.laptop_id AND l.sold = 0
+    LEFT JOIN cart_spareparts cs ON cs.laptop_id = l.id AND cs.session_id = c.session_id
+    LEFT JOIN spareparts sp ON sp.id = cs.sparepart_id
+    WHERE c.session_id = ?
+    ORDER BY c.id, cs.id
+"""
+
+LAPTOPS_VALUATION_SQL = """
+    SELECT l.id AS wanted_id, {columns}
+    FROM laptops l
+    LEFT JOIN cart_spareparts cs ON cs.laptop_id = l.id AND cs.session_id = ?
+    LEFT JOIN spareparts sp ON sp.id = cs.sparepart_id
+    WHERE l.id IN ({placeholders}) AND l.sold = 0
+    ORDER BY l.id, cs.id
+"""
+
+
+def value_laptops(conn, session_id, laptop_ids=None):
+    """Price laptops plus this session's upgrades for them.
+
+    laptop_ids=None prices the session's cart. Returns a dict with:
+      items     - available laptops, in cart (or laptop_ids) order
+      pricing   - {laptop_id: {'parts', 'base_price', 'upgrades_value', 'total_price'}}
+      total     - sum of every total_price
+      missing   - ids that are sold or no longer exist
+    """
+    if laptop_ids is None:
+        rows = conn.execute(CART_VALUATION_SQL, (session_id,)).fetchall()
+        wanted = [row['wanted_id'] for row in rows]
+    else:
+        wanted = [int(laptop_id) for laptop_id in laptop_ids]
+        rows = []
+        if wanted:
+            sql = LAPTOPS_VALUATION_SQL.format(columns=VALUATION_COLUMNS,
+                                               placeholders=','.join('?' * len(wanted)))
+            rows = conn.execute(sql, [session_id] + wanted).fetchall()
+
+    items = {}
+    pricing = {}
+    for row in rows:
+        laptop_id = row['laptop_id']
+        if laptop_id is None:
+            continue
+        if laptop_id not in items:
+            items[laptop_id] = {key: row[key] for key in (
+                'laptop_id', 'laptop_name', 'cpu', 'ram', 'storage', 'os',
+                'price_to_sell', 'primary_image_id')}
+            base_price = row['price_to_sell'] or 0
+            pricing[laptop_id] = {'parts': [], 'base_price': base_price,
+                                  'upgrades_value': 0, 'total_price': base_price}
+        if row['cart_sparepart_id'] is not None:
+            part = {key: row[key] for key in (
+                'sparepart_id', 'quantity', 'part_type', 'capacity', 'price',
+                'storage_type', 'ram_type', 'ram_speed')}
+            part['id'] = row['cart_sparepart_id']
+            part['laptop_id'] = laptop_id
+            part_value = (part['price'] or 0) * part['quantity']
+            pricing[laptop_id]['parts'].append(part)
+            pricing[laptop_id]['upgrades_value'] += part_value
+            pricing[laptop_id]['total_price'] += part_value
+
+    wanted = list(dict.fromkeys(wanted))
+    return {
+        'items': [items[laptop_id] for laptop_id in wanted if laptop_id in items],
+        'pricing': pricing,
+        'total': sum(p['total_price'] for p in pricing.values()),
+        'missing': [laptop_id for laptop_id in wanted if laptop_id not in items],
+    }
+
+
+def valuation(conn, session_id, laptop_ids=None):
+    """Memoized value_laptops() until this session's cart or the inventory changes"""
+    version = cart_version(conn, session_id) if session_id else None
+    key = (session_id, None if laptop_ids is None else tuple(laptop_ids), version)
+    return _valuations.get_or_build(key, page_cache.inventory_version(conn),
+                                    lambda: value_laptops(conn, session_id, laptop_ids))
@@ -0,0 +1,299 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from flask import g, has_app_context
+
+# --- SQLite settings (override with environment variables) ---
+DB_PATH = os.environ.get('DB_PATH', 'data/laptops.db')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+SQLITE_PRAGMAS = {
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', '-16000')),  # negative = KiB
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(64 * 1024 * 1024))),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000')),  # milliseconds
+    'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+}
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free in time"""
+
+
+# Set by slow_queries.init_app; sees every statement whose execute + fetch time
+# passes slow_query_log.threshold
+slow_query_log = None
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that adds the time spent in SQLite to its connection's counters"""
+    statement = None  # (sql, parameters, kind) of the last execute
+    elapsed = 0.0  # seconds spent on that statement so far, fetches included
+    slow_entry = None  # set by the slow query log once the statement is slow
+
+    def _start(self, sql, parameters, kind):
+        self.statement = (sql, parameters, kind)
+        self.elapsed = 0.0
+        self.slow_entry = None
+
+    def _add(self, started, statements=0):
+        seconds = time.perf_counter() - started
+        self.connection.add_sql_time(seconds, statements)
+        if slow_query_log is not None and self.statement is not None:
+            self.elapsed += seconds
+            if self.elapsed >= slow_query_log.threshold:
+                slow_query_log.observe(self, seconds)
+
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters, 'execute')
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._add(started, statements=1)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql, seq_of_parameters, 'executemany')
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._add(started, statements=1)
+
+    def executescript(self, sql_script):
+        self._start(sql_script, None, 'executescript')
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._add(started, statements=1)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._add(started)
+
+    def fetchmany(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(*args)
+        finally:
+            self._add(started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._add(started)
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            self._add(started)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection that counts statements and SQL time (reset for every request)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reset_sql_counters()
+
+    def reset_sql_counters(self):
+        self.sql_statements = 0
+        self.sql_time = 0.0
+
+    def add_sql_time(self, seconds, statements=0):
+        self.sql_time += seconds
+        self.sql_statements += statements
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute and friends build a plain cursor in C, so route them through cursor()
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def executescript(self, *args):
+        return self.cursor().executescript(*args)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            self.add_sql_time(time.perf_counter() - started)
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections, one leased per request"""
+
+    def __init__(self, db_path, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, pragmas=None,
+                 factory=sqlite3.Connection):
+        self.db_path = db_path
+        self.factory = factory  # TimedConnection when metrics or the slow query log are on
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = dict(SQLITE_PRAGMAS if pragmas is None else pragmas)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped by close_idle; older connections are closed on release
+        self._generations = {}  # id(connection) -> generation it was opened in
+        self._opened = False
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time = 0.0
+
+    def _open_database(self):
+        """Create the data directory and switch the file to WAL (done once)"""
+        if os.path.dirname(self.db_path):
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+        self._opened = True
+
+    def connect(self):
+        """Open a new configured connection (not tracked by the pool)"""
+        with self._lock:
+            if not self._opened:
+                self._open_database()
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def acquire(self):
+        """Lease a connection, opening a new one while below the size limit"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self.connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                with self._lock:
+                    self._generations[id(conn)] = self._generation
+            else:
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeout(f"No database connection free after {self.timeout}s")
+                finally:
+                    with self._lock:
+                        self._waits += 1
+                        self._wait_time += time.perf_counter() - started
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+        return conn
+
+    def release(self, conn):
+        """Return a leased connection, rolling back anything left uncommitted.
+
+        Connections opened before the last close_idle() are closed instead.
+        """
+        with self._lock:
+            self._in_use -= 1
+            stale = self._generations.get(id(conn)) != self._generation
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            stale = True
+        if stale:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        conn.close()
+        with self._lock:
+            self._created -= 1
+            self._generations.pop(id(conn), None)
+
+    def close_idle(self):
+        """Close every idle connection; leased ones are closed when they are released"""
+        with self._lock:
+            self._generation += 1
+        closed = 0
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+            closed += 1
+        return closed
+
+    def stats(self):
+        with self._lock:
+            return {
+                'db_path': self.db_path,
+                'size': self.size,
+                'open': self._created,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'total_wait_ms': round(self._wait_time * 1000, 2),
+                'pragmas': dict(self.pragmas),
+            }
+
+
+pool = ConnectionPool(DB_PATH)
+
+
+def get_db():
+    """Return the request's pooled connection, or a standalone one outside a request"""
+    if not has_app_context():
+        return pool.connect()
+    conn = g.get('_db_conn')
+    if conn is None:
+        conn = g._db_conn = pool.acquire()
+        if isinstance(conn, TimedConnection):
+            conn.reset_sql_counters()
+    return conn
+
+
+def close_db(exc=None):
+    """teardown_appcontext hook: hand the request's connection back to the pool"""
+    conn = g.pop('_db_conn', None)
+    if conn is not None:
+        pool.release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,102 @@
+import csv
+import io
+import os
+import zlib
+
+import jobs
+
+# --- CSV export definitions ---
+# Explicit column lists keep BLOBs (laptops.image_data) out of the export.
+# Each entry: (FROM clause, columns, date column used for the range filter)
+EXPORT_TABLES = {
+    'laptops': ("laptops", [
+        'id', 'serial_number', 'laptop_name', 'cpu', 'ram', 'ram_type', 'ram_speed', 'storage',
+        'storage_type', 'os', 'notes', 'price_bought', 'price_to_sell', 'fees', 'sold', 'date_sold',
+        'created_date', 'last_edited', 'warranty_start_date', 'warranty_duration_days', 'warranty_notes',
+    ], 'created_date'),
+    'spareparts': ("spareparts", [
+        'id', 'part_type', 'storage_type', 'ram_type', 'ram_speed', 'capacity', 'notes', 'quantity',
+        'price', 'created_date', 'last_edited',
+    ], 'created_date'),
+    'orders': ("orders", [
+        'id', 'guest_name', 'guest_email', 'guest_phone', 'status', 'total_amount', 'created_date',
+        'confirmed_date', 'completed_date', 'notes',
+    ], 'created_date'),
+    'order_items': ("order_items oi JOIN orders o ON o.id = oi.order_id", [
+        'oi.id', 'oi.order_id', 'oi.laptop_id', 'oi.quantity', 'oi.price', 'o.created_date AS order_date',
+    ], 'o.created_date'),
+}
+FETCH_SIZE = 500
+
+
+def export_query(table, start_date=None, end_date=None):
+    """SQL and params for one export; dates are inclusive YYYY-MM-DD strings"""
+    source, columns, date_column = EXPORT_TABLES[table]
+    sql = f"SELECT {', '.join(columns)} FROM {source} WHERE 1=1"
+    params = []
+    if start_date:
+        sql += f" AND {date_column} >= ?"
+        params.append(start_date)
+    if end_date:
+        sql += f" AND {date_column} < date(?, '+1 day')"
+        params.append(end_date)
+    first_column = columns[0].split(' AS ')[0]
+    return sql + f" ORDER BY {first_column}", params
+
+
+def count_rows(conn, table, start_date=None, end_date=None):
+    sql, params = export_query(table, start_date, end_date)
+    return conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+
+
+def iter_csv(conn, table, start_date=None, end_date=None, progress=None):
+    """Yield the export as encoded CSV chunks, FETCH_SIZE rows at a time; progress(rows) after each"""
+    sql, params = export_query(table, start_date, end_date)
+    cursor = conn.execute(sql, params)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column[0] for column in cursor.description])
+    written = 0
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        writer.writerows(rows)
+        written += len(rows)
+        if progress:
+            progress(written)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of byte chunks into one gzip stream"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip header
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@jobs.handler('export', 'CSV export')
+def export_job(job, table, start_date=None, end_date=None, compress=False):
+    """Write the export to JOB_DIR for download from the jobs page"""
+    total = count_rows(job.conn, table, start_date, end_date)
+    job.progress(0, total, force=True)
+    filename = f"{table}.csv.gz" if compress else f"{table}.csv"
+    os.makedirs(jobs.JOB_DIR, exist_ok=True)
+    chunks = iter_csv(job.conn, table, start_date, end_date, progress=lambda rows: job.progress(rows, total))
+    path = jobs.output_path(job.id, filename)
+    try:
+        with open(path, 'wb') as f:
+            for chunk in gzip_chunks(chunks) if compress else chunks:
+                f.write(chunk)
+    except BaseException:
+        if os.path.isfile(path):  # open() itself may have failed
+            os.remove(path)
+        raise
+    return {'file': filename, 'summary': f"{total} rows"}
@@ -0,0 +1,51 @@
+"""Gunicorn settings for production. Every value can be set through the environment.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+
+# Prefork workers, each with a small thread pool. SQLite allows one writer at
+# a time, so a few processes with threads beat many single-threaded ones.
+workers = int(os.environ.get("WEB_WORKERS", min(multiprocessing.cpu_count() * 2, 4)))
+threads = int(os.environ.get("WEB_THREADS", "4"))
+worker_class = "gthread" if threads > 1 else "sync"
+
+# Seconds: kill a stuck request, wait for in-flight requests on shutdown/reload
+timeout = int(os.environ.get("WEB_TIMEOUT", "60"))
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("WEB_KEEPALIVE", "5"))
+
+# Recycle workers now and then so slow leaks can't build up
+max_requests = int(os.environ.get("WEB_MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.environ.get("WEB_MAX_REQUESTS_JITTER", "200"))
+
+# Each worker imports the app itself: no SQLite connections or threads cross a fork
+preload_app = False
+
+accesslog = os.environ.get("ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    """Apply pending migrations once, in the master, before any worker imports the app.
+
+    A separate process, so the master itself never opens the database or imports the app.
+    """
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app.py", "migrate-db"],
+                   cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+
+
+def worker_exit(server, worker):
+    """Graceful shutdown: finish queued thumbnails and running jobs, close pooled connections"""
+    import db
+    import jobs
+    import thumbnails
+    thumbnails.shutdown(wait=True)
+    jobs.shutdown(wait=True)
+    db.pool.close_idle()
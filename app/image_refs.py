@@ -0,0 +1,141 @@
+import os
+
+import thumbnails
+from image_store import get_image_store
+
+# --- Image reference counts ---
+# image_blobs has one row per stored image hash. Triggers on laptop_images
+# keep ref_count equal to the number of rows that point at the hash, so
+# duplicating a laptop only adds metadata. When the count drops to zero the
+# file (and its resized variants) can be deleted by collect_garbage().
+IMAGE_GC_GRACE = float(os.environ.get('IMAGE_GC_GRACE', '300'))  # seconds
+
+
+def init_image_refs(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS image_blobs (
+            image_hash TEXT PRIMARY KEY,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            size INTEGER,
+            released_date TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_image_blobs_unreferenced ON image_blobs (ref_count) WHERE ref_count <= 0")
+    add_ref = """
+        INSERT INTO image_blobs (image_hash, ref_count) VALUES (new.image_hash, 1)
+        ON CONFLICT(image_hash) DO UPDATE SET ref_count = ref_count + 1, released_date = NULL;
+    """
+    drop_ref = """
+        UPDATE image_blobs
+        SET ref_count = ref_count - 1,
+            released_date = CASE WHEN ref_count <= 1 THEN CURRENT_TIMESTAMP END
+        WHERE image_hash = old.image_hash;
+    """
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS laptop_images_ref_insert AFTER INSERT ON laptop_images
+        WHEN new.image_hash IS NOT NULL BEGIN {add_ref} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS laptop_images_ref_delete AFTER DELETE ON laptop_images
+        WHEN old.image_hash IS NOT NULL BEGIN {drop_ref} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS laptop_images_ref_drop AFTER UPDATE OF image_hash ON laptop_images
+        WHEN old.image_hash IS NOT NULL AND old.image_hash IS NOT new.image_hash BEGIN {drop_ref} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS laptop_images_ref_add AFTER UPDATE OF image_hash ON laptop_images
+        WHEN new.image_hash IS NOT NULL AND old.image_hash IS NOT new.image_hash BEGIN {add_ref} END
+    """)
+    conn.execute("""
+        INSERT OR REPLACE INTO image_blobs (image_hash, ref_count)
+        SELECT image_hash, COUNT(*) FROM laptop_images WHERE image_hash IS NOT NULL GROUP BY image_hash
+    """)
+
+
+def _delete_files(store, image_hash):
+    """Remove an image and its variants; returns the bytes freed"""
+    freed = 0
+    for key in [image_hash] + [thumbnails.variant_key(image_hash, size) for size in thumbnails.THUMBNAIL_SIZES]:
+        size = store.size(key)
+        if size is not None:
+            store.delete(key)
+            freed += size
+    return freed
+
+
+def collect_garbage(conn, limit=None, grace=IMAGE_GC_GRACE):
+    """Delete files whose last reference is gone. Returns (images freed, bytes freed).
+
+    Files written or re-uploaded in the last `grace` seconds are kept: an
+    upload stores the file before it inserts the laptop_images row.
+    """
+    store = get_image_store()
+    if conn.in_transaction:
+        conn.commit()
+    sql = "SELECT image_hash FROM image_blobs WHERE ref_count <= 0"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    candidates = [row[0] for row in conn.execute(sql).fetchall()]
+    freed_images = freed_bytes = 0
+    for image_hash in candidates:
+        # Hold the write lock so no new reference can appear while the file goes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT ref_count FROM image_blobs WHERE image_hash = ?", (image_hash,)).fetchone()
+            age = store.age(image_hash)
+            if row is None or row[0] > 0 or (age is not None and age < grace):
+                conn.rollback()
+                continue
+            freed_bytes += _delete_files(store, image_hash)
+            conn.execute("DELETE FROM image_blobs WHERE image_hash = ?", (image_hash,))
+            conn.commit()
+            freed_images += 1
+        except Exception:
+            conn.rollback()
+            raise
+    return freed_images, freed_bytes
+
+
+def collect_orphans(conn, grace=IMAGE_GC_GRACE, dry_run=False):
+    """Delete stored files that no image_blobs row knows about. Returns (count, bytes)."""
+    store = get_image_store()
+    known = {row[0] for row in conn.execute("SELECT image_hash FROM image_blobs")}
+    count = total = 0
+    for key in list(store.keys()):
+        image_hash = key.split('-', 1)[0]  # variants are <hash>-<size>
+        if image_hash in known:
+            continue
+        age = store.age(key)
+        if age is None or age < grace:
+            continue
+        size = store.size(key) or 0
+        if not dry_run:
+            store.delete(key)
+        count += 1
+        total += size
+    return count, total
+
+
+def storage_report(conn):
+    """Dedup savings and reclaimable space, as a dict"""
+    store = get_image_store()
+    # Sizes are filled in lazily from the store
+    missing = [row[0] for row in conn.execute("SELECT image_hash FROM image_blobs WHERE size IS NULL")]
+    for image_hash in missing:
+        conn.execute("UPDATE image_blobs SET size = ? WHERE image_hash = ?", (store.size(image_hash), image_hash))
+    conn.commit()
+    report = dict(conn.execute("""
+        SELECT COUNT(CASE WHEN ref_count > 0 THEN 1 END) AS images,
+               COALESCE(SUM(CASE WHEN ref_count > 0 THEN ref_count END), 0) AS reference_count,
+               COALESCE(SUM(CASE WHEN ref_count > 0 THEN size END), 0) AS stored_bytes,
+               COALESCE(SUM(CASE WHEN ref_count > 0 THEN size * ref_count END), 0) AS referenced_bytes,
+               COUNT(CASE WHEN ref_count <= 0 THEN 1 END) AS unreferenced,
+               COALESCE(SUM(CASE WHEN ref_count <= 0 THEN size END), 0) AS unreferenced_bytes
+        FROM image_blobs
+    """).fetchone())
+    report['dedup_saved_bytes'] = report['referenced_bytes'] - report['stored_bytes']
+    report['orphan_files'], report['orphan_bytes'] = collect_orphans(conn, dry_run=True)
+    report['legacy_blobs'] = conn.execute(
+        "SELECT COUNT(*) FROM laptop_images WHERE image_hash IS NULL AND image_data IS NOT NULL").fetchone()[0]
+    return report
@@ -0,0 +1,152 @@
+import hashlib
+import io
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+
+from db import DB_PATH
+
+# --- Image store settings ---
+IMAGE_STORE = os.environ.get('IMAGE_STORE', 'filesystem')
+IMAGE_STORE_PATH = os.environ.get('IMAGE_STORE_PATH',
+                                  os.path.join(os.path.dirname(DB_PATH) or '.', 'images'))
+CHUNK_SIZE = 64 * 1024
+
+
+class ImageStore(ABC):
+    """Interface for image backends; images are addressed by the SHA-256 of their bytes"""
+
+    @abstractmethod
+    def put_stream(self, stream, key=None):
+        """Store a file-like object, return (key, size); key defaults to the content hash"""
+
+    def put_bytes(self, data, key=None):
+        """Store raw bytes, return (key, size)"""
+        return self.put_stream(io.BytesIO(data), key=key)
+
+    @abstractmethod
+    def exists(self, key):
+        pass
+
+    @abstractmethod
+    def open(self, key):
+        """Return a readable binary file object"""
+
+    def path(self, key):
+        """Local filesystem path, or None if the backend has no local files"""
+        return None
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    @abstractmethod
+    def age(self, key):
+        """Seconds since the key was last written (or re-uploaded), None if missing"""
+
+    @abstractmethod
+    def size(self, key):
+        """Stored size in bytes, None if missing"""
+
+    @abstractmethod
+    def keys(self):
+        """Iterate over every stored key"""
+
+
+class FileSystemImageStore(ImageStore):
+    """Stores images under root/ab/cd/<sha256> so identical uploads share one file"""
+
+    def __init__(self, root):
+        self.root = root
+        self._tmp_dir = os.path.join(root, 'tmp')
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def put_stream(self, stream, key=None):
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            key = key or digest.hexdigest()
+            final_path = self.path(key)
+            if os.path.exists(final_path):
+                os.remove(tmp_path)
+                # Mark the existing copy as fresh so garbage collection leaves it alone
+                os.utime(final_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return key, size
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def age(self, key):
+        try:
+            return time.time() - os.path.getmtime(self.path(key))
+        except FileNotFoundError:
+            return None
+
+    def size(self, key):
+        try:
+            return os.path.getsize(self.path(key))
+        except FileNotFoundError:
+            return None
+
+    def keys(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self._tmp_dir:
+                continue
+            yield from filenames
+
+    def disk_usage(self):
+        """(file count, total bytes) of stored images"""
+        count = total = 0
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self._tmp_dir:
+                continue
+            for name in filenames:
+                count += 1
+                total += os.path.getsize(os.path.join(dirpath, name))
+        return count, total
+
+
+IMAGE_STORES = {
+    'filesystem': lambda: FileSystemImageStore(IMAGE_STORE_PATH),
+}
+
+_store = None
+
+
+def get_image_store():
+    global _store
+    if _store is None:
+        if IMAGE_STORE not in IMAGE_STORES:
+            raise ValueError(f"Unknown IMAGE_STORE '{IMAGE_STORE}'")
+        _store = IMAGE_STORES[IMAGE_STORE]()
+    return _store
+
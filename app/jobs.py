@@ -0,0 +1,302 @@
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+from db import DB_PATH
+
+# --- Background jobs ---
+# Long admin operations (exports, Drive backups and restores, bulk duplicates)
+# run as jobs. The route records a row in jobs and returns at once, and a small
+# thread pool in the same worker process runs the handler. Status, progress and
+# result live in that row, so any worker can show them. Handlers report
+# progress through the Job they are given, and a cancel request takes effect at
+# their next report. A job whose worker died is marked interrupted once its
+# heartbeat is JOB_STALE_MINUTES old; failed, cancelled and interrupted jobs
+# can be retried.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))  # threads per worker process
+JOB_DIR = os.environ.get('JOB_DIR', os.path.join(os.path.dirname(DB_PATH) or '.', 'jobs'))  # files jobs produce
+JOB_KEEP = int(os.environ.get('JOB_KEEP', '100'))  # finished jobs kept
+JOB_STALE_MINUTES = 10
+PROGRESS_EVERY = 1.0  # seconds between progress writes
+RETRYABLE = ('failed', 'cancelled', 'interrupted')
+WORKER = f"{socket.gethostname()}:{os.getpid()}"
+
+HANDLERS = {}  # kind -> (function, title, unique)
+_executor = None
+_pending = set()  # ids submitted to this process's pool that haven't started
+_lock = threading.Lock()
+
+
+class JobError(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def init_jobs(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress_done INTEGER DEFAULT 0,
+            progress_total INTEGER,
+            message TEXT,
+            result TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_date TIMESTAMP,
+            updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_date TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+
+
+def handler(kind, title, unique=False):
+    """Register a job handler: function(job, **params, **resources) -> result dict or None.
+
+    unique jobs refuse to start while another job of their kind is queued or running.
+    """
+    def register(function):
+        HANDLERS[kind] = (function, title, unique)
+        return function
+    return register
+
+
+def title(kind):
+    return HANDLERS[kind][1] if kind in HANDLERS else kind
+
+
+class Job:
+    """What a handler gets: its id and a connection, plus progress and cancellation"""
+
+    def __init__(self, row, conn, status_conn):
+        self.id = row['id']
+        self.kind = row['kind']
+        self.conn = conn  # for the handler's own work
+        self.status_conn = status_conn  # progress commits never touch the handler's transaction
+        self.total = None
+        self.last = 0.0
+
+    def progress(self, done, total=None, message=None, force=False):
+        """Record progress (at most once per PROGRESS_EVERY unless forced); raises JobCancelled if asked to stop"""
+        if total is not None:
+            self.total = total
+        now = time.monotonic()
+        if not force and now - self.last < PROGRESS_EVERY:
+            return
+        self.last = now
+        fields = {'progress_done': done, 'progress_total': self.total}
+        if message is not None:
+            fields['message'] = message
+        _update(self.status_conn, self.id, **fields)
+        # Heartbeat for this process's queued jobs too; they are waiting, not lost
+        self.status_conn.execute("""
+            UPDATE jobs SET updated_date = CURRENT_TIMESTAMP WHERE worker = ? AND status = 'queued'
+        """, (WORKER,))
+        self.status_conn.commit()
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        row = self.status_conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.id,)).fetchone()
+        if row and row[0]:
+            raise JobCancelled()
+
+    def finish(self, status, result=None, error=None):
+        fields = dict(status=status, result=json.dumps(result) if result is not None else None, error=error,
+                      finished_date=time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()))
+        if status == 'done' and self.total is not None:
+            fields['progress_done'] = self.total
+        _update(self.status_conn, self.id, **fields)
+
+
+def _update(conn, job_id, **fields):
+    assignments = ', '.join(f"{name} = ?" for name in fields)
+    conn.execute(f"UPDATE jobs SET {assignments}, updated_date = CURRENT_TIMESTAMP WHERE id = ?",
+                 (*fields.values(), job_id))
+    conn.commit()
+
+
+def output_path(job_id, filename):
+    """Where a job writes a file for download"""
+    return os.path.join(JOB_DIR, f"{int(job_id)}-{os.path.basename(filename)}")
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+    return _executor
+
+
+def _submit(job_id, resources):
+    with _lock:
+        _pending.add(job_id)
+    _pool().submit(_run, job_id, resources)
+
+
+def _run(job_id, resources):
+    with _lock:
+        _pending.discard(job_id)
+    status_conn = db.pool.connect()
+    conn = db.pool.connect()
+    try:
+        claimed = status_conn.execute("""
+            UPDATE jobs SET status = 'running', worker = ?, started_date = CURRENT_TIMESTAMP,
+                updated_date = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'queued'
+        """, (WORKER, job_id)).rowcount
+        status_conn.commit()
+        if not claimed:  # cancelled while queued
+            return
+        row = status_conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        job = Job(row, conn, status_conn)
+        function = HANDLERS[row['kind']][0]
+        started = time.perf_counter()
+        try:
+            result = function(job, **json.loads(row['params']), **resources)
+        except JobCancelled:
+            status = 'cancelled'
+            job.finish(status, error='Cancelled')
+        except Exception as e:
+            status = 'failed'
+            traceback.print_exc()
+            job.finish(status, error=str(e) or repr(e))
+        else:
+            status = 'done'
+            job.finish(status, result=result)
+        print(f"Job {job_id} ({row['kind']}) {status} in {time.perf_counter() - started:.1f}s")
+    finally:
+        conn.close()
+        status_conn.close()
+
+
+def _interrupt_stale(conn):
+    conn.execute("""
+        UPDATE jobs SET status = 'interrupted', finished_date = CURRENT_TIMESTAMP
+        WHERE status IN ('queued', 'running') AND updated_date < datetime('now', ?)
+    """, (f"-{JOB_STALE_MINUTES} minutes",))
+
+
+def _prune(conn):
+    """Drop finished jobs beyond the newest JOB_KEEP, with their files"""
+    old = conn.execute("""
+        SELECT id, result FROM jobs WHERE status NOT IN ('queued', 'running')
+        ORDER BY id DESC LIMIT -1 OFFSET ?
+    """, (JOB_KEEP,)).fetchall()
+    for row in old:
+        filename = json.loads(row['result'] or '{}').get('file')
+        if filename and os.path.exists(output_path(row['id'], filename)):
+            os.remove(output_path(row['id'], filename))
+    conn.executemany("DELETE FROM jobs WHERE id = ?", [(row['id'],) for row in old])
+
+
+def _check_unique(conn, kind):
+    if HANDLERS[kind][2] and conn.execute("SELECT 1 FROM jobs WHERE kind = ? AND status IN ('queued', 'running')",
+                                          (kind,)).fetchone():
+        raise JobError(f"A {title(kind)} job is already running.")
+
+
+def enqueue(conn, kind, params=None, **resources):
+    """Record a job and start it in this process's pool; returns its id.
+
+    params are stored with the job and passed to the handler; resources (such as a
+    Drive client) are passed too but never stored, so a retry has to supply them again.
+    """
+    if kind not in HANDLERS:
+        raise JobError(f"Unknown job kind '{kind}'")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _interrupt_stale(conn)
+        _check_unique(conn, kind)
+        job_id = conn.execute("INSERT INTO jobs (kind, params, worker) VALUES (?, ?, ?)",
+                              (kind, json.dumps(params or {}), WORKER)).lastrowid
+        _prune(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    _submit(job_id, resources)
+    return job_id
+
+
+def retry(conn, job_id, **resources):
+    """Run a failed, cancelled or interrupted job again with the same params"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT kind, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row['status'] not in RETRYABLE:
+            raise JobError("Only failed, cancelled or interrupted jobs can be retried.")
+        _check_unique(conn, row['kind'])
+        conn.execute("""
+            UPDATE jobs SET status = 'queued', attempts = attempts + 1, cancel_requested = 0, worker = ?,
+                progress_done = 0, progress_total = NULL, message = NULL, result = NULL, error = NULL,
+                started_date = NULL, finished_date = NULL, updated_date = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (WORKER, job_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    _submit(job_id, resources)
+
+
+def cancel(conn, job_id):
+    """Cancel a queued job now, or ask a running one to stop at its next progress report"""
+    conn.execute("""
+        UPDATE jobs SET status = 'cancelled', error = 'Cancelled', finished_date = CURRENT_TIMESTAMP
+        WHERE id = ? AND status = 'queued'
+    """, (job_id,))
+    conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+    conn.commit()
+
+
+def _as_dict(row):
+    job = dict(row)
+    job['title'] = title(job['kind'])
+    job['params'] = json.loads(job['params'] or '{}')
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    job['percent'] = (min(100, round(100 * job['progress_done'] / job['progress_total']))
+                      if job['progress_total'] else None)
+    return job
+
+
+def get(conn, job_id):
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _as_dict(row) if row else None
+
+
+def recent(conn, limit=JOB_KEEP):
+    return [_as_dict(row) for row in conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))]
+
+
+def shutdown(wait=True):
+    """Stop this process's pool; jobs that haven't started are marked interrupted"""
+    with _lock:
+        executor, pending = _executor, sorted(_pending)
+    if executor is None:
+        return
+    executor.shutdown(wait=False, cancel_futures=True)
+    if pending:
+        conn = db.pool.connect()
+        try:
+            conn.executemany("UPDATE jobs SET status = 'interrupted', finished_date = CURRENT_TIMESTAMP "
+                             "WHERE id = ? AND status = 'queued'", [(job_id,) for job_id in pending])
+            conn.commit()
+        finally:
+            conn.close()
+    if wait:
+        executor.shutdown(wait=True)
@@ -0,0 +1,145 @@
+import bisect
+import os
+import threading
+import time
+
+from flask import g, request
+
+import db
+import page_cache
+
+# --- Request metrics ---
+# Every request records its latency, SQL statement count, SQL time and response
+# size per route (the URL rule, so /guest/laptop/<int:laptop_id> is one route).
+# SQL numbers come from db.TimedConnection on the request's pooled connection.
+# Metrics live in each worker process; the pid is a label so series from
+# different gunicorn workers never mix.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # lets Prometheus scrape without an admin session
+PREFIX = 'laptop_inventory'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+SQL_TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+RESPONSE_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """Cumulative-bucket histogram per route, rendered in Prometheus text format"""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}  # route -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, route, value):
+        series = self.series.get(route)
+        if series is None:
+            series = self.series[route] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self, labels):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for route, series in sorted(self.series.items()):
+            route_labels = f'{labels},route="{route}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{route_labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{route_labels}}} {round(series[-1], 6)}")
+            lines.append(f"{self.name}_count{{{route_labels}}} {cumulative}")
+        return lines
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = {}  # (route, method, status) -> count
+        self.latency = Histogram(f"{PREFIX}_request_duration_seconds",
+                                 "Time from the start of the request to the finished response.", LATENCY_BUCKETS)
+        self.sql_statements = Histogram(f"{PREFIX}_request_sql_statements",
+                                        "SQL statements run per request (executemany counts once).",
+                                        SQL_STATEMENT_BUCKETS)
+        self.sql_time = Histogram(f"{PREFIX}_request_sql_seconds",
+                                  "Time spent in SQLite per request, including fetches and commits.",
+                                  SQL_TIME_BUCKETS)
+        self.response_size = Histogram(f"{PREFIX}_response_size_bytes",
+                                       "Response body size (streamed responses are not counted).",
+                                       RESPONSE_SIZE_BUCKETS)
+
+    def record(self, route, method, status, seconds, statements, sql_seconds, size):
+        with self.lock:
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.observe(route, seconds)
+            self.sql_statements.observe(route, statements)
+            self.sql_time.observe(route, sql_seconds)
+            if size is not None:
+                self.response_size.observe(route, size)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        labels = f'worker="{os.getpid()}"'
+        with self.lock:
+            lines = [f"# HELP {PREFIX}_requests_total Requests handled, by route, method and status.",
+                     f"# TYPE {PREFIX}_requests_total counter"]
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(f'{PREFIX}_requests_total{{{labels},route="{route}",method="{method}",'
+                             f'status="{status}"}} {count}')
+            for histogram in (self.latency, self.sql_statements, self.sql_time, self.response_size):
+                lines += histogram.render(labels)
+
+        pool = db.pool.stats()
+        cache = page_cache.cache.stats()
+        gauges = [
+            ('process_start_time_seconds', 'gauge', "Unix time the worker started.", self.started),
+            ('db_pool_connections', 'gauge', "Open pooled SQLite connections.", pool['open']),
+            ('db_pool_in_use', 'gauge', "Pooled connections leased right now.", pool['in_use']),
+            ('db_pool_waits_total', 'counter', "Requests that waited for a free connection.", pool['waits']),
+            ('db_pool_timeouts_total', 'counter', "Requests that gave up waiting for a connection.", pool['timeouts']),
+            ('db_pool_wait_seconds_total', 'counter', "Time spent waiting for a connection.",
+             pool['total_wait_ms'] / 1000),
+            ('page_cache_hits_total', 'counter', "Shop pages served from the page cache.", cache['hits']),
+            ('page_cache_misses_total', 'counter', "Shop pages rendered because the cache had no entry.",
+             cache['misses']),
+            ('page_cache_bytes', 'gauge', "Size of the cached pages.", cache['bytes']),
+        ]
+        for name, kind, help_text, value in gauges:
+            lines += [f"# HELP {PREFIX}_{name} {help_text}", f"# TYPE {PREFIX}_{name} {kind}",
+                      f"{PREFIX}_{name}{{{labels}}} {value}"]
+        return '\n'.join(lines) + '\n'
+
+
+metrics = RequestMetrics()
+
+
+def token_ok(authorization):
+    return bool(METRICS_TOKEN) and authorization == f"Bearer {METRICS_TOKEN}"
+
+
+def _start_timer():
+    g._request_started = time.perf_counter()
+
+
+def _record(response):
+    started = g.pop('_request_started', None)
+    if started is None:
+        return response
+    conn = g.get('_db_conn')
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.record(route, request.method, response.status_code, time.perf_counter() - started,
+                   getattr(conn, 'sql_statements', 0), getattr(conn, 'sql_time', 0.0),
+                   response.content_length)
+    return response
+
+
+def init_app(app):
+    """Time every request and time SQL on pooled connections (unless METRICS_ENABLED=0)"""
+    if not METRICS_ENABLED:
+        return
+    db.pool.factory = db.TimedConnection
+    app.before_request(_start_timer)
+    app.after_request(_record)
@@ -0,0 +1,298 @@
+"""Versioned schema migrations.
+
+Each migration runs once, in order, inside its own write transaction and is
+recorded in schema_version. Run them with `flask migrate-db`; gunicorn runs it
+once before starting workers, and workers only read the current version.
+"""
+from datetime import datetime
+
+import search
+import backups
+import cart
+import image_refs
+import jobs
+import page_cache
+import profiler
+import stats
+from serials import date_prefix_for, format_serial
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_columns(conn, table, columns):
+    """Add any of the (name, type) columns the table doesn't have yet"""
+    existing = _columns(conn, table)
+    for column_name, column_type in columns:
+        if column_name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column_name} {column_type}")
+
+
+def initial_schema(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS laptops (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        laptop_name TEXT,
+        cpu TEXT,
+        ram TEXT,
+        storage TEXT,
+        os TEXT,
+        notes TEXT,
+        price_bought REAL,
+        price_to_sell REAL,
+        fees REAL,
+        image TEXT,
+        image_data BLOB,
+        image_mimetype TEXT,
+        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_edited TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        date_sold TEXT,
+        sold INTEGER DEFAULT 0,
+        serial_number TEXT UNIQUE,
+        warranty_start_date TEXT,
+        warranty_duration_days INTEGER DEFAULT 0,
+        warranty_notes TEXT,
+        ram_type TEXT,
+        ram_speed TEXT,
+        storage_type TEXT
+    )
+    """)
+
+    # Databases created by older versions are missing some of these
+    _add_columns(conn, "laptops", [
+        ("image_data", "BLOB"),
+        ("image_mimetype", "TEXT"),
+        ("serial_number", "TEXT"),
+        ("warranty_start_date", "TEXT"),
+        ("warranty_duration_days", "INTEGER DEFAULT 0"),
+        ("warranty_notes", "TEXT"),
+        ("ram_type", "TEXT"),
+        ("ram_speed", "TEXT"),
+        ("storage_type", "TEXT"),
+    ])
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS spareparts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        part_type TEXT,
+        storage_type TEXT,
+        ram_type TEXT,
+        ram_speed TEXT,
+        capacity TEXT,
+        notes TEXT,
+        quantity INTEGER DEFAULT 1,
+        price REAL DEFAULT 0,
+        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_edited TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    _add_columns(conn, "spareparts", [("price", "REAL DEFAULT 0")])
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS laptop_spareparts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        laptop_id INTEGER,
+        sparepart_id INTEGER,
+        installed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        price_at_time REAL DEFAULT 0,
+        FOREIGN KEY (laptop_id) REFERENCES laptops(id),
+        FOREIGN KEY (sparepart_id) REFERENCES spareparts(id)
+    )
+    """)
+    _add_columns(conn, "laptop_spareparts", [("price_at_time", "REAL DEFAULT 0")])
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS laptop_images (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        laptop_id INTEGER,
+        image_data BLOB,
+        image_mimetype TEXT,
+        image_name TEXT,
+        is_primary INTEGER DEFAULT 0,
+        uploaded_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        image_hash TEXT,
+        FOREIGN KEY (laptop_id) REFERENCES laptops(id)
+    )
+    """)
+    # Images written to the image store keep only their content hash in the row
+    _add_columns(conn, "laptop_images", [("image_hash", "TEXT")])
+
+    # Users table for admin/guest authentication
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL DEFAULT 'guest',
+        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guest_name TEXT,
+        guest_email TEXT,
+        guest_phone TEXT,
+        status TEXT DEFAULT 'unconfirmed',
+        total_amount REAL DEFAULT 0,
+        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        confirmed_date TIMESTAMP,
+        completed_date TIMESTAMP,
+        notes TEXT
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS order_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER,
+        laptop_id INTEGER,
+        quantity INTEGER DEFAULT 1,
+        price REAL,
+        FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+        FOREIGN KEY (laptop_id) REFERENCES laptops(id)
+    )
+    """)
+
+    # Guest spare parts selection
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cart_spareparts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            laptop_id INTEGER NOT NULL,
+            sparepart_id INTEGER NOT NULL,
+            quantity INTEGER DEFAULT 1,
+            added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (laptop_id) REFERENCES laptops (id),
+            FOREIGN KEY (sparepart_id) REFERENCES spareparts (id)
+        )
+    """)
+
+    # Guest laptop cart
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cart (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            laptop_id INTEGER NOT NULL,
+            quantity INTEGER DEFAULT 1,
+            added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (laptop_id) REFERENCES laptops (id)
+        )
+    """)
+
+    # Secondary indexes for the lookups every page does
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_laptop_images_laptop ON laptop_images (laptop_id, is_primary)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_laptop_spareparts_laptop ON laptop_spareparts (laptop_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cart_spareparts_session ON cart_spareparts (session_id, laptop_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cart_session ON cart (session_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_email ON orders (guest_email)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status, created_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_laptops_sold_created ON laptops (sold, created_date)")
+
+    # Insert default admin user if not exists
+    admin_exists = conn.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'").fetchone()[0]
+    if admin_exists == 0:
+        conn.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+                     ('admin', 'admin123', 'admin'))
+        print("Default admin user created: admin / admin123")
+
+
+def full_text_search(conn):
+    search.init_search_index(conn)
+
+
+# Highest number already used per brand+month prefix (serials look like DE092501)
+MAX_SERIALS_SQL = """
+    SELECT substr(serial_number, 1, 6) AS date_prefix,
+           MAX(CAST(substr(serial_number, 7) AS INTEGER)) AS last_number
+    FROM laptops
+    WHERE serial_number GLOB '[A-Z][A-Z][0-9][0-9][0-9][0-9][0-9]*'
+    GROUP BY substr(serial_number, 1, 6)
+"""
+
+
+def backfill_serial_numbers(conn):
+    """Add serial numbers to laptops created before serials existed"""
+    laptops = conn.execute("SELECT id, laptop_name FROM laptops WHERE serial_number IS NULL OR serial_number = '' ORDER BY id").fetchall()
+    if not laptops:
+        return
+    print(f"Migrating {len(laptops)} laptops to use serial numbers...")
+    last_numbers = {row['date_prefix']: row['last_number'] for row in conn.execute(MAX_SERIALS_SQL)}
+    now = datetime.now()
+    for laptop in laptops:
+        date_prefix = date_prefix_for(laptop['laptop_name'] or '', now)
+        last_numbers[date_prefix] = last_numbers.get(date_prefix, 0) + 1
+        serial = format_serial(date_prefix, last_numbers[date_prefix])
+        conn.execute("UPDATE laptops SET serial_number = ? WHERE id = ?", (serial, laptop['id']))
+        print(f"Laptop ID {laptop['id']} -> Serial {serial}")
+
+
+def serial_counters(conn):
+    """Per brand+month counters so a new serial is one row update instead of a scan"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS serial_counters (
+            date_prefix TEXT PRIMARY KEY,
+            last_number INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute(f"""
+        INSERT OR REPLACE INTO serial_counters (date_prefix, last_number)
+        SELECT date_prefix, last_number FROM ({MAX_SERIALS_SQL})
+    """)
+
+
+# Append new migrations at the end; never renumber or edit applied ones
+MIGRATIONS = [
+    (1, "initial schema and indexes", initial_schema),
+    (2, "full-text search index", full_text_search),
+    (3, "serial numbers for existing laptops", backfill_serial_numbers),
+    (4, "serial number counters", serial_counters),
+    (5, "dashboard counters", stats.init_stats),
+    (6, "inventory version for the shop page cache", page_cache.init_inventory_version),
+    (7, "server-side cart store", cart.init_cart_store),
+    (8, "image reference counts", image_refs.init_image_refs),
+    (9, "request profiler", profiler.init_profiler),
+    (10, "Google Drive backup runs", backups.init_backups),
+    (11, "background jobs", jobs.init_jobs),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='schema_version'").fetchone()
+    if not exists:
+        return 0
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations, each in its own transaction. Returns the versions applied."""
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    applied = []
+    for version, name, migration in MIGRATIONS:
+        # BEGIN IMMEDIATE takes the write lock, so parallel workers apply each step once
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone():
+                conn.rollback()
+                continue
+            migration(conn)
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
@@ -0,0 +1,105 @@
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+# --- Versioned cache for the public shop pages ---
+# Entries are keyed by route + arguments and are only valid for one inventory
+# version. Triggers bump inventory_version on any write to the tables the shop
+# shows, so every worker process sees the change on its next request.
+PAGE_CACHE_BYTES = int(os.environ.get('PAGE_CACHE_BYTES', str(32 * 1024 * 1024)))
+VERSIONED_TABLES = ('laptops', 'spareparts', 'laptop_images', 'laptop_spareparts')
+
+
+def init_inventory_version(conn):
+    """Create the inventory_version row and the triggers that bump it"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS inventory_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO inventory_version (id, version) VALUES (1, 0)")
+    for table in VERSIONED_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+                    UPDATE inventory_version SET version = version + 1 WHERE id = 1;
+                END
+            """)
+
+
+def inventory_version(conn):
+    row = conn.execute("SELECT version FROM inventory_version WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+def plain(rows):
+    """sqlite3.Row objects -> dicts so they can be cached and measured"""
+    if rows is None:
+        return None
+    if hasattr(rows, 'keys'):
+        return dict(rows)
+    return [dict(row) for row in rows]
+
+
+class PageCache:
+    """LRU cache with a byte budget that drops everything when the version changes"""
+
+    def __init__(self, max_bytes=PAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.version = None
+        self.entries = OrderedDict()  # key -> (size, value)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get_or_build(self, key, version, build):
+        """Cached value for key at this version, calling build() on a miss"""
+        if self.max_bytes <= 0:
+            return build()
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.bytes = 0
+                self.version = version
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = build()
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return value
+        with self.lock:
+            if version != self.version or key in self.entries:
+                return value
+            self.entries[key] = (size, value)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (old_size, _) = self.entries.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+        return value
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "version": self.version,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+cache = PageCache()
@@ -0,0 +1,97 @@
+import base64
+import json
+import os
+import threading
+import time
+
+# --- Keyset pagination settings ---
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = 500
+COUNT_CACHE_TTL = float(os.environ.get('COUNT_CACHE_TTL', '30'))  # seconds
+
+
+def encode_cursor(sort_value, row_id):
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(sort_value, row_id) from a cursor token, or None if it is missing/garbled"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort_value, row_id = json.loads(raw)
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def page_size_arg(value):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+# --- Cached totals ---
+_count_cache = {}
+_count_lock = threading.Lock()
+
+
+def cached_aggregate(conn, sql, params=()):
+    """Run an aggregate query, reusing the result for COUNT_CACHE_TTL seconds"""
+    key = (sql, tuple(params))
+    now = time.monotonic()
+    with _count_lock:
+        hit = _count_cache.get(key)
+        if hit and now - hit[0] < COUNT_CACHE_TTL:
+            return hit[1]
+    row = conn.execute(sql, params).fetchone()
+    result = dict(row) if hasattr(row, 'keys') else tuple(row)
+    with _count_lock:
+        if len(_count_cache) > 1000:
+            _count_cache.clear()
+        _count_cache[key] = (now, result)
+    return result
+
+
+def keyset_page(conn, select, from_where, params, sort_expr, id_expr, order='asc',
+                after=None, before=None, page_size=PAGE_SIZE, nullable=True):
+    """Fetch one page ordered by (sort_expr, id_expr) without OFFSET.
+
+    from_where is "FROM ... WHERE ..." (always with a WHERE clause); the keyset
+    condition is appended to it, so any page costs the same as the first one.
+    Nullable sort values are wrapped in IFNULL(..., '') so NULLs get a stable
+    position; pass nullable=False for NOT NULL columns so an index can be used.
+    Returns (rows, next_cursor, prev_cursor).
+    """
+    key_expr = f"IFNULL({sort_expr}, '')" if nullable else sort_expr
+    ascending = order == 'asc'
+    cursor = decode_cursor(before) or decode_cursor(after)
+    backwards = decode_cursor(before) is not None
+
+    sql = f"SELECT {select}, {key_expr} AS _sort_key, {id_expr} AS _row_id {from_where}"
+    query_params = list(params)
+    if cursor:
+        # Going forward in an ascending list means "greater than the cursor", and so on
+        op = '>' if ascending != backwards else '<'
+        sql += f" AND ({key_expr}, {id_expr}) {op} (?, ?)"
+        query_params += [cursor[0], cursor[1]]
+    direction = 'ASC' if ascending != backwards else 'DESC'
+    sql += f" ORDER BY {key_expr} {direction}, {id_expr} {direction} LIMIT ?"
+    query_params.append(page_size + 1)
+
+    rows = conn.execute(sql, query_params).fetchall()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor is not None, has_more
+
+    next_cursor = encode_cursor(rows[-1]['_sort_key'], rows[-1]['_row_id']) if rows and has_next else None
+    prev_cursor = encode_cursor(rows[0]['_sort_key'], rows[0]['_row_id']) if rows and has_prev else None
+    return rows, next_cursor, prev_cursor
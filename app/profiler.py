@@ -0,0 +1,217 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+import db
+from db import DB_PATH, get_db
+
+# --- On-demand request profiler ---
+# An admin arms a route in profiler_targets: profile the next N requests, or a
+# sampled fraction of them, until an expiry time. The table is shared, so every
+# gunicorn worker takes part; each profile is claimed with one UPDATE so the
+# count holds across workers. A profiled request runs under cProfile while a
+# helper thread samples its stack for a flamegraph. With nothing armed a request
+# costs one clock check; workers re-read the table every PROFILER_POLL seconds.
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(DB_PATH) or '.', 'profiles'))
+PROFILER_POLL = float(os.environ.get('PROFILER_POLL', '2'))  # seconds
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', '0.001'))  # seconds between stack samples
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '50'))
+TOP_FUNCTIONS = 8
+
+_targets = {}  # route -> sample rate, as last read from profiler_targets
+_next_poll = 0.0
+_poll_lock = threading.Lock()
+
+
+def init_profiler(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS profiler_targets (
+            route TEXT PRIMARY KEY,
+            sample_rate REAL NOT NULL DEFAULT 1,
+            remaining INTEGER NOT NULL DEFAULT 1,
+            expires_date TIMESTAMP NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS request_profiles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            route TEXT,
+            method TEXT,
+            path TEXT,
+            status INTEGER,
+            duration_ms REAL,
+            samples INTEGER,
+            top_functions TEXT,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def arm(conn, route, sample_rate=1.0, count=1, minutes=10):
+    """Profile up to `count` requests to `route`, each with probability sample_rate"""
+    global _next_poll
+    conn.execute("""
+        INSERT INTO profiler_targets (route, sample_rate, remaining, expires_date)
+        VALUES (?, ?, ?, datetime('now', ?))
+        ON CONFLICT(route) DO UPDATE SET sample_rate = excluded.sample_rate,
+            remaining = excluded.remaining, expires_date = excluded.expires_date
+    """, (route, min(max(sample_rate, 0.0), 1.0), count, f"+{minutes} minutes"))
+    conn.commit()
+    _next_poll = 0.0
+
+
+def disarm(conn, route):
+    global _next_poll
+    conn.execute("DELETE FROM profiler_targets WHERE route = ?", (route,))
+    conn.commit()
+    _next_poll = 0.0
+
+
+def targets(conn):
+    return conn.execute("""
+        SELECT route, sample_rate, remaining, expires_date FROM profiler_targets
+        WHERE remaining > 0 AND expires_date > CURRENT_TIMESTAMP ORDER BY route
+    """).fetchall()
+
+
+def _armed_rate(route):
+    """Sample rate for the route, or None; hits the database at most once per poll interval"""
+    global _targets, _next_poll
+    now = time.monotonic()
+    if now >= _next_poll:
+        with _poll_lock:
+            if now >= _next_poll:
+                try:
+                    _targets = {row['route']: row['sample_rate'] for row in targets(get_db())}
+                except sqlite3.OperationalError:  # schema not migrated yet
+                    _targets = {}
+                _next_poll = now + PROFILER_POLL
+    return _targets.get(route)
+
+
+def _claim(route):
+    """Take one profile from the route's budget; False if another worker used it up"""
+    conn = get_db()
+    claimed = conn.execute("""
+        UPDATE profiler_targets SET remaining = remaining - 1
+        WHERE route = ? AND remaining > 0 AND expires_date > CURRENT_TIMESTAMP
+    """, (route,)).rowcount
+    conn.commit()
+    return claimed > 0
+
+
+class StackSampler(threading.Thread):
+    """Counts the call stacks of one thread, in collapsed (flamegraph) form"""
+
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        super().__init__(daemon=True, name='profile-sampler')
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def _start():
+    if request.url_rule is None or not _targets and time.monotonic() < _next_poll:
+        return
+    route = request.url_rule.rule
+    rate = _armed_rate(route)
+    if rate is None or random.random() >= rate or not _claim(route):
+        return
+    g._profile_sampler = StackSampler(threading.get_ident())
+    g._profile = cProfile.Profile()
+    g._profile_started = time.perf_counter()
+    g._profile_sampler.start()
+    g._profile.enable()
+
+
+def _finish(response):
+    profile = g.pop('_profile', None)
+    if profile is None:
+        return response
+    profile.disable()
+    duration = time.perf_counter() - g.pop('_profile_started')
+    sampler = g.pop('_profile_sampler')
+    sampler.stop()
+    # Own connection, so nothing the view left uncommitted is committed with the profile
+    conn = db.pool.connect()
+    try:
+        save(conn, profile, sampler.stacks, request.url_rule.rule, request.method, request.full_path.rstrip('?'),
+             response.status_code, duration)
+    finally:
+        conn.close()
+    return response
+
+
+def top_functions(stats, limit=TOP_FUNCTIONS):
+    """'own ms / cumulative ms  function (file:line)' for the functions with the most own time"""
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    return [f"{tottime * 1000:.1f} / {cumtime * 1000:.1f} ms  {name} ({os.path.basename(filename)}:{line})"
+            for (filename, line, name), (_, _, tottime, cumtime, _) in rows]
+
+
+def save(conn, profile, stacks, route, method, path, status, duration):
+    """Store one profile: a row for the list plus .prof and .collapsed files"""
+    stats = pstats.Stats(profile, stream=io.StringIO())
+    cursor = conn.execute("""
+        INSERT INTO request_profiles (route, method, path, status, duration_ms, samples, top_functions)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (route, method, path, status, round(duration * 1000, 1), sum(stacks.values()),
+          '\n'.join(top_functions(stats))))
+    profile_id = cursor.lastrowid
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stats.dump_stats(profile_path(profile_id, 'prof'))
+    with open(profile_path(profile_id, 'collapsed'), 'w') as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    # Keep the newest PROFILE_KEEP
+    old = [row[0] for row in conn.execute("SELECT id FROM request_profiles ORDER BY id DESC LIMIT -1 OFFSET ?",
+                                          (PROFILE_KEEP,))]
+    for old_id in old:
+        for kind in ('prof', 'collapsed'):
+            try:
+                os.remove(profile_path(old_id, kind))
+            except FileNotFoundError:
+                pass
+    conn.executemany("DELETE FROM request_profiles WHERE id = ?", [(old_id,) for old_id in old])
+    conn.commit()
+    return profile_id
+
+
+def profile_path(profile_id, kind):
+    return os.path.join(PROFILE_DIR, f"request-{int(profile_id)}.{kind}")
+
+
+def recent(conn, limit=PROFILE_KEEP):
+    rows = conn.execute("SELECT * FROM request_profiles ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return [dict(row, top_functions=(row['top_functions'] or '').splitlines()) for row in rows]
+
+
+def init_app(app):
+    app.before_request(_start)
+    app.after_request(_finish)
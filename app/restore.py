@@ -0,0 +1,187 @@
+import gzip
+import os
+import re
+import sqlite3
+import tarfile
+import time
+
+import db
+import jobs
+import migrations
+import page_cache
+from backups import BACKUP_DIR, BACKUP_IMAGES_NAME, BACKUP_NAME, LEGACY_BACKUP_NAME, copy_chunks
+from image_store import get_image_store
+
+# --- Restoring the database from Drive ---
+# A restore never writes to the live file until the backup has been checked.
+# The backup is downloaded and unpacked into BACKUP_DIR, then checked with
+# PRAGMA integrity_check and migrated if it is older. Only then is it copied
+# over the live database with the backup API, as one write transaction. Every
+# connection in every worker sees either the old database or the restored one,
+# and an interrupted restore leaves the live database as it was. The backup's
+# photos are added to the image store before the swap, so the restored
+# database never refers to a missing file; files already there are kept.
+REQUIRED_TABLES = ('laptops',)  # backups from before migrations have no schema_version; they are migrated
+LIVE_TABLES = ('jobs', 'drive_backups')  # kept from the live database
+IMAGE_HASH = re.compile(r'[0-9a-f]{64}')
+
+
+class RestoreError(Exception):
+    pass
+
+
+def download(client, path, progress=None):
+    """Fetch the newest backup into path; returns whether it is gzipped, or None if there is none"""
+    file_id = client.find(BACKUP_NAME)
+    compressed = file_id is not None
+    if not compressed:
+        file_id = client.find(LEGACY_BACKUP_NAME)
+    if not file_id:
+        return None
+    with open(path, 'wb') as fh:
+        client.download(file_id, fh, progress)
+    return compressed
+
+
+def unpack(path, target_path):
+    try:
+        with gzip.open(path, 'rb') as src, open(target_path, 'wb') as dst:
+            copy_chunks(src, dst)
+    except (OSError, EOFError) as e:
+        raise RestoreError(f"The backup is not a valid gzip file: {e}")
+
+
+def verify(conn):
+    """Raise RestoreError unless the file is an intact database this version can run; returns its schema version"""
+    try:
+        result = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    except sqlite3.DatabaseError as e:
+        raise RestoreError(f"The backup is not a SQLite database: {e}")
+    if result != ['ok']:
+        raise RestoreError("The backup failed the integrity check: " + '; '.join(result[:5]))
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    missing = [table for table in REQUIRED_TABLES if table not in tables]
+    if missing:
+        raise RestoreError(f"The backup has no {', '.join(missing)} table")
+    version = migrations.current_version(conn)
+    if version > migrations.LATEST_VERSION:
+        raise RestoreError(f"The backup has schema version {version}, newer than this app "
+                           f"({migrations.LATEST_VERSION}); update the app first")
+    return version
+
+
+def prepare(conn, live):
+    """Bring the checked copy up to date and make it fit the live database"""
+    conn.execute("PRAGMA journal_mode=DELETE")
+    migrations.migrate(conn)
+    # Cached shop pages belong to the old database; a new version drops them in every worker
+    version = max(page_cache.inventory_version(conn), page_cache.inventory_version(live)) + 1
+    conn.execute("UPDATE inventory_version SET version = ? WHERE id = 1", (version,))
+    # Job and backup history describe this installation, not the backup: keep the live rows
+    for table in LIVE_TABLES:
+        conn.execute(f"DELETE FROM {table}")
+        rows = live.execute(f"SELECT * FROM {table}").fetchall()
+        if rows:
+            columns = [column[0] for column in live.execute(f"SELECT * FROM {table} LIMIT 0").description]
+            conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                             rows)
+    conn.commit()
+    # The backup API can't copy into a WAL database with a different page size
+    page_size = live.execute("PRAGMA page_size").fetchone()[0]
+    if conn.execute("PRAGMA page_size").fetchone()[0] != page_size:
+        conn.execute(f"PRAGMA page_size={page_size}")
+        conn.execute("VACUUM")
+
+
+def restore_images(path, progress=None):
+    """Add the archive's photos that the image store lacks; returns (added, already there)"""
+    store = get_image_store()
+    added = present = 0
+    try:
+        with tarfile.open(path, 'r') as tar:
+            for done, member in enumerate(tar, 1):
+                if not member.isfile() or not IMAGE_HASH.fullmatch(member.name):
+                    raise RestoreError(f"Unexpected entry in the photo backup: {member.name!r}")
+                if store.exists(member.name):
+                    present += 1
+                else:
+                    key, _ = store.put_stream(tar.extractfile(member))
+                    if key != member.name:
+                        store.delete(key)
+                        raise RestoreError(f"The backed-up photo {member.name} is damaged")
+                    added += 1
+                if progress:
+                    progress(done)
+    except tarfile.TarError as e:
+        raise RestoreError(f"The photo backup is not a valid tar file: {e}")
+    return added, present
+
+
+def swap(path, live):
+    """Replace the live database's content with the file's, in one transaction"""
+    source = sqlite3.connect(path)
+    try:
+        source.backup(live)  # waits for the write lock, then copies every page
+    finally:
+        source.close()
+
+
+def restore_from_drive(client, db_path=None, progress=None):
+    """Download, check and install the newest Drive backup; None if Drive has no backup"""
+    started = time.perf_counter()
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    download_path = os.path.join(BACKUP_DIR, f"restore-{os.getpid()}.download")
+    restored_path = os.path.join(BACKUP_DIR, f"restore-{os.getpid()}.db")
+    images_path = os.path.join(BACKUP_DIR, f"restore-{os.getpid()}.tar")
+    try:
+        compressed = download(client, download_path, progress)
+        if compressed is None:
+            return None
+        if compressed:
+            unpack(download_path, restored_path)
+            os.remove(download_path)
+        else:
+            os.replace(download_path, restored_path)
+
+        conn = sqlite3.connect(restored_path)
+        conn.row_factory = sqlite3.Row
+        live = db.pool.connect() if db_path is None else sqlite3.connect(db_path)
+        try:
+            version = verify(conn)
+            prepare(conn, live)
+            conn.close()
+            images_id = client.find(BACKUP_IMAGES_NAME)  # None for backups from before photos were included
+            images_added = 0
+            if images_id:
+                with open(images_path, 'wb') as fh:
+                    client.download(images_id, fh, progress)
+                images_added, _ = restore_images(images_path)
+            swap(restored_path, live)
+        finally:
+            conn.close()
+            live.close()
+        # Drain the pool: idle connections are reopened, so none keeps state from the old database
+        db.pool.close_idle()
+        summary = {
+            'bytes': os.path.getsize(restored_path),
+            'schema_version': version,
+            'migrated': version < migrations.LATEST_VERSION,
+            'images_added': images_added,
+            'seconds': round(time.perf_counter() - started, 1),
+        }
+        print(f"Restored the database from Drive: {summary}")
+        return summary
+    finally:
+        for path in (download_path, restored_path, restored_path + '-journal', images_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+@jobs.handler('drive_restore', 'Restore from Google Drive', unique=True)
+def restore_job(job, client):
+    summary = restore_from_drive(client, progress=lambda done: job.progress(done, message='download'))
+    if summary is None:
+        raise RestoreError(f"No {BACKUP_NAME} found in your Google Drive.")
+    return {'summary': f"{summary['bytes'] / 1e6:.1f} MB database and {summary['images_added']} missing photos "
+                       f"restored in {summary['seconds']}s"
+                       f"{', migrated to the current schema' if summary['migrated'] else ''}"}
@@ -0,0 +1,77 @@
+import re
+import sqlite3
+
+# --- Full-text search over laptops (SQLite FTS5) ---
+FTS_COLUMNS = ('laptop_name', 'cpu', 'ram', 'storage', 'os')
+# bm25 weights in FTS_COLUMNS order: a hit in the name counts most
+RANK_EXPRESSION = "bm25(laptops_fts, 5.0, 2.0, 1.0, 1.0, 1.0)"
+
+fts_available = False
+
+
+def init_search_index(conn):
+    """Create laptops_fts and its sync triggers; fill it the first time. Returns False without FTS5."""
+    global fts_available
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name='laptops_fts'").fetchone()
+    columns = ', '.join(FTS_COLUMNS)
+    new_columns = ', '.join(f"new.{c}" for c in FTS_COLUMNS)
+    old_columns = ', '.join(f"old.{c}" for c in FTS_COLUMNS)
+    try:
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS laptops_fts USING fts5(
+                {columns}, content='laptops', content_rowid='id', prefix='2 3'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"Full-text search disabled ({e}); falling back to LIKE")
+        fts_available = False
+        return False
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS laptops_fts_insert AFTER INSERT ON laptops BEGIN
+            INSERT INTO laptops_fts(rowid, {columns}) VALUES (new.id, {new_columns});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS laptops_fts_delete AFTER DELETE ON laptops BEGIN
+            INSERT INTO laptops_fts(laptops_fts, rowid, {columns}) VALUES ('delete', old.id, {old_columns});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS laptops_fts_update AFTER UPDATE OF {columns} ON laptops BEGIN
+            INSERT INTO laptops_fts(laptops_fts, rowid, {columns}) VALUES ('delete', old.id, {old_columns});
+            INSERT INTO laptops_fts(rowid, {columns}) VALUES (new.id, {new_columns});
+        END
+    """)
+    if not exists:
+        conn.execute("INSERT INTO laptops_fts(laptops_fts) VALUES ('rebuild')")
+    fts_available = True
+    return True
+
+
+def detect_search_index(conn):
+    """Enable FTS queries if the index exists (no DDL)"""
+    global fts_available
+    fts_available = conn.execute("SELECT 1 FROM sqlite_master WHERE name='laptops_fts'").fetchone() is not None
+    return fts_available
+
+
+def match_expression(search):
+    """Turn free text into an FTS5 query: every word must match, each as a prefix"""
+    terms = re.findall(r"\w+", search.lower())
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_filter(search, alias='l'):
+    """SQL pieces for filtering laptops by a search box value.
+
+    Returns (join, where, params, rank). rank is an ORDER BY expression
+    (lower is better) or None when falling back to LIKE.
+    """
+    expression = match_expression(search) if fts_available else ''
+    if expression:
+        return (f" JOIN laptops_fts ON laptops_fts.rowid = {alias}.id",
+                " AND laptops_fts MATCH ?",
+                [expression],
+                RANK_EXPRESSION)
+    like = ' OR '.join(f"{alias}.{c} LIKE ?" for c in FTS_COLUMNS)
+    return "", f" AND ({like})", [f"%{search}%"] * len(FTS_COLUMNS), None
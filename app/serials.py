@@ -0,0 +1,78 @@
+from datetime import datetime
+
+from db import get_db
+
+
+def brand_prefix(laptop_name):
+    """Two-letter brand code detected from the laptop name"""
+    laptop_name_lower = laptop_name.lower()
+
+    # Brand mapping
+    if 'asus' in laptop_name_lower or 'asuspro' in laptop_name_lower:
+        return 'AS'
+    elif 'dell' in laptop_name_lower:
+        return 'DE'
+    elif 'lenovo' in laptop_name_lower:
+        return 'LE'
+    elif 'thinkpad' in laptop_name_lower:
+        return 'TH'
+    elif 'hp' in laptop_name_lower or 'hewlett' in laptop_name_lower:
+        return 'HP'
+    elif 'acer' in laptop_name_lower:
+        return 'AC'
+    elif 'msi' in laptop_name_lower:
+        return 'MS'
+    elif 'macbook' in laptop_name_lower or 'apple' in laptop_name_lower:
+        return 'AP'
+    elif 'microsoft' in laptop_name_lower or 'surface' in laptop_name_lower:
+        return 'SF'
+    elif 'samsung' in laptop_name_lower:
+        return 'SM'
+    return 'GN'  # Generic
+
+
+def date_prefix_for(laptop_name, now=None):
+    """Brand code + MMYY, e.g. DE0925 for a Dell added in September 2025"""
+    now = now or datetime.now()
+    return f"{brand_prefix(laptop_name)}{now.strftime('%m%y')}"
+
+
+def format_serial(date_prefix, number):
+    # Format: PREFIX + MMYY + 2-digit number (3+ digits past 99)
+    return f"{date_prefix}{number:02d}"
+
+
+def allocate_serial_block(conn, date_prefix, count=1):
+    """Reserve `count` consecutive numbers for a prefix; returns the first one.
+
+    The counter row is bumped inside the caller's transaction, so the write lock
+    is held until the caller commits and a rollback hands the numbers back.
+    """
+    conn.execute("""
+        INSERT INTO serial_counters (date_prefix, last_number) VALUES (?, ?)
+        ON CONFLICT(date_prefix) DO UPDATE SET last_number = last_number + excluded.last_number
+    """, (date_prefix, count))
+    last_number = conn.execute("SELECT last_number FROM serial_counters WHERE date_prefix = ?",
+                               (date_prefix,)).fetchone()[0]
+    return last_number - count + 1
+
+
+def generate_serial_numbers(laptop_names, conn=None):
+    """Serial numbers for several laptops, one counter update per brand"""
+    if conn is None:
+        conn = get_db()
+    now = datetime.now()
+    prefixes = [date_prefix_for(name or '', now) for name in laptop_names]
+    next_numbers = {}
+    for date_prefix in dict.fromkeys(prefixes):
+        next_numbers[date_prefix] = allocate_serial_block(conn, date_prefix, prefixes.count(date_prefix))
+    serials = []
+    for date_prefix in prefixes:
+        serials.append(format_serial(date_prefix, next_numbers[date_prefix]))
+        next_numbers[date_prefix] += 1
+    return serials
+
+
+def generate_serial_number(laptop_name, conn=None):
+    """Generate a serial number based on laptop brand, date, and increment"""
+    return generate_serial_numbers([laptop_name], conn)[0]
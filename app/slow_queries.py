@@ -0,0 +1,152 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from flask import has_request_context, request
+
+import db
+
+# --- Slow query log ---
+# Statements whose execute + fetch time passes SLOW_QUERY_MS are grouped by
+# their normalized SQL (literals and IN lists collapsed). For each group we keep
+# timings, the routes that ran it and the shapes of its parameters, plus the
+# EXPLAIN QUERY PLAN from its first slow run, so full table scans stand out.
+# Like the metrics, the log lives in each worker process.
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))  # 0 turns the log off
+SLOW_QUERY_MAX = int(os.environ.get('SLOW_QUERY_MAX', '200'))  # distinct statements kept
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+_TABLE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def normalize(sql):
+    """SQL with literals replaced by ? and IN lists of any length made equal"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(?, ...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _type_names(values):
+    names = [type(value).__name__ for value in values]
+    if len(names) > 4 and len(set(names)) == 1:
+        return f"{len(names)} x {names[0]}"
+    return ', '.join(names)
+
+
+def parameter_shape(parameters, kind):
+    """Types of the bound parameters, never their values"""
+    if kind == 'executescript':
+        return 'script'
+    if kind == 'executemany':
+        if not isinstance(parameters, (list, tuple)):
+            return 'many rows (iterator)'
+        first = parameters[0] if parameters else ()
+        return f"{len(parameters)} rows of ({parameter_shape(first, 'execute')})"
+    if isinstance(parameters, dict):
+        return ', '.join(f":{name} {type(value).__name__}" for name, value in parameters.items())
+    return _type_names(parameters) if parameters else 'none'
+
+
+def explain(conn, sql, parameters, kind):
+    """(plan lines, tables scanned in full, uses a temp b-tree) or None if it can't be explained"""
+    if kind == 'executescript' or not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    if kind == 'executemany':
+        if not isinstance(parameters, (list, tuple)) or not parameters:
+            return None
+        parameters = parameters[0]
+    try:
+        # The plain Connection.execute, so the EXPLAIN itself isn't timed or logged
+        rows = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    except sqlite3.Error as e:
+        return [f"(EXPLAIN failed: {e})"], [], False
+    depth = {0: -1}
+    lines, scans, temp_btree = [], [], False
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+        match = _TABLE_SCAN.match(detail)
+        if match and 'USING' not in detail and 'VIRTUAL TABLE' not in detail and match.group(1) != 'CONSTANT':
+            scans.append(match.group(1))
+        temp_btree = temp_btree or 'TEMP B-TREE' in detail
+    return lines, scans, temp_btree
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, max_entries=SLOW_QUERY_MAX):
+        self.threshold = threshold_ms / 1000
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = {}  # normalized SQL -> entry dict
+
+    def observe(self, cursor, seconds):
+        """Called by db.TimedCursor each time a slow statement spends more time"""
+        if cursor.slow_entry is not None:
+            # Later fetches of a statement that was already logged
+            with self.lock:
+                entry = cursor.slow_entry
+                entry['total'] += seconds
+                entry['max'] = max(entry['max'], cursor.elapsed)
+            return
+        sql, parameters, kind = cursor.statement
+        normalized = normalize(sql)
+        route = request.url_rule.rule if has_request_context() and request.url_rule else '(no request)'
+        shape = parameter_shape(parameters, kind)
+        with self.lock:
+            entry = self.entries.get(normalized)
+            new = entry is None
+            if new:
+                if len(self.entries) >= self.max_entries:
+                    del self.entries[min(self.entries, key=lambda key: self.entries[key]['total'])]
+                entry = self.entries[normalized] = {
+                    'sql': normalized, 'count': 0, 'total': 0.0, 'max': 0.0, 'last_seen': None,
+                    'routes': {}, 'shapes': {}, 'plan': None, 'full_scans': [], 'temp_btree': False,
+                }
+            entry['count'] += 1
+            entry['total'] += cursor.elapsed
+            entry['max'] = max(entry['max'], cursor.elapsed)
+            entry['last_seen'] = time.time()
+            entry['routes'][route] = entry['routes'].get(route, 0) + 1
+            if len(entry['shapes']) < 10 or shape in entry['shapes']:
+                entry['shapes'][shape] = entry['shapes'].get(shape, 0) + 1
+        cursor.slow_entry = entry
+        if new:
+            # Once per distinct statement, outside the lock
+            plan = explain(cursor.connection, sql, parameters, kind)
+            if plan:
+                entry['plan'], entry['full_scans'], entry['temp_btree'] = plan
+        print(f"Slow query ({cursor.elapsed * 1000:.0f} ms, {route}): {normalized[:300]}")
+
+    def top(self, limit=50):
+        """Entries by total time, slowest first, with times in milliseconds"""
+        with self.lock:
+            entries = [dict(entry, routes=dict(entry['routes']), shapes=dict(entry['shapes']))
+                       for entry in self.entries.values()]
+        entries.sort(key=lambda entry: entry['total'], reverse=True)
+        for entry in entries:
+            entry['total_ms'] = round(entry['total'] * 1000, 1)
+            entry['max_ms'] = round(entry['max'] * 1000, 1)
+            entry['avg_ms'] = round(entry['total'] * 1000 / entry['count'], 1)
+        return entries[:limit]
+
+    def reset(self):
+        with self.lock:
+            self.entries.clear()
+
+
+log = SlowQueryLog()
+
+
+def init_app(app):
+    """Watch every pooled connection for slow statements (unless SLOW_QUERY_MS=0)"""
+    if SLOW_QUERY_MS <= 0:
+        return
+    db.pool.factory = db.TimedConnection
+    db.slow_query_log = log
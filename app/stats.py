@@ -0,0 +1,99 @@
+# --- Dashboard counters ---
+# inventory_stats holds one row that triggers on laptops keep current, so the
+# admin and completed-sales pages read their totals instead of scanning laptops.
+COUNTERS = ('total_laptops', 'sold_count', 'available_count', 'total_profit', 'total_sales')
+MONEY_COUNTERS = ('total_profit', 'total_sales')
+
+# Same definitions the pages used to compute on every load
+STATS_SQL = """
+    SELECT COUNT(*) AS total_laptops,
+           COALESCE(SUM(sold = 1), 0) AS sold_count,
+           COALESCE(SUM(sold = 0), 0) AS available_count,
+           COALESCE(SUM(CASE WHEN sold = 1 THEN price_to_sell - (price_bought + fees) END), 0) AS total_profit,
+           COALESCE(SUM(CASE WHEN sold = 1 THEN price_to_sell END), 0) AS total_sales
+    FROM laptops
+"""
+
+
+def _contribution(row):
+    """What one laptop row (new/old) adds to each counter, in COUNTERS order"""
+    return (
+        "1",
+        f"IFNULL({row}.sold = 1, 0)",
+        f"IFNULL({row}.sold = 0, 0)",
+        f"CASE WHEN {row}.sold = 1 THEN IFNULL({row}.price_to_sell - ({row}.price_bought + {row}.fees), 0) ELSE 0 END",
+        f"CASE WHEN {row}.sold = 1 THEN IFNULL({row}.price_to_sell, 0) ELSE 0 END",
+    )
+
+
+def _update_statement(add=None, subtract=None):
+    assignments = []
+    for i, counter in enumerate(COUNTERS):
+        expr = counter
+        if add:
+            expr += f" + {_contribution(add)[i]}"
+        if subtract:
+            expr += f" - {_contribution(subtract)[i]}"
+        assignments.append(f"{counter} = {expr}")
+    return f"UPDATE inventory_stats SET {', '.join(assignments)} WHERE id = 1;"
+
+
+def init_stats(conn):
+    """Create inventory_stats and its triggers, and fill it from laptops"""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS inventory_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            {', '.join(f'{c} INTEGER NOT NULL DEFAULT 0' for c in COUNTERS if c not in MONEY_COUNTERS)},
+            {', '.join(f'{c} REAL NOT NULL DEFAULT 0' for c in MONEY_COUNTERS)}
+        )
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS laptops_stats_insert AFTER INSERT ON laptops BEGIN
+            {_update_statement(add='new')}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS laptops_stats_delete AFTER DELETE ON laptops BEGIN
+            {_update_statement(subtract='old')}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS laptops_stats_update
+        AFTER UPDATE OF sold, price_to_sell, price_bought, fees ON laptops BEGIN
+            {_update_statement(add='new', subtract='old')}
+        END
+    """)
+    rebuild_stats(conn)
+
+
+def rebuild_stats(conn):
+    """Recompute every counter from the laptops table"""
+    actual = conn.execute(STATS_SQL).fetchone()
+    conn.execute(f"""
+        INSERT OR REPLACE INTO inventory_stats (id, {', '.join(COUNTERS)})
+        VALUES (1, {', '.join('?' for _ in COUNTERS)})
+    """, [actual[c] for c in COUNTERS])
+
+
+def get_stats(conn):
+    """Current counters as a dict (all zero if the row is missing)"""
+    row = conn.execute(f"SELECT {', '.join(COUNTERS)} FROM inventory_stats WHERE id = 1").fetchone()
+    if row is None:
+        return {c: 0 for c in COUNTERS}
+    return {c: row[c] for c in COUNTERS}
+
+
+def check_stats(conn, tolerance=0.005):
+    """Compare stored counters with a full recount.
+
+    Returns {counter: (stored, actual)} for every counter that drifted;
+    money sums are compared with a small tolerance for float rounding.
+    """
+    stored = get_stats(conn)
+    actual = conn.execute(STATS_SQL).fetchone()
+    drift = {}
+    for counter in COUNTERS:
+        limit = tolerance if counter in MONEY_COUNTERS else 0
+        if abs((stored[counter] or 0) - (actual[counter] or 0)) > limit:
+            drift[counter] = (stored[counter], actual[counter])
+    return drift
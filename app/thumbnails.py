@@ -0,0 +1,126 @@
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from image_store import get_image_store
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it pages fall back to the original upload
+    Image = None
+
+# --- Thumbnail settings ---
+THUMBNAIL_SIZES = tuple(int(size) for size in os.environ.get('THUMBNAIL_SIZES', '64,320,1024').split(','))
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', '2'))
+THUMBNAIL_QUALITY = 85
+THUMBNAIL_MIMETYPE = 'image/jpeg'
+THUMBNAIL_RETRY_SECONDS = 3600  # how long an image whose variants failed is left alone
+
+_executor = None
+_pending = set()  # hashes queued or being generated in this process
+_failed = {}  # hash -> when generating its variants last failed, so requests don't queue it again
+_lock = threading.Lock()
+
+
+def enabled():
+    return Image is not None
+
+
+def variant_key(image_hash, size):
+    return f"{image_hash}-{size}"
+
+
+def pick_size(requested):
+    """Smallest configured size that covers the requested width, or None for the original"""
+    try:
+        requested = int(requested)
+    except (TypeError, ValueError):
+        return None
+    for size in sorted(THUMBNAIL_SIZES):
+        if size >= requested:
+            return size
+    return None
+
+
+def generate_variants(image_hash):
+    """Write every missing size variant of an image to the image store"""
+    store = get_image_store()
+    missing = [size for size in THUMBNAIL_SIZES if not store.exists(variant_key(image_hash, size))]
+    if not missing or not store.exists(image_hash):
+        return 0
+    with store.open(image_hash) as f:
+        original = Image.open(f)
+        original = ImageOps.exif_transpose(original)
+        if original.mode in ('RGBA', 'LA', 'P'):
+            original = original.convert('RGBA')
+            background = Image.new('RGB', original.size, (255, 255, 255))
+            background.paste(original, mask=original.getchannel('A'))
+            original = background
+        elif original.mode != 'RGB':
+            original = original.convert('RGB')
+        # Largest first so each smaller size is resampled from a smaller image
+        for size in sorted(missing, reverse=True):
+            variant = original.copy()
+            variant.thumbnail((size, size), Image.LANCZOS)
+            out = io.BytesIO()
+            variant.save(out, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+            store.put_bytes(out.getvalue(), key=variant_key(image_hash, size))
+    return len(missing)
+
+
+def _run(image_hash):
+    failed = False
+    try:
+        if not get_image_store().exists(image_hash):
+            failed = True
+            return 0
+        return generate_variants(image_hash)
+    except Exception as e:
+        print(f"Thumbnail error for {image_hash}: {e}")
+        failed = True
+        return 0
+    finally:
+        with _lock:
+            _pending.discard(image_hash)
+            if failed:
+                _failed[image_hash] = time.monotonic()
+            else:
+                _failed.pop(image_hash, None)
+
+
+def failed(image_hash):
+    """Whether generating this image's variants failed in the last THUMBNAIL_RETRY_SECONDS"""
+    with _lock:
+        when = _failed.get(image_hash)
+        if when is not None and time.monotonic() - when >= THUMBNAIL_RETRY_SECONDS:
+            del _failed[image_hash]
+            when = None
+    return when is not None
+
+
+def submit(image_hash):
+    """Queue variant generation in the worker pool.
+
+    No-op if the image is already queued, failed recently, or Pillow is missing.
+    """
+    global _executor
+    if not enabled() or not image_hash or failed(image_hash):
+        return None
+    with _lock:
+        if image_hash in _pending:
+            return None
+        _pending.add(image_hash)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix='thumbnail')
+    return _executor.submit(_run, image_hash)
+
+
+def shutdown(wait=True):
+    """Finish (or drop) queued variants; called when a worker exits"""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,129 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.utils import secure_filename
+
+from image_store import get_image_store
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Without Pillow uploads are checked by file signature only
+    Image = None
+
+# --- Upload settings ---
+# MAX_UPLOAD_MB caps a whole request (enforced by Werkzeug while it spools the
+# form to temp files); MAX_IMAGE_MB caps each photo.
+MAX_UPLOAD_MB = float(os.environ.get('MAX_UPLOAD_MB', '100'))
+MAX_IMAGE_MB = float(os.environ.get('MAX_IMAGE_MB', '20'))
+MAX_IMAGE_SIDE = int(os.environ.get('MAX_IMAGE_SIDE', '4096'))  # larger photos are scaled down
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', '2'))
+REENCODE_QUALITY = 90
+
+# Leading bytes of the formats we accept -> (Pillow format, mimetype)
+SIGNATURES = [
+    (b'\xff\xd8\xff', ('JPEG', 'image/jpeg')),
+    (b'\x89PNG\r\n\x1a\n', ('PNG', 'image/png')),
+    (b'GIF87a', ('GIF', 'image/gif')),
+    (b'GIF89a', ('GIF', 'image/gif')),
+]
+
+_executor = None
+_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    pass
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='upload')
+    return _executor
+
+
+def sniff(stream):
+    """(format, mimetype) from the file signature, or None"""
+    head = stream.read(16)
+    stream.seek(0)
+    for signature, kind in SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    return None
+
+
+def stream_size(stream):
+    stream.seek(0, io.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+
+def prepare_image(stream):
+    """Verify a spooled upload and put it in the image store; returns (hash, mimetype).
+
+    Photos bigger than MAX_IMAGE_SIDE are scaled down and re-encoded as JPEG;
+    everything else is stored byte for byte.
+    """
+    if stream_size(stream) > MAX_IMAGE_MB * 1024 * 1024:
+        raise UploadError(f"larger than {MAX_IMAGE_MB:g} MB")
+    kind = sniff(stream)
+    if kind is None:
+        raise UploadError("not a JPEG, PNG or GIF image")
+    image_format, mimetype = kind
+    store = get_image_store()
+    if Image is None:
+        image_hash, _ = store.put_stream(stream)
+        return image_hash, mimetype
+
+    try:
+        with Image.open(stream) as image:
+            if image.format != image_format:
+                raise UploadError("file contents don't match its type")
+            image.verify()
+        stream.seek(0)
+        with Image.open(stream) as image:
+            too_big = max(image.size) > MAX_IMAGE_SIDE
+            if too_big:
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.LANCZOS)
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
+                out = io.BytesIO()
+                image.save(out, 'JPEG', quality=REENCODE_QUALITY, optimize=True)
+    except UploadError:
+        raise
+    except Exception as e:  # Pillow raises many types for corrupt files
+        raise UploadError(f"unreadable image ({e})")
+    if too_big:
+        image_hash, _ = store.put_bytes(out.getvalue())
+        return image_hash, 'image/jpeg'
+    stream.seek(0)
+    image_hash, _ = store.put_stream(stream)
+    return image_hash, mimetype
+
+
+def process_uploads(files):
+    """Verify and store uploaded files in the worker pool, before any database write.
+
+    Returns (images, errors): images is a list of dicts with image_hash,
+    image_mimetype and image_name in upload order; errors are messages for
+    the files that were rejected.
+    """
+    jobs = []
+    for file in files:
+        if not file or not file.filename:
+            continue
+        jobs.append((secure_filename(file.filename) or 'image', _pool().submit(prepare_image, file.stream)))
+    images, errors = [], []
+    for name, future in jobs:
+        try:
+            image_hash, mimetype = future.result()
+        except UploadError as e:
+            errors.append(f"{name}: {e}")
+            continue
+        images.append({'image_hash': image_hash, 'image_mimetype': mimetype, 'image_name': name})
+    return images, errors
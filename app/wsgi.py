@@ -0,0 +1,4 @@
+"""WSGI entry point for production servers, e.g. `gunicorn -c gunicorn.conf.py wsgi:application`"""
+from app import configure_app
+
+application = configure_app()
@@ -0,0 +1,190 @@
+"""Seed a scratch database and image store with a synthetic shop.
+
+Generates laptops (about 30% sold, with warranties), JPEG photos of
+realistic size shared between listings, spare parts (some installed),
+open guest carts and orders in every status.
+
+    python benchmarks/load_data.py /tmp/shop                   # 2,000 laptops
+    python benchmarks/load_data.py /tmp/shop --laptops 20000 --images 200
+
+The directory gets laptops.db and images/, the same layout as data/, so the
+app can be pointed at it with DB_PATH=/tmp/shop/laptops.db. The admin login
+is bench / bench.
+"""
+import argparse
+import io
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+ADMIN_USER = ('bench', 'bench')
+BRANDS = ['Dell Latitude', 'HP EliteBook', 'Lenovo ThinkPad', 'Asus ZenBook', 'Acer Aspire',
+          'Apple MacBook Pro', 'Microsoft Surface', 'MSI Modern', 'Samsung Galaxy Book']
+CPUS = ['Intel Core i5-8250U', 'Intel Core i7-1165G7', 'AMD Ryzen 5 5500U', 'AMD Ryzen 7 5800H', 'Apple M1']
+RAMS = ['8GB', '16GB', '32GB']
+STORAGES = ['256GB SSD', '512GB NVMe', '1TB HDD']
+OSES = ['Windows 10 Pro', 'Windows 11 Home', 'macOS', 'Ubuntu']
+PARTS = [('RAM', ['4GB', '8GB', '16GB']), ('SSD', ['256GB', '512GB', '1TB']), ('HDD', ['500GB', '1TB'])]
+ORDER_STATUSES = ['unconfirmed', 'confirmed', 'in_progress', 'completed']
+
+
+def configure(data_dir):
+    """Point the app modules at data_dir; call before importing them"""
+    os.makedirs(data_dir, exist_ok=True)
+    os.environ['DB_PATH'] = os.path.join(data_dir, 'laptops.db')
+    os.environ['IMAGE_STORE_PATH'] = os.path.join(data_dir, 'images')
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+
+
+def make_photo(rnd, side):
+    """A noisy gradient JPEG: compresses about like a real product photo"""
+    from PIL import Image
+
+    width, height = side, side * 3 // 4
+    gradient = Image.linear_gradient('L').resize((width, height))
+    bands = [Image.blend(gradient.rotate(angle, expand=False), Image.effect_noise((width, height), sigma), 0.4)
+             for angle, sigma in ((0, 40), (90, 55), (180, 70))]
+    image = Image.merge('RGB', bands)
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=rnd.choice([80, 85, 90]))
+    return out.getvalue()
+
+
+def generate(data_dir, laptops=2000, images=40, spareparts=200, carts=200, orders=None,
+             image_side=1600, thumbnails=True, seed=42):
+    """Fill data_dir with a synthetic shop; returns a dict of row counts"""
+    configure(data_dir)
+    import app  # noqa: F401 - creates the schema
+    import thumbnails as thumbnail_variants
+    from cart import add_laptop
+    from image_store import get_image_store
+    from serials import generate_serial_numbers
+
+    rnd = random.Random(seed)
+    now = datetime.now()
+    orders = laptops // 20 if orders is None else orders
+    conn = sqlite3.connect(os.environ['DB_PATH'])
+    conn.row_factory = sqlite3.Row
+    started = time.perf_counter()
+
+    conn.execute("INSERT OR IGNORE INTO users (username, password, role) VALUES (?, ?, 'admin')", ADMIN_USER)
+
+    # Photos are shared between listings, as with one batch of identical machines
+    store = get_image_store()
+    photos, photo_bytes = [], 0
+    for _ in range(images):
+        data = make_photo(rnd, rnd.randint(image_side * 3 // 5, image_side))
+        image_hash, size = store.put_bytes(data)
+        photos.append(image_hash)
+        photo_bytes += size
+        if thumbnails and thumbnail_variants.enabled():
+            thumbnail_variants.generate_variants(image_hash)
+
+    names = [f"{rnd.choice(BRANDS)} {rnd.randint(100, 999)}" for _ in range(laptops)]
+    serials = generate_serial_numbers(names, conn)
+    rows = []
+    for name, serial in zip(names, serials):
+        created = now - timedelta(days=rnd.uniform(0, 365))
+        bought = round(rnd.uniform(80, 600), 2)
+        sold = rnd.random() < 0.3
+        sold_date = created + timedelta(days=rnd.uniform(1, 60)) if sold else None
+        rows.append((name, rnd.choice(CPUS), rnd.choice(RAMS), rnd.choice(STORAGES), rnd.choice(OSES),
+                     'Synthetic listing', bought, round(bought * rnd.uniform(1.3, 1.8), 2), rnd.choice([0, 10, 25]),
+                     serial, int(sold), sold_date and sold_date.strftime('%Y-%m-%d'),
+                     sold_date and sold_date.strftime('%Y-%m-%d'), rnd.choice([90, 365]) if sold else 0,
+                     created.strftime('%Y-%m-%d %H:%M:%S')))
+    first_id = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM laptops").fetchone()[0]) + 1
+    conn.executemany("""
+        INSERT INTO laptops (laptop_name, cpu, ram, storage, os, notes, price_bought, price_to_sell, fees,
+                             serial_number, sold, date_sold, warranty_start_date, warranty_duration_days,
+                             created_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    laptop_ids = list(range(first_id, first_id + laptops))
+    unsold = [laptop_id for laptop_id, row in zip(laptop_ids, rows) if not row[10]]
+    sold = [laptop_id for laptop_id, row in zip(laptop_ids, rows) if row[10]]
+
+    conn.executemany("""
+        INSERT INTO laptop_images (laptop_id, image_hash, image_mimetype, image_name, is_primary)
+        VALUES (?, ?, 'image/jpeg', ?, ?)
+    """, [(laptop_id, image_hash, f"photo{i}.jpg", int(i == 0))
+          for laptop_id in laptop_ids
+          for i, image_hash in enumerate(rnd.sample(photos, min(len(photos), rnd.randint(1, 4))))])
+
+    part_rows = []
+    for _ in range(spareparts):
+        part_type, capacities = rnd.choice(PARTS)
+        part_rows.append((part_type, rnd.choice(capacities), rnd.randint(0, 20), rnd.choice([15, 25, 40, 60]),
+                          'DDR4' if part_type == 'RAM' else None, part_type if part_type != 'RAM' else None))
+    conn.executemany("""
+        INSERT INTO spareparts (part_type, capacity, quantity, price, ram_type, storage_type)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, part_rows)
+    part_ids = [row[0] for row in conn.execute("SELECT id FROM spareparts")]
+    conn.executemany("INSERT INTO laptop_spareparts (laptop_id, sparepart_id, price_at_time) VALUES (?, ?, ?)",
+                     [(laptop_id, rnd.choice(part_ids), rnd.choice([15, 25, 40]))
+                      for laptop_id in laptop_ids if part_ids and rnd.random() < 0.2])
+
+    # Open carts, idle for up to ten days
+    for i in range(carts if unsold else 0):
+        session_id = f"bench-cart-{i}"
+        for laptop_id in rnd.sample(unsold, min(len(unsold), rnd.randint(1, 3))):
+            add_laptop(conn, session_id, laptop_id)
+            if part_ids and rnd.random() < 0.3:
+                conn.execute("INSERT INTO cart_spareparts (session_id, laptop_id, sparepart_id) VALUES (?, ?, ?)",
+                             (session_id, laptop_id, rnd.choice(part_ids)))
+        conn.execute("UPDATE carts SET last_touched = datetime('now', ?) WHERE session_id = ?",
+                     (f"-{rnd.randint(0, 240)} hours", session_id))
+
+    # Completed orders cover sold laptops; the rest reference laptops still for sale
+    for i in range(orders):
+        status = rnd.choice(ORDER_STATUSES)
+        pool = sold if status == 'completed' and sold else unsold or sold
+        items = rnd.sample(pool, min(len(pool), rnd.randint(1, 2)))
+        prices = [row[0] for row in conn.execute(
+            f"SELECT price_to_sell FROM laptops WHERE id IN ({','.join('?' * len(items))})", items)]
+        order_id = conn.execute("""
+            INSERT INTO orders (guest_name, guest_email, status, total_amount, created_date)
+            VALUES (?, ?, ?, ?, datetime('now', ?))
+        """, (f"Guest {i}", f"guest{i % 500}@example.com", status, sum(prices),
+              f"-{rnd.randint(0, 90)} days")).lastrowid
+        conn.executemany("INSERT INTO order_items (order_id, laptop_id, quantity, price) VALUES (?, ?, 1, ?)",
+                         [(order_id, laptop_id, price) for laptop_id, price in zip(items, prices)])
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+    return {'laptops': laptops, 'sold': len(sold), 'images': images,
+            'image_kb': round(photo_bytes / max(images, 1) / 1024), 'spareparts': spareparts,
+            'carts': carts if unsold else 0, 'orders': orders,
+            'seconds': round(time.perf_counter() - started, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('data_dir')
+    parser.add_argument('--laptops', type=int, default=2000)
+    parser.add_argument('--images', type=int, default=40, help="Distinct photos shared between laptops")
+    parser.add_argument('--image-side', type=int, default=1600, help="Longest side of the largest photos (px)")
+    parser.add_argument('--spareparts', type=int, default=200)
+    parser.add_argument('--carts', type=int, default=200)
+    parser.add_argument('--orders', type=int, help="Default: one per 20 laptops")
+    parser.add_argument('--no-thumbnails', action='store_true', help="Leave thumbnails to the first requests")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if os.path.exists(os.path.join(args.data_dir, 'laptops.db')):
+        sys.exit(f"{args.data_dir} already has a database; use an empty directory")
+    summary = generate(args.data_dir, args.laptops, args.images, args.spareparts, args.carts, args.orders,
+                       args.image_side, not args.no_thumbnails, args.seed)
+    print(', '.join(f"{key} {value}" for key, value in summary.items()))
+
+
+if __name__ == '__main__':
+    main()
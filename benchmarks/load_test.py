@@ -0,0 +1,309 @@
+"""Replay a realistic request mix against a synthetic shop and report per-route numbers.
+
+Seeds a scratch database with load_data.py, then drives it with concurrent
+clients, each with its own guest session (admin pages use an admin session).
+Prints p50/p95/p99 latency, throughput and peak RSS of the serving process
+for every route.
+
+    python benchmarks/load_test.py                              # Flask test client, in-process
+    python benchmarks/load_test.py --server gunicorn --clients 16
+    python benchmarks/load_test.py --json after.json --baseline before.json
+
+--data DIR keeps the generated shop between runs (it is created on the first
+run and reused afterwards). --baseline prints the change in p95 and peak RSS
+against an earlier --json report, so a regression shows up as a number.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import load_data
+
+PORT = 5056
+SEARCHES = ['latitude', 'thinkpad 16gb', 'i7', 'ryzen', 'macbook pro']
+
+# (route, weight): roughly what a day of shop traffic looks like
+ROUTE_MIX = [
+    ('GET /shop', 18),
+    ('GET /shop?search=', 7),
+    ('GET /guest/laptop/<id>', 18),
+    ('GET /image/<id>?size=320', 22),
+    ('GET /image/<id>/<image_id>', 8),
+    ('GET /admin', 8),
+    ('GET /add_to_cart/<id>', 6),
+    ('GET /cart', 7),
+    ('GET /checkout', 4),
+    ('POST /checkout', 2),
+]
+
+
+# --- Clients: the same interface over the test client and over HTTP ---
+class TestClient:
+    def __init__(self, admin=False):
+        import app
+        self.client = app.app.test_client()
+        if admin:
+            with self.client.session_transaction() as session:
+                session['logged_in'] = True
+                session['role'] = 'admin'
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        size = len(response.get_data())
+        response.close()
+        return response.status_code, size
+
+
+class HttpClient:
+    def __init__(self, admin=False):
+        self.conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=30)
+        self.cookie = None
+        if admin:
+            self.request('POST', '/login', {'username': load_data.ADMIN_USER[0], 'password': load_data.ADMIN_USER[1]})
+
+    def request(self, method, path, data=None):
+        headers = {'Cookie': f"session={self.cookie}"} if self.cookie else {}
+        body = None
+        if data:
+            body = '&'.join(f"{key}={value}" for key, value in data.items())
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            size = len(response.read())
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=30)
+            return 'reset', 0
+        for header, value in response.getheaders():
+            if header.lower() == 'set-cookie' and value.startswith('session='):
+                self.cookie = value.split(';', 1)[0].split('=', 1)[1]
+        return response.status, size
+
+
+# --- Memory ---
+def rss_kib(pid):
+    """Resident set size of one process (Linux /proc), 0 if unavailable"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def process_tree(pid):
+    pids = [pid]
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                for child in f.read().split():
+                    pids.extend(process_tree(int(child)))
+    except OSError:
+        pass
+    return pids
+
+
+class RssSampler(threading.Thread):
+    """Samples the RSS of a process and its children (gunicorn workers) every 50 ms"""
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.current = self.peak = self.sample()
+        self.running = True
+
+    def sample(self):
+        return sum(rss_kib(pid) for pid in process_tree(self.pid))
+
+    def run(self):
+        while self.running:
+            self.current = self.sample()
+            self.peak = max(self.peak, self.current)
+            time.sleep(0.05)
+
+
+# --- Driver ---
+class Shop:
+    """Ids to build request paths from"""
+
+    def __init__(self, db_path):
+        import sqlite3
+        conn = sqlite3.connect(db_path)
+        self.unsold = [row[0] for row in conn.execute("SELECT id FROM laptops WHERE sold = 0")]
+        self.images = conn.execute("""
+            SELECT li.laptop_id, li.id FROM laptop_images li JOIN laptops l ON l.id = li.laptop_id
+            WHERE l.sold = 0
+        """).fetchall()
+        conn.close()
+
+    def path(self, route, rnd):
+        """(method, path, form data) for one request on a route"""
+        method, pattern = route.split(' ', 1)
+        if pattern == '/shop?search=':
+            return method, f"/shop?search={rnd.choice(SEARCHES).replace(' ', '+')}", None
+        if pattern == '/image/<id>/<image_id>':
+            laptop_id, image_id = rnd.choice(self.images)
+            return method, f"/image/{laptop_id}/{image_id}", None
+        if route == 'POST /checkout':
+            n = rnd.randint(1, 10 ** 6)
+            return method, '/checkout', {'guest_name': f"Load {n}", 'guest_email': f"load{n}@example.com"}
+        return method, pattern.replace('<id>', str(rnd.choice(self.unsold))), None
+
+
+def client_loop(client_class, shop, stop_at, results, rss, warmup_until, seed):
+    rnd = random.Random(seed)
+    guest, admin = client_class(), client_class(admin=True)
+    routes = [route for route, _ in ROUTE_MIX]
+    weights = [weight for _, weight in ROUTE_MIX]
+    while time.time() < stop_at:
+        route = rnd.choices(routes, weights)[0]
+        method, path, data = shop.path(route, rnd)
+        started = time.perf_counter()
+        status, size = (admin if route == 'GET /admin' else guest).request(method, path, data)
+        elapsed = time.perf_counter() - started
+        if time.time() < warmup_until:
+            continue
+        result = results[route]
+        if status == 'reset' or status >= 500:
+            result['errors'] += 1
+            continue
+        result['latencies'].append(elapsed)
+        result['bytes'] += size
+        result['rss'] = max(result['rss'], rss.current)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0
+
+
+def start_server(db_dir, workers, threads):
+    env = dict(os.environ, DB_PATH=os.path.join(db_dir, 'laptops.db'),
+               IMAGE_STORE_PATH=os.path.join(db_dir, 'images'), BIND=f"127.0.0.1:{PORT}",
+               ACCESS_LOG='/dev/null', WEB_WORKERS=str(workers), WEB_THREADS=str(threads),
+               WEB_MAX_REQUESTS='0', AUTO_MIGRATE='0')
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:application'],
+                               cwd=load_data.APP_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=1)
+            conn.request('GET', '/login')
+            conn.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start")
+
+
+def run(args, data_dir):
+    shop = Shop(os.path.join(data_dir, 'laptops.db'))
+    process = None
+    if args.server == 'gunicorn':
+        process = start_server(data_dir, args.workers, args.threads)
+        client_class, pid = HttpClient, process.pid
+    else:
+        import app  # noqa: F401 - so the starting RSS includes the app
+        client_class, pid = TestClient, os.getpid()
+    rss = RssSampler(pid)
+    rss_start = rss.peak
+    rss.start()
+    results = {route: {'latencies': [], 'bytes': 0, 'errors': 0, 'rss': 0} for route, _ in ROUTE_MIX}
+    warmup_until = time.time() + args.warmup
+    stop_at = warmup_until + args.duration
+    try:
+        threads = [threading.Thread(target=client_loop,
+                                    args=(client_class, shop, stop_at, results, rss, warmup_until, args.seed + i))
+                   for i in range(args.clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        rss.running = False
+        if process:
+            process.terminate()
+            process.wait(timeout=40)
+
+    report = {'server': args.server, 'clients': args.clients, 'duration': args.duration,
+              'rss_start_mib': round(rss_start / 1024, 1), 'rss_peak_mib': round(rss.peak / 1024, 1), 'routes': {}}
+    for route, result in results.items():
+        latencies = result['latencies']
+        report['routes'][route] = {
+            'requests': len(latencies),
+            'rps': round(len(latencies) / args.duration, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'kib_per_request': round(result['bytes'] / max(len(latencies), 1) / 1024, 1),
+            'peak_rss_mib': round(result['rss'] / 1024, 1),
+            'errors': result['errors'],
+        }
+    return report
+
+
+def print_report(report, baseline=None):
+    print(f"{'route':<28} {'req':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'KiB/req':>8} {'RSS MiB':>8} {'5xx':>4}" + ('   p95 vs base   RSS vs base' if baseline else ''))
+    for route, row in report['routes'].items():
+        line = (f"{route:<28} {row['requests']:>6} {row['rps']:>7} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+                f"{row['p99_ms']:>8} {row['kib_per_request']:>8} {row['peak_rss_mib']:>8} {row['errors']:>4}")
+        before = (baseline or {}).get('routes', {}).get(route)
+        if before and before['p95_ms']:
+            change = (row['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+            line += f"   {change:+12.1f}%   {row['peak_rss_mib'] - before['peak_rss_mib']:+9.1f} MiB"
+        print(line)
+    total = sum(row['requests'] for row in report['routes'].values())
+    print(f"total {total / report['duration']:.1f} req/s, RSS {report['rss_start_mib']} MiB at start, "
+          f"{report['rss_peak_mib']} MiB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', choices=['test-client', 'gunicorn'], default='test-client')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3, help="Seconds of traffic before measuring")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers")
+    parser.add_argument('--threads', type=int, default=4, help="Threads per gunicorn worker")
+    parser.add_argument('--laptops', type=int, default=2000)
+    parser.add_argument('--images', type=int, default=40)
+    parser.add_argument('--data', help="Directory for the generated shop (kept and reused)")
+    parser.add_argument('--json', help="Write the report to this file")
+    parser.add_argument('--baseline', help="Compare with a report written by --json")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data or tmp
+        load_data.configure(data_dir)
+        if not os.path.exists(os.path.join(data_dir, 'laptops.db')):
+            summary = load_data.generate(data_dir, args.laptops, args.images, seed=args.seed)
+            print(', '.join(f"{key} {value}" for key, value in summary.items()))
+        print(f"{args.server}, {args.clients} clients, {args.duration:.0f} s after {args.warmup:.0f} s warmup, "
+              f"{os.cpu_count()} CPUs")
+        report = run(args, data_dir)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Measure what request metrics (METRICS_ENABLED) add to the hot path.
+
+Times pages through the Flask test client with metrics switched off and on
+in turn (same process, best of several rounds), then the per-call cost of
+the timed SQLite cursor and of recording one request.
+
+    python benchmarks/metrics_overhead.py              # 2,000 laptop synthetic shop
+    python benchmarks/metrics_overhead.py --data /tmp/shop
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import timeit
+
+import load_data
+
+ROUTES = ['/guest/laptop/{id}', '/shop?search=latitude', '/admin', '/cart']
+
+
+def switch_metrics(app, db, metrics, enabled):
+    """Add or remove the request hooks and the timed connection factory"""
+    before = app.before_request_funcs.setdefault(None, [])
+    after = app.after_request_funcs.setdefault(None, [])
+    for funcs, hook in ((before, metrics._start_timer), (after, metrics._record)):
+        if hook in funcs:
+            funcs.remove(hook)
+        if enabled:
+            funcs.append(hook)
+    db.pool.close_idle()
+    db.pool.factory = db.TimedConnection if enabled else sqlite3.Connection
+
+
+def time_requests(data_dir, rounds, requests):
+    """Best seconds per request for every route, metrics off and on"""
+    load_data.configure(data_dir)
+    import app
+    import db
+    import metrics
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+        session['role'] = 'admin'
+    laptop_id = db.pool.connect().execute("SELECT MIN(id) FROM laptops WHERE sold = 0").fetchone()[0]
+    app.page_cache.cache.max_bytes = 0  # measure rendering, not cache hits
+    best = {False: {}, True: {}}
+    # Switch for every batch so that drift on a busy machine hits both sides
+    for _ in range(rounds):
+        for route in ROUTES:
+            path = route.format(id=laptop_id)
+            for enabled in (False, True):
+                switch_metrics(app.app, db, metrics, enabled)
+                client.get(path).close()
+                started = time.perf_counter()
+                for _ in range(requests):
+                    client.get(path).close()
+                seconds = (time.perf_counter() - started) / requests
+                best[enabled][route] = min(best[enabled].get(route, seconds), seconds)
+    return best[False], best[True]
+
+
+def time_cursor(number=20000):
+    """Microseconds per execute+fetchall and per iterated row, plain vs timed connection"""
+    import db
+    results = {}
+    for name, factory in (('plain', sqlite3.Connection), ('timed', db.TimedConnection)):
+        conn = sqlite3.connect(':memory:', factory=factory)
+        conn.execute("CREATE TABLE t (a INTEGER)")
+        conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(100)])
+        query = min(timeit.repeat(lambda: conn.execute("SELECT a FROM t WHERE a = ?", (1,)).fetchall(),
+                                  number=number, repeat=5)) / number
+        rows = min(timeit.repeat(lambda: sum(1 for _ in conn.execute("SELECT a FROM t")),
+                                 number=number // 20, repeat=5)) / (number // 20) / 100
+        results[name] = (query * 1e6, rows * 1e6)
+        conn.close()
+    return results
+
+
+def time_record(number=100000):
+    """Microseconds to add one request to the histograms"""
+    import metrics
+    registry = metrics.RequestMetrics()
+    seconds = min(timeit.repeat(lambda: registry.record('/shop', 'GET', 200, 0.004, 5, 0.001, 120000),
+                                number=number, repeat=5))
+    return seconds / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', help="Existing or new directory for the synthetic shop")
+    parser.add_argument('--rounds', type=int, default=20, help="Off/on rounds")
+    parser.add_argument('--requests', type=int, default=50, help="Requests per route and round")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data or tmp
+        load_data.configure(data_dir)
+        if not os.path.exists(os.path.join(data_dir, 'laptops.db')):
+            load_data.generate(data_dir, images=10)
+        off, on = time_requests(data_dir, args.rounds, args.requests)
+
+    print(f"{'route':<24} {'off ms':>8} {'on ms':>8} {'overhead':>10}")
+    for route in ROUTES:
+        extra = (on[route] - off[route]) * 1e6
+        print(f"{route:<24} {off[route] * 1000:8.3f} {on[route] * 1000:8.3f} {extra:+8.0f} µs "
+              f"({extra / off[route] / 1e4:+.1f}%)")
+    cursor = time_cursor()
+    print(f"SQLite query + fetchall: plain {cursor['plain'][0]:.2f} µs, timed {cursor['timed'][0]:.2f} µs")
+    print(f"SQLite iterated row:     plain {cursor['plain'][1]:.3f} µs, timed {cursor['timed'][1]:.3f} µs")
+    print(f"Recording one request:   {time_record():.2f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Compare LIKE '%term%' search with the FTS5 index at different table sizes.
+
+    python benchmarks/search_benchmark.py            # 10k and 100k rows
+    python benchmarks/search_benchmark.py 50000
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+import search  # noqa: E402
+
+BRANDS = ['Dell Latitude', 'HP EliteBook', 'Lenovo ThinkPad', 'Asus ZenBook', 'Acer Aspire',
+          'Apple MacBook Pro', 'Microsoft Surface', 'MSI Modern', 'Samsung Galaxy Book']
+CPUS = ['Intel Core i5-8250U', 'Intel Core i7-1165G7', 'AMD Ryzen 5 5500U', 'AMD Ryzen 7 5800H', 'Apple M1']
+RAMS = ['8GB', '16GB', '32GB']
+STORAGES = ['256GB SSD', '512GB NVMe', '1TB HDD']
+OSES = ['Windows 10 Pro', 'Windows 11 Home', 'macOS', 'Ubuntu']
+QUERIES = ['thinkpad', 'i7', 'ryzen 7', 'elitebook 16gb', 'mac', 'nothing-matches']
+REPEAT = 5
+
+
+def seed(conn, rows):
+    conn.execute("""
+        CREATE TABLE laptops (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, laptop_name TEXT, cpu TEXT, ram TEXT,
+            storage TEXT, os TEXT, sold INTEGER DEFAULT 0, created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    search.init_search_index(conn)
+    rnd = random.Random(42)
+    conn.executemany(
+        "INSERT INTO laptops (laptop_name, cpu, ram, storage, os, sold) VALUES (?, ?, ?, ?, ?, ?)",
+        ((f"{rnd.choice(BRANDS)} {rnd.randint(100, 999)}", rnd.choice(CPUS), rnd.choice(RAMS),
+          rnd.choice(STORAGES), rnd.choice(OSES), rnd.random() < 0.3) for _ in range(rows)))
+    conn.commit()
+
+
+def timed(conn, sql, params):
+    best = None
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        count = len(conn.execute(sql, params).fetchall())
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+def run(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        seed(conn, rows)
+        print(f"\n{rows:,} rows")
+        print(f"{'query':<18}{'matches':>9}{'LIKE ms':>10}{'FTS ms':>10}{'FTS+rank ms':>13}")
+        for term in QUERIES:
+            like = ' OR '.join(f"{c} LIKE ?" for c in search.FTS_COLUMNS)
+            like_ms, like_count = timed(
+                conn, f"SELECT * FROM laptops WHERE sold = 0 AND ({like})", [f"%{term}%"] * 5)
+            join, where, params, rank = search.search_filter(term)
+            fts_ms, fts_count = timed(
+                conn, f"SELECT l.* FROM laptops l{join} WHERE l.sold = 0{where}", params)
+            ranked_ms, _ = timed(
+                conn, f"SELECT l.* FROM laptops l{join} WHERE l.sold = 0{where} ORDER BY {rank}", params)
+            print(f"{term:<18}{fts_count:>9}{like_ms:>10.2f}{fts_ms:>10.2f}{ranked_ms:>13.2f}"
+                  + ("" if like_count == fts_count else f"  (LIKE matched {like_count})"))
+        conn.close()
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,132 @@
+"""Compare the Flask development server with gunicorn on the guest pages.
+
+Starts each server against a seeded temporary database, drives it with
+concurrent keep-alive clients and prints throughput and latency.
+
+    python benchmarks/serving_benchmark.py                   # both servers, 8 clients, 10 s each
+    python benchmarks/serving_benchmark.py --clients 32 --duration 20
+    python benchmarks/serving_benchmark.py --servers gunicorn --writes
+"""
+import argparse
+import http.client
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+PORT = 5055
+
+SERVERS = {
+    # What `python app.py` runs, on the benchmark port
+    'werkzeug-debug': [sys.executable, '-c',
+                       f"from app import configure_app; configure_app().run(debug=True, host='127.0.0.1', port={PORT})"],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:application'],
+}
+
+
+def seed(db_path, laptops):
+    env = dict(os.environ, DB_PATH=db_path)
+    # Importing the app creates the schema
+    subprocess.run([sys.executable, '-c', 'import app'], cwd=APP_DIR, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    conn = sqlite3.connect(db_path)
+    rnd = random.Random(42)
+    conn.executemany(
+        "INSERT INTO laptops (laptop_name, cpu, ram, storage, os, price_bought, price_to_sell, fees, sold) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+        ((f"Dell Latitude {i}", 'Intel Core i5-8350U', '16GB', '512GB SSD', 'Windows 11 Pro',
+          rnd.randint(100, 300), rnd.randint(300, 600), 10) for i in range(laptops)))
+    conn.commit()
+    conn.close()
+
+
+def wait_until_up(timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=1)
+            conn.request('GET', '/login')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def client(paths, stop_at, latencies, errors):
+    conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=30)
+    rnd = random.Random()
+    while time.time() < stop_at:
+        path = rnd.choice(paths)
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException):
+            errors.append('reset')
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0
+
+
+def run(server, db_path, clients, duration, paths):
+    env = dict(os.environ, DB_PATH=db_path, BIND=f"127.0.0.1:{PORT}", ACCESS_LOG='/dev/null',
+               FLASK_DEBUG='1', AUTO_MIGRATE='0')
+    process = subprocess.Popen(SERVERS[server], cwd=APP_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up()
+        latencies, errors = [], []
+        stop_at = time.time() + duration
+        threads = [threading.Thread(target=client, args=(paths, stop_at, latencies, errors))
+                   for _ in range(clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        process.terminate()
+        process.wait(timeout=40)
+    ms = lambda seconds: f"{seconds * 1000:7.1f}"
+    print(f"{server:<16} {len(latencies) / duration:8.1f} req/s   p50 {ms(percentile(latencies, 50))} ms"
+          f"   p95 {ms(percentile(latencies, 95))} ms   p99 {ms(percentile(latencies, 99))} ms"
+          f"   5xx {sum(1 for e in errors if e != 'reset')}   resets {errors.count('reset')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--laptops', type=int, default=2000)
+    parser.add_argument('--servers', nargs='+', default=list(SERVERS), choices=list(SERVERS))
+    parser.add_argument('--writes', action='store_true', help="Mix in add-to-cart requests (SQLite writes)")
+    args = parser.parse_args()
+
+    paths = ['/shop', '/shop?search=latitude', '/guest/laptop/1', '/guest/laptop/2', '/cart']
+    if args.writes:
+        paths += ['/add_to_cart/1', '/add_to_cart/2']
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'laptops.db')
+        seed(db_path, args.laptops)
+        print(f"{args.laptops} laptops, {args.clients} clients, {args.duration:.0f} s per server, "
+              f"{os.cpu_count()} CPUs")
+        for server in args.servers:
+            run(server, db_path, args.clients, args.duration, paths)
+
+
+if __name__ == '__main__':
+    main()
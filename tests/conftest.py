@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its paths from the environment at import time, so point them at
+# a scratch directory before anything imports it
+DATA_DIR = tempfile.mkdtemp(prefix='laptop-tests-')
+os.environ.update(
+    DB_PATH=os.path.join(DATA_DIR, 'laptops.db'),
+    IMAGE_STORE_PATH=os.path.join(DATA_DIR, 'images'),
+    BACKUP_DIR=os.path.join(DATA_DIR, 'backups'),
+    JOB_DIR=os.path.join(DATA_DIR, 'jobs'),
+    PROFILE_DIR=os.path.join(DATA_DIR, 'profiles'),
+    AUTO_MIGRATE='1',  # one process, so migrating on import is safe
+)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import app as shop  # noqa: E402
+import db  # noqa: E402
+
+# Deleting laptops through these tables keeps the trigger-maintained counters right
+DATA_TABLES = ('laptop_images', 'laptop_spareparts', 'laptops', 'spareparts', 'serial_counters', 'jobs')
+
+
+@pytest.fixture
+def conn():
+    """A connection to an empty inventory"""
+    conn = db.pool.connect()
+    for table in DATA_TABLES:
+        conn.execute(f"DELETE FROM {table}")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def admin(conn):
+    """Test client logged in as admin"""
+    client = shop.app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+        session['role'] = 'admin'
+    return client
+
+
+def add_laptops(conn, count, start=0, **fields):
+    """Insert `count` laptops with distinct serials; returns their ids"""
+    ids = []
+    for i in range(start, start + count):
+        row = dict(laptop_name=f"Dell Latitude {i}", cpu='i5', ram='8GB', storage='256GB', os='Windows',
+                   price_bought=100 + i, price_to_sell=200 + i, fees=5, sold=0, serial_number=f"T{i:05d}")
+        row.update(fields)
+        ids.append(conn.execute(f"INSERT INTO laptops ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                                list(row.values())).lastrowid)
+    conn.commit()
+    return ids
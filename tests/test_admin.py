@@ -0,0 +1,39 @@
+import db
+from conftest import add_laptops
+
+
+def count_admin_queries(admin, monkeypatch):
+    """Statements one GET /admin runs, after a warm-up request fills the caches"""
+    statements = []
+    acquire = db.pool.acquire
+
+    def traced_acquire():
+        conn = acquire()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    assert admin.get('/admin').status_code == 200
+    with monkeypatch.context() as patch:
+        patch.setattr(db.pool, 'acquire', traced_acquire)
+        try:
+            response = admin.get('/admin')
+        finally:
+            db.pool.close_idle()  # don't leave the callback on pooled connections
+    assert response.status_code == 200
+    return statements
+
+
+def test_admin_panel_query_count_does_not_grow_with_stock(conn, admin, monkeypatch):
+    ids = add_laptops(conn, 3)
+    part = conn.execute("INSERT INTO spareparts (part_type, capacity) VALUES ('RAM', '8GB')").lastrowid
+    conn.execute("INSERT INTO laptop_spareparts (laptop_id, sparepart_id) VALUES (?, ?)", (ids[0], part))
+    conn.commit()
+    small = count_admin_queries(admin, monkeypatch)
+
+    more = add_laptops(conn, 40, start=3)
+    conn.executemany("INSERT INTO laptop_spareparts (laptop_id, sparepart_id) VALUES (?, ?)",
+                     [(laptop_id, part) for laptop_id in more])
+    conn.commit()
+    large = count_admin_queries(admin, monkeypatch)
+
+    assert len(large) == len(small), "\n".join(large)
@@ -0,0 +1,39 @@
+import sqlite3
+
+import pytest
+
+import bulk
+from conftest import add_laptops
+
+
+def test_failed_bulk_delete_deletes_nothing(conn):
+    ids = add_laptops(conn, 7)
+    part = conn.execute("INSERT INTO spareparts (part_type) VALUES ('RAM')").lastrowid
+    conn.executemany("INSERT INTO laptop_spareparts (laptop_id, sparepart_id) VALUES (?, ?)",
+                     [(laptop_id, part) for laptop_id in ids])
+    # Fail in the third chunk, after two chunks have already run
+    conn.execute(f"""
+        CREATE TEMP TRIGGER refuse_delete BEFORE DELETE ON laptops WHEN old.id = {ids[5]}
+        BEGIN SELECT RAISE(ABORT, 'refused'); END
+    """)
+    conn.commit()
+
+    with pytest.raises(sqlite3.IntegrityError):
+        bulk.delete_laptops(conn, ids, chunk_size=2)
+
+    assert conn.execute("SELECT COUNT(*) FROM laptops").fetchone()[0] == 7
+    assert conn.execute("SELECT COUNT(*) FROM laptop_spareparts").fetchone()[0] == 7
+    conn.execute("DROP TRIGGER refuse_delete")
+    reports = bulk.delete_laptops(conn, ids, chunk_size=2)
+    assert [report['laptops'] for report in reports] == [2, 2, 2, 1]
+    assert conn.execute("SELECT COUNT(*) FROM laptops").fetchone()[0] == 0
+
+
+def test_duplicates_are_created_in_the_order_selected(conn):
+    ids = add_laptops(conn, 4)
+    order = [ids[2], ids[0], ids[3], ids[0]]
+
+    bulk.duplicate_laptops(conn, order, chunk_size=2)
+
+    copies = conn.execute("SELECT laptop_name FROM laptops WHERE id > ? ORDER BY id", (ids[-1],)).fetchall()
+    assert [row[0] for row in copies] == [f"Dell Latitude {i} (Copy)" for i in (2, 0, 3)]
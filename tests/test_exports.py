@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+import exports
+import jobs
+
+
+class FakeJob:
+    id = 4242
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def progress(self, done, total=None, message=None, force=False):
+        pass
+
+
+def test_export_that_cannot_open_its_file_reports_the_real_error(conn, monkeypatch):
+    def refuse(path, mode='r'):
+        raise PermissionError(f"read-only: {path}")
+
+    monkeypatch.setattr(exports, 'open', refuse, raising=False)
+    with pytest.raises(PermissionError):
+        exports.export_job(FakeJob(conn), 'laptops')
+
+
+def test_export_writes_the_file_for_download(conn):
+    conn.execute("INSERT INTO laptops (laptop_name, serial_number) VALUES ('Dell Latitude', 'T1')")
+    conn.commit()
+    result = exports.export_job(FakeJob(conn), 'laptops')
+    path = jobs.output_path(FakeJob.id, result['file'])
+    with open(path) as f:
+        assert 'Dell Latitude' in f.read()
+    os.remove(path)
@@ -0,0 +1,47 @@
+import time
+
+import app as shop
+import thumbnails
+from conftest import add_laptops
+from image_store import get_image_store
+
+
+def test_shop_and_image_route_pick_the_same_photo_without_a_primary(conn):
+    """Photos added one at a time are never primary; every page falls back to the oldest"""
+    laptop_id = add_laptops(conn, 1)[0]
+    conn.executemany("""
+        INSERT INTO laptop_images (laptop_id, image_hash, image_mimetype, is_primary, uploaded_date)
+        VALUES (?, ?, 'image/jpeg', 0, ?)
+    """, [(laptop_id, 'b' * 64, '2025-02-01 10:00:00'), (laptop_id, 'a' * 64, '2025-01-01 10:00:00')])
+    conn.commit()
+    oldest = conn.execute("SELECT id FROM laptop_images WHERE image_hash = ?", ('a' * 64,)).fetchone()[0]
+    client = shop.app.test_client()
+
+    page = client.get('/shop').get_data(as_text=True)
+    redirect = client.get(f'/image/{laptop_id}')
+
+    assert f'/image/{laptop_id}/{oldest}' in page
+    assert redirect.location.split('?')[0].endswith(f'/image/{laptop_id}/{oldest}')
+
+
+def test_original_sent_for_a_failed_thumbnail_is_not_cached_as_immutable(conn):
+    image_hash, _ = get_image_store().put_bytes(b'not really a jpeg')
+    laptop_id = add_laptops(conn, 1)[0]
+    image_id = conn.execute("""
+        INSERT INTO laptop_images (laptop_id, image_hash, image_mimetype) VALUES (?, ?, 'image/jpeg')
+    """, (laptop_id, image_hash)).lastrowid
+    conn.commit()
+    client = shop.app.test_client()
+    url = f'/image/{laptop_id}/{image_id}?size=320'
+
+    first = client.get(url)
+    deadline = time.monotonic() + 10
+    while not thumbnails.failed(image_hash):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    second = client.get(url)
+
+    assert first.headers['Cache-Control'] == 'no-cache'
+    assert 'immutable' not in second.headers['Cache-Control']
+    assert second.get_data() == b'not really a jpeg'
+    assert second.headers['ETag'].strip('"') == image_hash
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+import jobs
+
+
+def wait(conn, job_id, timeout=10):
+    """The job's row once it has stopped running"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get(conn, job_id)
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+def wait_for(conn, job_id, status):
+    deadline = time.monotonic() + 10
+    while jobs.get(conn, job_id)['status'] != status:
+        assert time.monotonic() < deadline, f"job {job_id} never became {status}"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    """Register test handlers without leaving them behind"""
+    def register(kind, function, unique=False):
+        monkeypatch.setitem(jobs.HANDLERS, kind, (function, kind.replace('_', ' '), unique))
+    return register
+
+
+def test_job_runs_to_done_with_progress_and_result(conn, handlers):
+    def add(job, numbers, scale):
+        for i in range(1, len(numbers) + 1):
+            job.progress(i, len(numbers), message='adding', force=True)
+        return {'summary': f"total {sum(numbers) * scale.factor}"}
+
+    class Scale:
+        factor = 10
+
+    handlers('test_add', add)
+    job_id = jobs.enqueue(conn, 'test_add', {'numbers': [1, 2, 3]}, scale=Scale())
+    job = wait(conn, job_id)
+
+    assert job['status'] == 'done'
+    assert job['result'] == {'summary': 'total 60'}
+    assert (job['progress_done'], job['progress_total'], job['percent']) == (3, 3, 100)
+    assert job['params'] == {'numbers': [1, 2, 3]}  # resources are passed, never stored
+    assert job['started_date'] and job['finished_date'] and job['attempts'] == 1
+
+
+def test_running_job_stops_at_its_next_progress_report_and_can_be_retried(conn, handlers):
+    release = threading.Event()
+    runs = []
+
+    def wait_for_release(job):
+        runs.append(job.id)
+        i = 0
+        while not release.is_set():
+            i += 1
+            job.progress(i, force=True)
+            time.sleep(0.01)
+        return {'summary': 'released'}
+
+    handlers('test_wait', wait_for_release)
+    job_id = jobs.enqueue(conn, 'test_wait')
+    wait_for(conn, job_id, 'running')
+    jobs.cancel(conn, job_id)
+    job = wait(conn, job_id)
+    assert (job['status'], job['error']) == ('cancelled', 'Cancelled')
+
+    release.set()
+    jobs.retry(conn, job_id)
+    job = wait(conn, job_id)
+    assert (job['status'], job['attempts'], job['error']) == ('done', 2, None)
+    assert job['result'] == {'summary': 'released'}
+    assert runs == [job_id, job_id]
+
+
+def test_failed_job_records_its_error_and_only_finished_failures_retry(conn, handlers):
+    def explode(job):
+        raise ValueError('disk on fire')
+
+    handlers('test_fail', explode)
+    job_id = jobs.enqueue(conn, 'test_fail')
+    job = wait(conn, job_id)
+    assert (job['status'], job['error']) == ('failed', 'disk on fire')
+
+    handlers('test_ok', lambda job: None)
+    done_id = jobs.enqueue(conn, 'test_ok')
+    assert wait(conn, done_id)['status'] == 'done'
+    with pytest.raises(jobs.JobError):
+        jobs.retry(conn, done_id)
+
+
+def test_unique_kind_refuses_a_second_job_while_one_runs(conn, handlers):
+    release = threading.Event()
+
+    def wait_for_release(job):
+        release.wait(10)
+
+    handlers('test_unique', wait_for_release, unique=True)
+
+    job_id = jobs.enqueue(conn, 'test_unique')
+    with pytest.raises(jobs.JobError):
+        jobs.enqueue(conn, 'test_unique')
+    release.set()
+    assert wait(conn, job_id)['status'] == 'done'
+    assert wait(conn, jobs.enqueue(conn, 'test_unique'))['status'] == 'done'
+
+
+def test_jobs_without_a_heartbeat_are_marked_interrupted(conn, handlers):
+    stale = conn.execute("""
+        INSERT INTO jobs (kind, status, updated_date) VALUES ('test_ok', 'running', datetime('now', '-1 hour'))
+    """).lastrowid
+    conn.commit()
+    handlers('test_ok', lambda job: None)
+
+    wait(conn, jobs.enqueue(conn, 'test_ok'))
+
+    assert jobs.get(conn, stale)['status'] == 'interrupted'
+
+
+def test_unknown_kind_is_refused(conn):
+    with pytest.raises(jobs.JobError):
+        jobs.enqueue(conn, 'no_such_job')
@@ -0,0 +1,78 @@
+import pytest
+
+import pagination
+from conftest import add_laptops
+
+FROM_WHERE = "FROM laptops l WHERE l.sold = 0"
+
+
+def walk(conn, sort_expr, order, page_size, after=None, nullable=True):
+    """Follow next cursors from the first page (or from `after`); returns the ids in page order"""
+    ids = []
+    while True:
+        rows, next_cursor, _ = pagination.keyset_page(conn, "l.*", FROM_WHERE, [], sort_expr, "l.id", order,
+                                                      after=after, page_size=page_size, nullable=nullable)
+        ids += [row['id'] for row in rows]
+        if next_cursor is None:
+            return ids
+        after = next_cursor
+
+
+def walk_back(conn, sort_expr, order, page_size, last_cursor):
+    ids, before = [], last_cursor
+    while before:
+        rows, _, prev_cursor = pagination.keyset_page(conn, "l.*", FROM_WHERE, [], sort_expr, "l.id", order,
+                                                      before=before, page_size=page_size)
+        ids = [row['id'] for row in rows] + ids
+        before = prev_cursor
+    return ids
+
+
+@pytest.fixture
+def stock(conn):
+    """23 unsold laptops with repeated and missing prices, plus sold ones that must not show"""
+    for i in range(23):
+        add_laptops(conn, 1, start=i, price_to_sell=None if i % 5 == 0 else [300, 200, 200, 100][i % 4],
+                    cpu='i7' if i % 3 else None)
+    add_laptops(conn, 4, start=100, sold=1)
+    return conn
+
+
+@pytest.mark.parametrize('sort_expr', ['l.price_to_sell', 'l.cpu', 'l.id'])
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+@pytest.mark.parametrize('page_size', [1, 4, 7, 50])
+def test_pages_cover_every_row_once_in_order(stock, sort_expr, order, page_size):
+    direction = order.upper()
+    expected = [row[0] for row in stock.execute(
+        f"SELECT l.id {FROM_WHERE} ORDER BY IFNULL({sort_expr}, '') {direction}, l.id {direction}")]
+
+    ids = walk(stock, sort_expr, order, page_size)
+
+    assert len(expected) == 23
+    assert ids == expected
+
+
+def test_previous_cursors_lead_back_to_the_first_page(stock):
+    rows, next_cursor, prev_cursor = pagination.keyset_page(stock, "l.*", FROM_WHERE, [], "l.price_to_sell",
+                                                            "l.id", page_size=5)
+    assert prev_cursor is None
+    forward = [row['id'] for row in rows]
+    while next_cursor:
+        rows, next_cursor, last_prev = pagination.keyset_page(stock, "l.*", FROM_WHERE, [], "l.price_to_sell",
+                                                              "l.id", after=next_cursor, page_size=5)
+        forward += [row['id'] for row in rows]
+
+    back = walk_back(stock, "l.price_to_sell", 'asc', 5, last_prev)
+
+    assert back + [row['id'] for row in rows] == forward
+
+
+def test_rows_added_while_paging_do_not_repeat_earlier_rows(stock):
+    first, next_cursor, _ = pagination.keyset_page(stock, "l.*", FROM_WHERE, [], "l.id", "l.id", page_size=10,
+                                                   nullable=False)
+    add_laptops(stock, 3, start=200)
+    rest = walk(stock, "l.id", 'asc', 10, after=next_cursor, nullable=False)
+
+    seen = [row['id'] for row in first] + rest
+    assert len(seen) == len(set(seen)) == 26
+
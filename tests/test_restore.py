@@ -0,0 +1,85 @@
+import os
+import sqlite3
+
+import backups
+import migrations
+import restore
+
+# What the app created before it had migrations: no schema_version, images as BLOBs
+BASELINE_SCHEMA = """
+    CREATE TABLE laptops (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, laptop_name TEXT, cpu TEXT, ram TEXT, storage TEXT, os TEXT,
+        notes TEXT, price_bought REAL, price_to_sell REAL, fees REAL, image TEXT, image_data BLOB,
+        image_mimetype TEXT, created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_edited TIMESTAMP DEFAULT CURRENT_TIMESTAMP, date_sold TEXT, sold INTEGER DEFAULT 0,
+        serial_number TEXT UNIQUE, warranty_start_date TEXT, warranty_duration_days INTEGER DEFAULT 0,
+        warranty_notes TEXT, price REAL DEFAULT 0, ram_type TEXT, ram_speed TEXT, storage_type TEXT
+    );
+    CREATE TABLE spareparts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, part_type TEXT, storage_type TEXT, ram_type TEXT, ram_speed TEXT,
+        capacity TEXT, notes TEXT, quantity INTEGER DEFAULT 1, created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_edited TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE laptop_spareparts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, laptop_id INTEGER, sparepart_id INTEGER,
+        installed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, price_at_time REAL DEFAULT 0
+    );
+    CREATE TABLE laptop_images (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, laptop_id INTEGER, image_data BLOB, image_mimetype TEXT,
+        image_name TEXT, is_primary INTEGER DEFAULT 0, uploaded_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL,
+        role TEXT NOT NULL DEFAULT 'guest', created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, guest_name TEXT, guest_email TEXT, guest_phone TEXT,
+        status TEXT DEFAULT 'unconfirmed', total_amount REAL DEFAULT 0,
+        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, confirmed_date TIMESTAMP, completed_date TIMESTAMP,
+        notes TEXT
+    );
+    CREATE TABLE order_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, order_id INTEGER, laptop_id INTEGER, quantity INTEGER DEFAULT 1,
+        price REAL
+    );
+    CREATE TABLE cart_spareparts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, laptop_id INTEGER NOT NULL,
+        sparepart_id INTEGER NOT NULL, quantity INTEGER DEFAULT 1, added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE cart (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, laptop_id INTEGER NOT NULL,
+        quantity INTEGER DEFAULT 1, added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    INSERT INTO users (username, password, role) VALUES ('admin', 'admin123', 'admin');
+    INSERT INTO laptops (laptop_name, price_bought, price_to_sell, fees, sold, serial_number)
+        VALUES ('Dell Latitude 7490', 150, 320, 10, 0, 'DE012401'), ('HP EliteBook 840', 120, 280, 8, 1, 'HP012401');
+"""
+
+
+def test_legacy_backup_from_before_migrations_is_migrated_and_restored(tmp_path):
+    legacy = tmp_path / 'legacy.db'
+    conn = sqlite3.connect(legacy)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.close()
+    client = backups.FolderDriveClient(str(tmp_path / 'drive'))
+    client.upload(str(legacy), backups.LEGACY_BACKUP_NAME, 'application/x-sqlite3')
+
+    live_path = tmp_path / 'live.db'
+    live = sqlite3.connect(live_path)
+    live.row_factory = sqlite3.Row
+    migrations.migrate(live)
+    live.execute("INSERT INTO jobs (kind) VALUES ('drive_restore')")
+    live.commit()
+    live.close()
+
+    summary = restore.restore_from_drive(client, db_path=str(live_path))
+
+    assert summary['schema_version'] == 0 and summary['migrated']
+    restored = sqlite3.connect(live_path)
+    assert migrations.current_version(restored) == migrations.LATEST_VERSION
+    assert [row[0] for row in restored.execute("SELECT serial_number FROM laptops ORDER BY id")] == \
+        ['DE012401', 'HP012401']
+    assert restored.execute("SELECT kind FROM jobs").fetchall() == [('drive_restore',)]  # live history kept
+    assert restored.execute("SELECT available_count, sold_count FROM inventory_stats").fetchone() == (1, 1)
+    restored.close()
+    assert not os.listdir(backups.BACKUP_DIR)
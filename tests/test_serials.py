@@ -0,0 +1,50 @@
+import threading
+
+import db
+from serials import allocate_serial_block, date_prefix_for, generate_serial_numbers
+
+
+def test_serials_number_each_brand_on_from_its_counter(conn):
+    dell = date_prefix_for('Dell Latitude')
+    hp = date_prefix_for('HP EliteBook')
+    conn.execute("INSERT INTO serial_counters (date_prefix, last_number) VALUES (?, 7)", (dell,))
+
+    serials = generate_serial_numbers(['Dell Latitude', 'HP EliteBook', 'Dell XPS', 'HP ProBook'], conn)
+    conn.commit()
+
+    assert serials == [f"{dell}08", f"{hp}01", f"{dell}09", f"{hp}02"]
+
+
+def test_rollback_hands_the_numbers_back(conn):
+    prefix = date_prefix_for('Lenovo')
+    assert allocate_serial_block(conn, prefix, 5) == 1
+    conn.rollback()
+    assert allocate_serial_block(conn, prefix, 2) == 1
+
+
+def test_concurrent_allocations_never_overlap(conn):
+    prefix = date_prefix_for('Asus')
+    blocks = []
+    errors = []
+
+    def allocate():
+        worker_conn = db.pool.connect()
+        try:
+            for _ in range(20):
+                first = allocate_serial_block(worker_conn, prefix, 3)
+                worker_conn.commit()
+                blocks.append(first)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            worker_conn.close()
+
+    threads = [threading.Thread(target=allocate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    numbers = sorted(first + i for first in blocks for i in range(3))
+    assert numbers == list(range(1, 4 * 20 * 3 + 1))
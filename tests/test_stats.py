@@ -0,0 +1,35 @@
+import stats
+from conftest import add_laptops
+
+
+def recount(conn):
+    row = conn.execute(stats.STATS_SQL).fetchone()
+    return {counter: row[counter] for counter in stats.COUNTERS}
+
+
+def test_triggers_match_a_recount_after_every_kind_of_change(conn):
+    ids = add_laptops(conn, 6)
+    add_laptops(conn, 2, start=6, sold=1, price_to_sell=None)  # sold with no price yet
+    assert stats.check_stats(conn) == {}
+
+    conn.execute("UPDATE laptops SET sold = 1 WHERE id IN (?, ?)", ids[:2])
+    conn.execute("UPDATE laptops SET price_to_sell = 999.99, fees = NULL WHERE id = ?", (ids[0],))
+    conn.execute("UPDATE laptops SET price_bought = 50 WHERE id = ?", (ids[2],))
+    conn.execute("UPDATE laptops SET notes = 'scratched lid' WHERE id = ?", (ids[3],))
+    conn.commit()
+    assert stats.check_stats(conn) == {}
+
+    conn.execute("UPDATE laptops SET sold = 0 WHERE id = ?", (ids[1],))
+    conn.execute("DELETE FROM laptops WHERE id IN (?, ?)", (ids[0], ids[4]))
+    conn.commit()
+    assert stats.check_stats(conn) == {}
+    assert stats.get_stats(conn)['total_laptops'] == 6
+
+
+def test_rolled_back_changes_leave_the_counters_alone(conn):
+    ids = add_laptops(conn, 3)
+    before = stats.get_stats(conn)
+    conn.execute("UPDATE laptops SET sold = 1 WHERE id = ?", (ids[0],))
+    conn.execute("DELETE FROM laptops WHERE id = ?", (ids[1],))
+    conn.rollback()
+    assert stats.get_stats(conn) == before == recount(conn)